@@ -0,0 +1,139 @@
+# un surtidor que inunda al distribuidor: latencia de los surtidores normales con y sin control de admisión
+# Uso: python -m benchmarks.bench_admission [surtidores_normales] [segundos]
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.framer import frame_message, receive_message, send_frame
+from common.messages import serialize, deserialize, TransaccionReportMessage, SlowDownMessage
+from common.profiling import LatencyHistogram
+from distribuidor.server_distrib import DistribuidorServer
+# --- FIN: Hack para importar 'common' ---
+
+# Ritmo de un surtidor normal (reportes por segundo)
+NORMAL_TPS = 2
+
+class InlineAdmission:
+    """Comportamiento anterior: cada hilo lector guarda y reenvía apenas recibe."""
+    def __init__(self, handler):
+        self.handler = handler
+
+    def start(self):
+        pass
+
+    def put(self, key, item) -> int:
+        self.handler(key, item)
+        return 0
+
+    def discard(self, key):
+        pass
+
+class BenchDistribuidor(DistribuidorServer):
+    """Anota cuándo se procesa cada reporte (el N° de secuencia viaja en 'litros')."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent_at = {}
+        self.histogram = LatencyHistogram("normales")
+        self.processed = {}
+
+    def _process_transaction(self, lane, entry):
+        super()._process_transaction(lane, entry)
+        msg_obj, _ = entry
+        surtidor_id = msg_obj.surtidor_id
+        self.processed[surtidor_id] = self.processed.get(surtidor_id, 0) + 1
+        sent = self.sent_at.pop((surtidor_id, msg_obj.litros), None)
+        if sent is not None:
+            self.histogram.record(time.perf_counter() - sent)
+
+def _listen(sock, slow_downs):
+    try:
+        while True:
+            msg_bytes = receive_message(sock)
+            if msg_bytes is None:
+                return
+            if isinstance(deserialize(msg_bytes), SlowDownMessage):
+                slow_downs.append(1)
+    except OSError:
+        pass
+
+def connect(port, slow_downs):
+    sock = socket.create_connection(("127.0.0.1", port))
+    threading.Thread(target=_listen, args=(sock, slow_downs), daemon=True).start()
+    return sock
+
+def flood(port, stop, slow_downs):
+    """Surtidor que reporta lo más rápido posible e ignora los SLOW_DOWN."""
+    sock = connect(port, slow_downs)
+    seq = 0
+    try:
+        while not stop.is_set():
+            seq += 1
+            send_frame(sock, frame_message(serialize(TransaccionReportMessage("S-inunda", "95", float(seq), 1))))
+    except OSError:
+        pass
+    sock.close()
+
+def normal_pump(server, port, surtidor_id, stop):
+    sock = connect(port, [])
+    period = 1 / NORMAL_TPS
+    next_send = time.perf_counter()
+    seq = 0
+    while not stop.is_set():
+        seq += 1
+        server.sent_at[(surtidor_id, float(seq))] = time.perf_counter()
+        send_frame(sock, frame_message(serialize(TransaccionReportMessage(surtidor_id, "93", float(seq), 1))))
+        next_send += period
+        time.sleep(max(0.0, next_send - time.perf_counter()))
+    sock.close()
+
+def run(name, num_normal, duration, inline, flooding=True):
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    os.makedirs("distribuidor")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server = BenchDistribuidor(f"Bench-{name}", "127.0.0.1", port)
+        if inline:
+            server.admission = InlineAdmission(server._process_transaction)
+        threading.Thread(target=server.run_server_for_surtidores, daemon=True).start()
+        server.admission.start()
+        time.sleep(0.2)
+
+        stop = threading.Event()
+        slow_downs = []
+        threads = [
+            threading.Thread(target=normal_pump, args=(server, port, f"S-{i + 1}", stop), daemon=True)
+            for i in range(num_normal)
+        ]
+        if flooding:
+            threads.append(threading.Thread(target=flood, args=(port, stop, slow_downs), daemon=True))
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        time.sleep(0.5)
+
+    flooded = server.processed.get("S-inunda", 0)
+    print(f"--- {name} ---")
+    print(f"  {server.histogram.summary()}")
+    print(f"  reportes del que inunda procesados: {flooded} ({flooded / duration:.0f}/s), "
+          f"SLOW_DOWN recibidos: {len(slow_downs)}")
+
+if __name__ == "__main__":
+    num_normal = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    run("sin inundación", num_normal, duration, inline=False, flooding=False)
+    run("inundación, sin control", num_normal, duration, inline=True)
+    run("inundación, con control", num_normal, duration, inline=False)
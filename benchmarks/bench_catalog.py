@@ -0,0 +1,56 @@
+# tormenta de reconexiones: delta del catálogo de precios por distribuidor vs reenvío manual de todos los precios
+# Uso: python -m benchmarks.bench_catalog [distribuidores] [precios_perdidos]
+import os
+import sys
+import tempfile
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.framer import frame_message
+from common.messages import serialize, PrecioUpdateMessage, CatalogoPreciosMessage
+from matriz.price_catalog import PriceCatalog
+from matriz.server_matriz import COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+# Grupos de estación con precio propio para dos combustibles
+GRUPOS = 10
+
+def fill_catalog(catalog):
+    for precio, combustible in enumerate(COMBUSTIBLES, start=1000):
+        catalog.add(combustible, precio)
+    for grupo in range(GRUPOS):
+        for combustible in COMBUSTIBLES[:2]:
+            catalog.add(combustible, 990, f"E-{grupo}")
+
+if __name__ == "__main__":
+    num_distribuidores = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    missed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    catalog = PriceCatalog(os.path.join(tempfile.mkdtemp(), "catalogo.sqlite"))
+    fill_catalog(catalog)
+    current, entries = catalog.since(0)
+    known = current - missed # Versión con la que reconecta cada distribuidor
+
+    # Antes: el operador reenvía a mano cada precio, que llega a todos los distribuidores
+    full_frames = [
+        frame_message(serialize(PrecioUpdateMessage(comb, precio, grupo=grupo)))
+        for _, comb, precio, grupo, _ in entries
+    ]
+    full_bytes = sum(len(frame) for frame in full_frames) * num_distribuidores
+
+    # Después: cada distribuidor que reconecta recibe un frame con lo que le falta
+    start = time.perf_counter()
+    delta_bytes = 0
+    for _ in range(num_distribuidores):
+        version, delta = catalog.since(known)
+        delta_bytes += len(frame_message(serialize(CatalogoPreciosMessage(version, delta))))
+    elapsed = time.perf_counter() - start
+
+    print(f"{num_distribuidores} distribuidores reconectan habiendo perdido {missed} de "
+          f"{len(entries)} precios del catálogo (v{current})")
+    print(f"  reenvío manual de todo: {len(full_frames) * num_distribuidores} frames, {full_bytes / 1024:.1f} KB")
+    print(f"  delta desde su versión: {num_distribuidores} frames, {delta_bytes / 1024:.1f} KB, "
+          f"{elapsed / num_distribuidores * 1e6:.0f} us de Matriz por distribuidor")
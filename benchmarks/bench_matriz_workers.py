@@ -0,0 +1,76 @@
+# benchmark de ingesta de la Matriz con 1, 2, 4 y 8 procesos worker
+# Uso: python -m benchmarks.bench_matriz_workers [transacciones_por_cliente] [clientes]
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.framer import frame_message
+from common.messages import serialize, TransaccionReportMessage, HeartbeatMessage
+from matriz.cluster import MatrizCluster
+# --- FIN: Hack para importar 'common' ---
+
+WORKER_COUNTS = [1, 2, 4, 8]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def run_client(port, client_id, num_tx):
+    """Simula un distribuidor que envía 'num_tx' transacciones lo más rápido posible."""
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(frame_message(serialize(HeartbeatMessage(client_id, "online"))))
+    frame = frame_message(serialize(TransaccionReportMessage("S-1.1", "95", 10.0, 1, client_id)))
+    for _ in range(num_tx):
+        sock.sendall(frame)
+    time.sleep(1) # Deja que el servidor lea todo antes de cerrar
+    sock.close()
+
+def _count_rows(cluster) -> int:
+    """Transacciones persistidas (cada una es de 1 carga), con cualquier almacenamiento."""
+    report_comb, _ = cluster.fetch_reports()
+    return sum(cargas for _, _, cargas in report_comb)
+
+def bench(num_workers, num_clients, tx_per_client) -> float:
+    """Retorna transacciones por segundo persistidas en la BD."""
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("matriz")
+    port = _free_port()
+    cluster = MatrizCluster("127.0.0.1", port, lambda message: None, num_workers)
+    threading.Thread(target=cluster.start, daemon=True).start()
+    time.sleep(2 + 0.5 * num_workers) # Arranque de los procesos (spawn)
+
+    total = num_clients * tx_per_client
+    start = time.perf_counter()
+    clients = [
+        multiprocessing.Process(target=run_client, args=(port, f"Dist-{i}", tx_per_client))
+        for i in range(num_clients)
+    ]
+    for client in clients:
+        client.start()
+    while _count_rows(cluster) < total:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        client.join()
+    for process in cluster.processes:
+        process.terminate()
+    return total / elapsed
+
+if __name__ == "__main__":
+    tx_per_client = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    num_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    print(f"CPUs: {os.cpu_count()} | {num_clients} clientes x {tx_per_client} transacciones")
+    for num_workers in WORKER_COUNTS:
+        rate = bench(num_workers, num_clients, tx_per_client)
+        print(f"{num_workers} workers: {rate:10.0f} tx/s")
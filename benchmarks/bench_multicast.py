@@ -0,0 +1,111 @@
+# CPU del distribuidor por precio transmitido: TCP a cada surtidor vs un datagrama multicast
+# Uso: MULTICAST_INTERFAZ=127.0.0.1 python -m benchmarks.bench_multicast [surtidores] [precios]
+import contextlib
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import tempfile
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import distribuidor.server_distrib as server_distrib
+from distribuidor.server_distrib import DistribuidorServer
+from common.framer import receive_message
+from common.multicast import MulticastReceiver
+from surtidor.client_surtidor import COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+GRUPO_MULTICAST = "239.255.10.99"
+TIMEOUT = 30
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def run_pumps(mode, num_pumps, port, address, sender, expected, results):
+    """
+    Proceso aparte con los surtidores (así no cuentan en la CPU del
+    distribuidor): cuenta los precios recibidos y los huecos detectados.
+    """
+    conns = [socket.create_connection(("127.0.0.1", port)) for _ in range(num_pumps)]
+    received = 0
+    gaps = 0
+    if mode == "tcp":
+        selector = selectors.DefaultSelector()
+        for sock in conns:
+            selector.register(sock, selectors.EVENT_READ)
+        deadline = time.monotonic() + TIMEOUT
+        while received < expected and time.monotonic() < deadline:
+            for key, _ in selector.select(timeout=1):
+                receive_message(key.fileobj)
+                received += 1
+    else:
+        counts = {"received": 0, "gaps": 0}
+        def on_message(msg_bytes):
+            counts["received"] += 1
+        def on_gap(first, last):
+            counts["gaps"] += last - first + 1
+        receivers = [MulticastReceiver(address, on_message, on_gap) for _ in range(num_pumps)]
+        for receiver in receivers:
+            receiver.accept(*sender, 0)
+            receiver.start()
+        results.put("ready")
+        deadline = time.monotonic() + TIMEOUT
+        while counts["received"] + counts["gaps"] < expected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        received, gaps = counts["received"], counts["gaps"]
+    results.put((received, gaps))
+
+def run(mode, num_pumps, num_prices) -> tuple:
+    """Retorna (us de CPU del distribuidor por precio, precios recibidos, huecos)."""
+    port = free_port()
+    address = f"{GRUPO_MULTICAST}:{free_port()}"
+    server_distrib.MULTICAST_PRECIOS = address if mode == "multicast" else ""
+    server = DistribuidorServer(f"Dist-{mode}", "127.0.0.1", port)
+    sender = (server.id, server.multicast.epoch) if server.multicast else None
+
+    listener = socket.create_server(("127.0.0.1", port), backlog=num_pumps)
+    expected = num_pumps * num_prices
+    results = multiprocessing.Queue()
+    pumps = multiprocessing.Process(
+        target=run_pumps, args=(mode, num_pumps, port, address, sender, expected, results)
+    )
+    pumps.start()
+    for i in range(num_pumps):
+        sock, _ = listener.accept()
+        server.surtidores.add_connection(sock)
+        server.surtidores.register(f"S-{i}", sock)
+        if server.multicast:
+            server.surtidores.set_multicast(sock, True)
+    if server.multicast:
+        results.get(timeout=TIMEOUT) # Receptores unidos al grupo
+
+    start = time.process_time()
+    for i in range(num_prices):
+        server.broadcast_price_to_surtidores(COMBUSTIBLES[i % len(COMBUSTIBLES)], 1000 + i)
+        time.sleep(0.002) # Los precios llegan de a poco, no en ráfaga
+    received, gaps = results.get(timeout=TIMEOUT)
+    cpu = time.process_time() - start
+    pumps.join()
+    listener.close()
+    return cpu / num_prices * 1e6, received, gaps
+
+if __name__ == "__main__":
+    num_pumps = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    num_prices = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("distribuidor")
+
+    print(f"{num_prices} precios transmitidos a {num_pumps} surtidores:")
+    for mode in ("tcp", "multicast"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            cpu_us, received, gaps = run(mode, num_pumps, num_prices)
+        print(f"  {mode:9}: {cpu_us:7.0f} us de CPU del distribuidor por precio, "
+              f"{received} de {num_pumps * num_prices} recibidos ({gaps} perdidos, a reparar por NACK)")
@@ -0,0 +1,85 @@
+# prueba de estrés del tablero de precios compartido: un escritor, varios lectores
+# Uso: python -m benchmarks.bench_price_board [segundos] [lectores]
+import multiprocessing
+import os
+import sys
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.price_board import PriceBoard, COMBUSTIBLES, _SEQ, _DATA
+# --- FIN: Hack para importar 'common' ---
+
+def run_writer(name, duration, result_queue):
+    """Publica todos los combustibles con el mismo valor n en cada actualización."""
+    board = PriceBoard.attach(name, child_of_creator=True)
+    deadline = time.perf_counter() + duration
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        board.publish({combustible: n for combustible in COMBUSTIBLES})
+    result_queue.put(("escritor", n))
+
+def run_reader(name, duration, raw, result_queue):
+    """
+    Lee el tablero y verifica que todos los precios sean iguales (una lectura
+    "rota" mezclaría valores de dos actualizaciones). Con raw=True lee sin el
+    seqlock, como control de que la prueba puede detectar lecturas rotas.
+    """
+    board = PriceBoard.attach(name, child_of_creator=True)
+    deadline = time.perf_counter() + duration
+    reads = torn = 0
+    last_version = 0
+    while time.perf_counter() < deadline:
+        if raw:
+            version, *values = _DATA.unpack_from(board.buf, _SEQ.size)
+        else:
+            version, values = board.read()
+            if version < last_version:
+                torn += 1 # La versión nunca debe retroceder
+            last_version = version
+        if min(values) != max(values):
+            torn += 1
+        reads += 1
+    result_queue.put(("lector-raw" if raw else "lector", reads, torn))
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    num_readers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    context = multiprocessing.get_context("spawn")
+    name = f"tablero_bench_{os.getpid()}"
+    board = PriceBoard.create(name)
+    board.publish({combustible: 0 for combustible in COMBUSTIBLES})
+    result_queue = context.Queue()
+
+    processes = [context.Process(target=run_writer, args=(name, duration, result_queue))]
+    processes += [
+        context.Process(target=run_reader, args=(name, duration, False, result_queue))
+        for _ in range(num_readers)
+    ]
+    processes.append(context.Process(target=run_reader, args=(name, duration, True, result_queue)))
+    for process in processes:
+        process.start()
+    results = [result_queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    board.close()
+
+    print(f"CPUs: {os.cpu_count()} | {duration}s | 1 escritor, {num_readers} lectores + 1 lector sin seqlock")
+    torn_total = 0
+    for result in sorted(results):
+        if result[0] == "escritor":
+            print(f"escritor:   {result[1]:10d} actualizaciones ({result[1] / duration:.0f}/s)")
+        else:
+            kind, reads, torn = result
+            print(f"{kind:11s} {reads:10d} lecturas ({reads / duration:.0f}/s, "
+                  f"{duration / max(reads, 1) * 1e6:.2f} µs c/u), {torn} rotas")
+            if kind == "lector":
+                torn_total += torn
+    if torn_total:
+        print(f"❌ {torn_total} lecturas rotas con seqlock.")
+        sys.exit(1)
+    print("✅ Ninguna lectura rota con seqlock.")
@@ -0,0 +1,125 @@
+# benchmark: latencia de aplicar un precio mientras otro hilo envía por un uplink lento
+# Uso: python -m benchmarks.bench_price_contention [segundos_por_escenario]
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.messages import PrecioLocalUpdateMessage
+from common.prices import PriceSnapshot
+import surtidor.client_surtidor as client_surtidor
+import distribuidor.server_distrib as server_distrib
+# --- FIN: Hack para importar 'common' ---
+
+# Pausa del lector entre lecturas de 256 bytes (None = sin límite)
+UPLINK_DELAYS = [None, 0.01, 0.05]
+APPLY_INTERVAL = 0.001
+
+def slow_link(read_delay):
+    """
+    Par de sockets TCP por loopback con buffers mínimos. El extremo remoto
+    lee 256 bytes cada 'read_delay' segundos, así que los sendall() del
+    extremo local se bloquean como en un enlace lento.
+    """
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        local = socket.socket()
+        local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        local.connect(listener.getsockname())
+        remote, _ = listener.accept()
+    remote.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+
+    def drain():
+        try:
+            while remote.recv(256):
+                if read_delay:
+                    time.sleep(read_delay)
+        except OSError:
+            pass
+    threading.Thread(target=drain, daemon=True).start()
+    return local, remote
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def measure(apply_price, duration) -> list:
+    """Llama a apply_price(n) cada APPLY_INTERVAL y retorna la duración de cada llamada."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        start = time.perf_counter()
+        apply_price(n)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(APPLY_INTERVAL)
+    return latencies
+
+def bench_surtidor(read_delay, duration) -> list:
+    """Ventas seguidas (cada una reporta por el uplink lento) vs. precios entrantes."""
+    client_surtidor.DURACION_CARGA = (0, 0)
+    client = client_surtidor.SurtidorClient("S-bench", 0)
+    client.local_prices = PriceSnapshot({comb: 1000 for comb in client_surtidor.COMBUSTIBLES})
+    local, remote = slow_link(read_delay)
+    client.socket_to_distrib = local
+    client.is_connected.set()
+
+    stop = threading.Event()
+    def sell():
+        while not stop.is_set():
+            client.simulate_sale()
+    threading.Thread(target=sell, daemon=True).start()
+
+    latencies = measure(
+        lambda n: client.handle_price_update(PrecioLocalUpdateMessage("95", 1000 + n)), duration
+    )
+    stop.set()
+    local.close()
+    remote.close()
+    return latencies
+
+def bench_distribuidor(read_delay, duration) -> list:
+    """Surtidores lentos recibiendo el caché de precios vs. precios llegando de la Matriz."""
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("distribuidor")
+    server = server_distrib.DistribuidorServer("Dist-bench", "127.0.0.1", 0)
+    server.current_prices = PriceSnapshot({comb: 1150 for comb in client_surtidor.COMBUSTIBLES})
+    local, remote = slow_link(read_delay)
+
+    stop = threading.Event()
+    def resend_cache():
+        while not stop.is_set():
+            server.send_current_prices_to_surtidor(local)
+    threading.Thread(target=resend_cache, daemon=True).start()
+
+    def apply_price(n):
+        # Mismo camino que listen_to_matriz al recibir un PrecioUpdateMessage
+        with server.lock_prices:
+            server.current_prices = server.current_prices.with_price("95", 1150 + n)
+    latencies = measure(apply_price, duration)
+    stop.set()
+    local.close()
+    remote.close()
+    return latencies
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    for name, bench in (("surtidor", bench_surtidor), ("distribuidor", bench_distribuidor)):
+        for read_delay in UPLINK_DELAYS:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                latencies = bench(read_delay, duration)
+            uplink = "sin límite" if read_delay is None else f"256B/{read_delay * 1000:.0f}ms"
+            print(f"{name:13s} uplink {uplink:12s}: n={len(latencies):5d} "
+                  f"p50={_percentile(latencies, 50) * 1000:.3f}ms "
+                  f"p99={_percentile(latencies, 99) * 1000:.3f}ms "
+                  f"max={max(latencies) * 1000:.3f}ms")
@@ -0,0 +1,102 @@
+# cambio de todos los precios de la red: un broadcast por combustible vs una hoja de precios con hora de vigencia
+# Uso: python -m benchmarks.bench_price_sheet [surtidores]
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import distribuidor.server_distrib as server_distrib
+from distribuidor.server_distrib import DistribuidorServer
+from matriz.server_matriz import MatrizServer
+from surtidor.client_surtidor import SurtidorClient, COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+# Segundos hasta la vigencia de la hoja (alcanza para que llegue a todos)
+VIGENCIA = 1.0
+
+class TimedSurtidor(SurtidorClient):
+    """Anota cuándo cambia cada precio de su tabla."""
+    def __init__(self, id, distrib_port):
+        super().__init__(id, distrib_port)
+        self.changes = [] # (time.perf_counter(), combustibles que cambiaron)
+
+    def _apply_price_update(self, msg, held=False):
+        self.changes.append((time.perf_counter(), [msg.combustible]))
+        return super()._apply_price_update(msg, held)
+
+    def apply_price_sheet(self, msg):
+        self.changes.append((time.perf_counter(), list(msg.precios)))
+        super().apply_price_sheet(msg)
+
+class CountingMatriz(MatrizServer):
+    """Cuenta los frames que salen hacia los distribuidores."""
+    frames = 0
+
+    def _send_to_all(self, framed_msg, coalesce=False) -> int:
+        self.frames += 1
+        return super()._send_to_all(framed_msg, coalesce)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+
+def reprice(matriz, pumps, base, use_sheet) -> tuple:
+    """Cambia todos los combustibles. Retorna (frames de la Matriz, ms con la tabla a medias, ms entre surtidores)."""
+    for pump in pumps:
+        pump.changes.clear()
+    frames_before = matriz.frames
+    precios = {comb: base + i for i, comb in enumerate(COMBUSTIBLES)}
+    if use_sheet:
+        matriz.broadcast_price_sheet(precios, int((time.time() + VIGENCIA) * 1000))
+    else:
+        for comb, precio in precios.items():
+            matriz.broadcast_price(comb, precio)
+    done = lambda pump: sum(len(fuels) for _, fuels in pump.changes) >= len(COMBUSTIBLES)
+    wait_for(lambda: all(done(pump) for pump in pumps), VIGENCIA + 10)
+
+    # Tabla a medias: entre el primer y el último combustible cambiado en un mismo surtidor
+    mixed = max(pump.changes[-1][0] - pump.changes[0][0] for pump in pumps)
+    # Entre el primer surtidor que terminó de cambiar y el último
+    finished = [pump.changes[-1][0] for pump in pumps]
+    return matriz.frames - frames_before, mixed * 1000, (max(finished) - min(finished)) * 1000
+
+if __name__ == "__main__":
+    num_pumps = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("matriz")
+    os.makedirs("distribuidor")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        matriz_port = free_port()
+        matriz = CountingMatriz("127.0.0.1", matriz_port, None)
+        threading.Thread(target=matriz.start, daemon=True).start()
+        server_distrib.MATRIZ_PORT = matriz_port
+        distrib = DistribuidorServer("Dist-1", "127.0.0.1", free_port())
+        distrib.start()
+        wait_for(distrib.is_connected_to_matriz.is_set)
+        pumps = [TimedSurtidor(f"S-1.{i}", distrib.port) for i in range(num_pumps)]
+        for pump in pumps:
+            threading.Thread(target=pump.run_client_connection, daemon=True).start()
+        wait_for(lambda: len(distrib.surtidores.pumps) == num_pumps)
+
+        before = reprice(matriz, pumps, 1000, use_sheet=False)
+        after = reprice(matriz, pumps, 2000, use_sheet=True)
+
+    print(f"Cambio de los {len(COMBUSTIBLES)} combustibles en {num_pumps} surtidores:")
+    for name, (frames, mixed_ms, spread_ms) in (("un precio a la vez", before), ("hoja de precios", after)):
+        print(f"  {name:18}: {frames} broadcasts de la Matriz, tabla a medias hasta {mixed_ms:6.1f} ms, "
+              f"{spread_ms:6.1f} ms entre el primer y el último surtidor")
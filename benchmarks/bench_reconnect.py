@@ -0,0 +1,54 @@
+# reconexiones tras reiniciar la Matriz: espera fija vs ReconnectPolicy (simulado)
+# Uso: python -m benchmarks.bench_reconnect [clientes] [segundos_caida]
+import os
+import random
+import sys
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.reconnect import ReconnectPolicy
+# --- FIN: Hack para importar 'common' ---
+
+# Lo de antes: esperar siempre lo mismo entre intentos
+RECONNECT_DELAY_FIJO = 5.0
+# Ancho (segundos) de cada bucket del histograma de llegadas
+BUCKET = 0.1
+
+class FixedDelay:
+    def next_delay(self) -> float:
+        return RECONNECT_DELAY_FIJO
+
+def reconnect_time(policy, outage) -> float:
+    """
+    Hora en que un cliente vuelve a conectar. Todos pierden la conexión en
+    t=0 (la Matriz se cae) y la Matriz vuelve en t='outage'; cada intento
+    antes de eso falla al instante y el cliente espera next_delay().
+    """
+    now = 0.0
+    while True:
+        now += policy.next_delay()
+        if now >= outage:
+            return now
+
+def run(name, make_policy, num_clients, outage):
+    times = [reconnect_time(make_policy(), outage) for _ in range(num_clients)]
+    buckets = {}
+    for t in times:
+        bucket = int(t / BUCKET)
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    peak = max(buckets.values())
+    last = max(times) - outage
+    print(f"{name:22s} {peak:17d} {len(buckets):9d} {last:20.1f}")
+    return peak
+
+if __name__ == "__main__":
+    num_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    outage = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    random.seed(42)
+    print(f"{num_clients} clientes, Matriz caída {outage:.0f} s, buckets de {BUCKET * 1000:.0f} ms")
+    print(f"{'':22s} {'máx. por bucket':>17s} {'buckets':>9s} {'último tras volver s':>20s}")
+    run(f"espera fija {RECONNECT_DELAY_FIJO:.0f} s", FixedDelay, num_clients, outage)
+    run("ReconnectPolicy", ReconnectPolicy, num_clients, outage)
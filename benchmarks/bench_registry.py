@@ -0,0 +1,81 @@
+# conexiones de surtidores del distribuidor: lista de sockets vs SurtidorRegistry
+# Uso: python -m benchmarks.bench_registry [surtidores]
+import os
+import random
+import sys
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from distribuidor.registry import SurtidorRegistry
+from surtidor.client_surtidor import COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+# Surtidores por estación (cada estación es un grupo)
+SURTIDORES_POR_ESTACION = 8
+
+class FakeSocket:
+    """Basta con que sea hashable y distinto por conexión."""
+
+class SocketList:
+    """Lo de antes: una lista de sockets bajo un lock, sin saber quién es quién."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sockets = []
+
+    def add_connection(self, sock):
+        with self.lock:
+            self.sockets.append(sock)
+
+    def remove_connection(self, sock):
+        with self.lock:
+            if sock in self.sockets:
+                self.sockets.remove(sock)
+
+    def register(self, *args, **kwargs):
+        pass
+
+    def targets(self, combustible=None, grupo=None):
+        with self.lock:
+            return list(self.sockets)
+
+def make_pumps(num_pumps) -> list:
+    """(id, socket, combustibles, grupo): cada surtidor vende 2 o 3 combustibles."""
+    return [
+        (f"S-{i // SURTIDORES_POR_ESTACION}.{i % SURTIDORES_POR_ESTACION}", FakeSocket(),
+         random.sample(COMBUSTIBLES, random.choice((2, 3))), f"E-{i // SURTIDORES_POR_ESTACION}")
+        for i in range(num_pumps)
+    ]
+
+def run(name, registry, pumps):
+    start = time.perf_counter()
+    for pump_id, sock, combustibles, grupo in pumps:
+        registry.add_connection(sock)
+        registry.register(pump_id, sock, None, combustibles, grupo)
+    connect_us = (time.perf_counter() - start) / len(pumps) * 1e6
+
+    price_sends = sum(len(registry.targets(comb)) for comb in COMBUSTIBLES) / len(COMBUSTIBLES)
+    group_sends = len(registry.targets("95", "E-0"))
+
+    # Se desconectan en orden aleatorio (con la lista, cada remove recorre la lista)
+    order = list(pumps)
+    random.shuffle(order)
+    start = time.perf_counter()
+    for _, sock, _, _ in order:
+        registry.remove_connection(sock)
+    disconnect_us = (time.perf_counter() - start) / len(pumps) * 1e6
+
+    print(f"{name:18s} {connect_us:10.2f} {disconnect_us:13.2f} {price_sends:15.0f} {group_sends:16d}")
+
+if __name__ == "__main__":
+    num_pumps = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    random.seed(42)
+    pumps = make_pumps(num_pumps)
+    print(f"{num_pumps} surtidores (2-3 combustibles cada uno, {SURTIDORES_POR_ESTACION} por grupo)")
+    print(f"{'':18s} {'conectar us':>10s} {'desconectar us':>13s} {'envíos/precio':>15s} {'envíos a grupo':>16s}")
+    run("lista (antes)", SocketList(), pumps)
+    run("registro", SurtidorRegistry(), pumps)
@@ -0,0 +1,91 @@
+# latencia de ingesta de la Matriz mientras se piden reportes: desde la BD vs desde la réplica
+# Uso: python -m benchmarks.bench_replica [filas_previas] [segundos]
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.messages import TransaccionReportMessage
+from common.profiling import LatencyHistogram
+from matriz.server_matriz import MatrizServer, COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+# Ritmo de la ingesta medida (transacciones por segundo, una por llamada)
+INGEST_TPS = 100
+# Reportes pedidos por segundo (si uno tarda más, el siguiente sale apenas termina)
+REPORTS_PER_S = 10
+
+def make_rows(num_rows) -> list:
+    now_ms = int(time.time() * 1000)
+    return [
+        (now_ms, f"Dist-{i % 20 + 1}", f"S-{i % 20 + 1}.{i % 8 + 1}",
+         random.choice(COMBUSTIBLES), round(random.uniform(5, 60), 2), 1)
+        for i in range(num_rows)
+    ]
+
+def run(name, server, reports, duration):
+    """Ingesta a INGEST_TPS con 'reports' (o nada) llamándose REPORTS_PER_S veces por segundo en otro hilo."""
+    histogram = LatencyHistogram(name)
+    stop = threading.Event()
+    counts = {"reportes": 0, "retraso_max": 0.0}
+
+    def report_loop():
+        next_report = time.perf_counter()
+        while not stop.is_set():
+            reports()
+            counts["reportes"] += 1
+            counts["retraso_max"] = max(counts["retraso_max"], server.replica.lag())
+            next_report += 1 / REPORTS_PER_S
+            time.sleep(max(0.0, next_report - time.perf_counter()))
+
+    if reports:
+        threading.Thread(target=report_loop, daemon=True).start()
+
+    msg = TransaccionReportMessage("S-1.1", "95", 36.57, 1, "Dist-1")
+    period = 1 / INGEST_TPS
+    start = time.perf_counter()
+    next_tx = start
+    while time.perf_counter() - start < duration:
+        tx_start = time.perf_counter()
+        server._save_transaction(msg)
+        histogram.record(time.perf_counter() - tx_start)
+        next_tx += period
+        time.sleep(max(0.0, next_tx - time.perf_counter()))
+    stop.set()
+    time.sleep(0.5) # Deja terminar el último reporte
+
+    print(f"--- {name} ---")
+    print(f"  ingesta: {histogram.summary().split(': ', 1)[1]}")
+    if reports:
+        print(f"  reportes completados: {counts['reportes']} "
+              f"({counts['reportes'] / duration:.1f}/s), retraso máximo de la réplica: "
+              f"{counts['retraso_max'] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    random.seed(42)
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("matriz")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server = MatrizServer("127.0.0.1", 0, None)
+        server._insert_rows(make_rows(num_rows), [])
+        server.replica.wait_applied()
+
+    print(f"BD con {num_rows} transacciones, ingesta de {INGEST_TPS} tx/s durante {duration:g} s")
+    run("sin reportes", server, None, duration)
+    run("reportes desde la BD (antes)", server, server.storage.fetch_reports, duration)
+    run("reportes desde la réplica", server, server.fetch_reports, duration)
+    server.replica.wait_applied()
+    replica_comb, _ = server.fetch_reports()
+    storage_comb, _ = server.storage.fetch_reports()
+    assert sum(c for _, _, c in replica_comb) == sum(c for _, _, c in storage_comb), "La réplica no cuadra con la BD"
@@ -0,0 +1,81 @@
+# tiempo hasta la primera venta posible tras reiniciar un Distribuidor con la Matriz caída
+# Uso: python -m benchmarks.bench_restart [segundos_max]
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+import distribuidor.server_distrib as server_distrib
+from distribuidor.server_distrib import DistribuidorServer
+from matriz.server_matriz import MatrizServer
+from surtidor.client_surtidor import SurtidorClient, COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+class MemoryOnlyDistribuidor(DistribuidorServer):
+    """El Distribuidor de antes: el caché de precios solo existe en memoria."""
+    def _load_price_cache(self):
+        pass
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(condition, timeout) -> float | None:
+    """Segundos hasta que 'condition()' se cumple (None si no se cumplió en 'timeout')."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if condition():
+            return time.perf_counter() - start
+        time.sleep(0.005)
+    return None
+
+def time_to_first_sale(server_class, timeout) -> float | None:
+    """Arranca el Distribuidor (la Matriz está caída) y mide hasta que un surtidor tiene precio."""
+    start = time.perf_counter()
+    port = free_port()
+    server = server_class("Dist-1", "127.0.0.1", port)
+    server.start()
+    pump = SurtidorClient("S-1.1", port)
+    threading.Thread(target=pump.run_client_connection, daemon=True).start()
+    if wait_for(lambda: len(pump.local_prices) > 0, timeout) is None:
+        return None
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    timeout = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("matriz")
+    os.makedirs("distribuidor")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # 1. Un Distribuidor recibe los precios de la Matriz y los guarda
+        matriz_port = free_port()
+        matriz = MatrizServer("127.0.0.1", matriz_port, None)
+        threading.Thread(target=matriz.start, daemon=True).start()
+        server_distrib.MATRIZ_PORT = matriz_port
+        first = DistribuidorServer("Dist-1", "127.0.0.1", free_port())
+        first.start()
+        wait_for(first.is_connected_to_matriz.is_set, timeout)
+        for precio, combustible in enumerate(COMBUSTIBLES, start=1000):
+            matriz.broadcast_price(combustible, precio)
+        wait_for(lambda: len(first.current_prices) == len(COMBUSTIBLES), timeout)
+
+        # 2. Se "reinicia" con la Matriz caída (nadie escucha en su puerto)
+        server_distrib.MATRIZ_PORT = free_port()
+        before = time_to_first_sale(MemoryOnlyDistribuidor, timeout)
+        after = time_to_first_sale(DistribuidorServer, timeout)
+
+    print(f"Reinicio del Distribuidor con la Matriz caída, hasta que un surtidor puede vender:")
+    print(f"  caché solo en memoria (antes): "
+          + (f"{before * 1000:.0f} ms" if before is not None else f"sin precio tras {timeout:g} s"))
+    print(f"  caché guardado en la BD:       "
+          + (f"{after * 1000:.0f} ms" if after is not None else f"sin precio tras {timeout:g} s"))
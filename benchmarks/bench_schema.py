@@ -0,0 +1,176 @@
+# compara el esquema anterior de la BD central (texto en cada fila) con el de dimensiones
+# Uso: python -m benchmarks.bench_schema [filas]
+import contextlib
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from matriz.server_matriz import MatrizServer, COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+DB_PATH = "matriz/db_matriz.sqlite"
+
+# Esquema y consultas de la versión anterior, tal como estaban en server_matriz.py
+V1_SCHEMA = """
+CREATE TABLE transacciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp DATETIME NOT NULL,
+    distribuidor_id TEXT NOT NULL,
+    surtidor_id TEXT NOT NULL,
+    combustible TEXT NOT NULL,
+    litros REAL NOT NULL,
+    cargas INTEGER NOT NULL
+)
+"""
+V1_SUMMARY_SCHEMA = """
+CREATE TABLE resumenes (
+    distribuidor_id TEXT NOT NULL,
+    intervalo INTEGER NOT NULL,
+    duracion INTEGER NOT NULL,
+    surtidor_id TEXT NOT NULL,
+    combustible TEXT NOT NULL,
+    litros REAL NOT NULL,
+    cargas INTEGER NOT NULL,
+    PRIMARY KEY (distribuidor_id, intervalo, surtidor_id, combustible)
+)
+"""
+V1_INSERT = """
+INSERT INTO transacciones (timestamp, distribuidor_id, surtidor_id, combustible, litros, cargas)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+V1_REPORTS = [
+    """
+    SELECT combustible, SUM(litros) as total_litros, SUM(cargas) as total_cargas
+    FROM (
+        SELECT combustible, litros, cargas FROM transacciones
+        UNION ALL
+        SELECT combustible, litros, cargas FROM resumenes
+    )
+    GROUP BY combustible ORDER BY total_litros DESC
+    """,
+    """
+    SELECT distribuidor_id, SUM(litros) as total_litros, SUM(cargas) as total_cargas
+    FROM (
+        SELECT distribuidor_id, litros, cargas FROM transacciones
+        UNION ALL
+        SELECT distribuidor_id, litros, cargas FROM resumenes
+    )
+    GROUP BY distribuidor_id ORDER BY distribuidor_id ASC
+    """,
+]
+
+def make_rows(num_rows) -> list:
+    """Ventas con IDs de la forma real: 20 distribuidores de 8 surtidores."""
+    random.seed(42)
+    start = datetime(2025, 11, 3, 8, 0, 0)
+    rows = []
+    for i in range(num_rows):
+        dist = i % 20
+        rows.append((
+            start + timedelta(seconds=i), f"Dist-{dist + 1}", f"S-{dist + 1}.{i % 8 + 1}",
+            random.choice(COMBUSTIBLES), round(random.uniform(5, 60), 2), 1
+        ))
+    return rows
+
+def bytes_per_row(num_rows) -> float:
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("VACUUM")
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    conn.close()
+    return page_count * page_size / num_rows
+
+def best_of(func, rounds=5) -> float:
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def reset_db():
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+
+def bench_v1(rows) -> dict:
+    reset_db()
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute(V1_SCHEMA)
+    conn.execute(V1_SUMMARY_SCHEMA)
+    start = time.perf_counter()
+    conn.executemany(V1_INSERT, rows)
+    conn.commit()
+    insert_time = time.perf_counter() - start
+    conn.close()
+
+    def reports():
+        conn = sqlite3.connect(DB_PATH)
+        for sql in V1_REPORTS:
+            conn.execute(sql).fetchall()
+        conn.close()
+
+    return {
+        "bytes_fila": bytes_per_row(len(rows)),
+        "filas_s": len(rows) / insert_time,
+        "reportes_ms": best_of(reports) * 1000,
+    }
+
+def bench_v2(rows) -> dict:
+    reset_db()
+    server = MatrizServer("127.0.0.1", 0, None)
+    rows_ms = [(int(ts.timestamp() * 1000), *rest) for ts, *rest in rows]
+    start = time.perf_counter()
+    server._insert_rows(rows_ms, [])
+    insert_time = time.perf_counter() - start
+    return {
+        "bytes_fila": bytes_per_row(len(rows)),
+        "filas_s": len(rows) / insert_time,
+        "reportes_ms": best_of(server.storage.fetch_reports) * 1000, # La consulta, no la réplica
+    }
+
+def bench_migration(rows) -> float:
+    reset_db()
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute(V1_SCHEMA)
+    conn.execute(V1_SUMMARY_SCHEMA)
+    conn.executemany(V1_INSERT, rows)
+    conn.commit()
+    conn.close()
+    start = time.perf_counter()
+    server = MatrizServer("127.0.0.1", 0, None)
+    elapsed = time.perf_counter() - start
+    report_comb, _ = server.storage.fetch_reports()
+    assert sum(cargas for _, _, cargas in report_comb) == len(rows), "La migración perdió filas"
+    return elapsed
+
+@contextlib.contextmanager
+def _quiet():
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+if __name__ == "__main__":
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("matriz")
+    rows = make_rows(num_rows)
+
+    with _quiet():
+        v1 = bench_v1(rows)
+        v2 = bench_v2(rows)
+        migration = bench_migration(rows)
+
+    print(f"{num_rows} transacciones")
+    print(f"{'':20s} {'anterior':>12s} {'dimensiones':>12s}")
+    print(f"{'bytes por fila':20s} {v1['bytes_fila']:12.1f} {v2['bytes_fila']:12.1f}")
+    print(f"{'inserción filas/s':20s} {v1['filas_s']:12.0f} {v2['filas_s']:12.0f}")
+    print(f"{'reportes ms':20s} {v1['reportes_ms']:12.2f} {v2['reportes_ms']:12.2f}")
+    print(f"Migración de la BD anterior: {migration:.2f} s")
@@ -0,0 +1,160 @@
+# llamadas de escritura al socket por mensaje: un sendall por frame vs FrameSender (sendmsg agrupado)
+# Uso: python -m benchmarks.bench_send [surtidores] [transacciones_backlog]
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.framer import (
+    frame_message, frame_parts, send_frames, queue_frame, set_nodelay, FLUSH_DELAY
+)
+from common.messages import serialize, PrecioLocalUpdateMessage, TransaccionReportMessage
+from common.outbox import PriorityOutbox, PRIORIDAD_BACKLOG
+# --- FIN: Hack para importar 'common' ---
+
+PRECIOS = {"93": 1600, "95": 1650, "97": 1700, "Diesel": 1500, "Kerosene": 1400}
+
+class CountingSocket:
+    """Envuelve un socket y cuenta las llamadas de escritura (cada una es un syscall send/sendmsg)."""
+    def __init__(self, sock):
+        self.sock = sock
+        self.calls = 0
+
+    def sendall(self, data):
+        self.calls += 1
+        return self.sock.sendall(data)
+
+    def sendmsg(self, buffers):
+        self.calls += 1
+        return self.sock.sendmsg(buffers)
+
+class SingleFrameOutbox(PriorityOutbox):
+    """El escritor de antes: un frame por envío."""
+    def _next_batch(self) -> list:
+        for lane in self.lanes:
+            if lane:
+                return [lane.popleft()]
+        return []
+
+def _drain(sock):
+    try:
+        while sock.recv(1 << 16):
+            pass
+    except OSError:
+        pass
+
+def make_pair():
+    local, remote = socket.socketpair()
+    threading.Thread(target=_drain, args=(remote,), daemon=True).start()
+    return CountingSocket(local)
+
+def price_frames():
+    return [serialize(PrecioLocalUpdateMessage(comb, precio)) for comb, precio in PRECIOS.items()]
+
+def cached_prices(grouped) -> tuple:
+    """Precios de caché a un surtidor recién conectado."""
+    sock = make_pair()
+    messages = price_frames()
+    start = time.perf_counter()
+    if grouped:
+        send_frames(sock, [frame_parts(m) for m in messages])
+    else:
+        for m in messages:
+            sock.sendall(frame_message(m))
+    return sock.calls, len(messages), time.perf_counter() - start
+
+def price_broadcast(num_surtidores, grouped) -> tuple:
+    """Cinco precios que llegan seguidos, transmitidos a todos los surtidores."""
+    socks = [make_pair() for _ in range(num_surtidores)]
+    messages = price_frames()
+    start = time.perf_counter()
+    for m in messages:
+        for sock in socks:
+            if grouped:
+                queue_frame(sock, frame_parts(m))
+            else:
+                sock.sendall(frame_message(m))
+    elapsed = time.perf_counter() - start
+    time.sleep(FLUSH_DELAY * 5) # Deja salir los flush diferidos
+    return sum(s.calls for s in socks), len(messages) * num_surtidores, elapsed
+
+def backlog_sync(num_tx, grouped) -> tuple:
+    """Sincronización de pendientes a la Matriz por el carril de backlog."""
+    sock = make_pair()
+    frames = [
+        serialize(TransaccionReportMessage(f"S-1.{i % 8 + 1}", "95", 36.57, 1, "Dist-1"))
+        for i in range(num_tx)
+    ]
+    start = time.perf_counter()
+    outbox = PriorityOutbox(sock) if grouped else SingleFrameOutbox(sock)
+    outbox.start()
+    for m in frames:
+        outbox.put(frame_parts(m) if grouped else frame_message(m), PRIORIDAD_BACKLOG)
+    outbox.wait_idle()
+    outbox.close()
+    return sock.calls, num_tx, time.perf_counter() - start
+
+def nagle_latency(nodelay, rounds=30) -> float:
+    """
+    Dos frames chicos seguidos (ej: precio y heartbeat) y luego se espera la
+    respuesta del peer. Retorna la mediana en ms hasta recibir la respuesta.
+    """
+    listener = socket.create_server(("127.0.0.1", 0))
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    if nodelay:
+        set_nodelay(client)
+    frame = frame_message(price_frames()[0])
+
+    def echo():
+        try:
+            while True:
+                received = 0
+                while received < 2 * len(frame):
+                    chunk = server.recv(1 << 16)
+                    if not chunk:
+                        return
+                    received += len(chunk)
+                server.sendall(b"k")
+        except OSError:
+            pass
+
+    threading.Thread(target=echo, daemon=True).start()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        client.sendall(frame)
+        client.sendall(frame)
+        client.recv(1)
+        times.append(time.perf_counter() - start)
+    for sock in (client, server, listener):
+        sock.close()
+    return statistics.median(times) * 1000
+
+if __name__ == "__main__":
+    num_surtidores = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    num_tx = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+
+    cases = [
+        ("precios de caché", lambda grouped: cached_prices(grouped)),
+        (f"broadcast 5 precios x {num_surtidores}", lambda grouped: price_broadcast(num_surtidores, grouped)),
+        (f"backlog {num_tx} tx", lambda grouped: backlog_sync(num_tx, grouped)),
+    ]
+    print(f"{'':28s} {'escrituras/msg':>24s} {'us/msg':>18s}")
+    print(f"{'':28s} {'antes':>11s} {'después':>12s} {'antes':>8s} {'después':>9s}")
+    for name, case in cases:
+        # Mejor de 5 corridas (la primera paga la creación de hilos y senders)
+        before_calls, messages, before_time = min((case(False) for _ in range(5)), key=lambda r: r[2])
+        after_calls, _, after_time = min((case(True) for _ in range(5)), key=lambda r: r[2])
+        print(f"{name:28s} {before_calls / messages:11.3f} {after_calls / messages:12.3f} "
+              f"{before_time / messages * 1e6:8.1f} {after_time / messages * 1e6:9.1f}")
+
+    print(f"2 frames chicos + respuesta: Nagle {nagle_latency(False):.2f} ms, "
+          f"TCP_NODELAY {nagle_latency(True):.2f} ms (mediana)")
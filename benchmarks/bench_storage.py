@@ -0,0 +1,108 @@
+# ingesta sostenida de la Matriz con cada motor de almacenamiento (SQLite vs log)
+# Uso: python -m benchmarks.bench_storage [tx_por_segundo] [segundos]
+import os
+import random
+import sys
+import tempfile
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.profiling import LatencyHistogram
+from matriz.storage import SQLiteStorage, LogStorage, CHECKPOINT_FILE
+from matriz.server_matriz import COMBUSTIBLES
+from matriz.cluster import BATCH_MAX_ROWS
+# --- FIN: Hack para importar 'common' ---
+
+def make_batch(size) -> list:
+    now_ms = int(time.time() * 1000)
+    return [
+        (now_ms, f"Dist-{i % 20 + 1}", f"S-{i % 20 + 1}.{i % 8 + 1}",
+         random.choice(COMBUSTIBLES), round(random.uniform(5, 60), 2), 1)
+        for i in range(size)
+    ]
+
+def disk_usage(path) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for name in os.listdir(path):
+        total += os.path.getsize(os.path.join(path, name))
+    return total
+
+def run(name, storage, reopen, path, rate, duration):
+    """
+    Inserta lotes de BATCH_MAX_ROWS filas (como el proceso escritor del modo
+    multi-proceso) al ritmo de 'rate' transacciones por segundo.
+    """
+    storage.init()
+    batches = [make_batch(BATCH_MAX_ROWS) for _ in range(20)]
+    period = BATCH_MAX_ROWS / rate
+    histogram = LatencyHistogram(name)
+
+    start = time.perf_counter()
+    next_batch = start
+    inserted = 0
+    max_lag = 0.0
+    while time.perf_counter() - start < duration:
+        now = time.perf_counter()
+        if now < next_batch:
+            time.sleep(next_batch - now)
+        max_lag = max(max_lag, time.perf_counter() - next_batch)
+        batch_start = time.perf_counter()
+        storage.insert_rows(batches[inserted // BATCH_MAX_ROWS % len(batches)], [])
+        histogram.record(time.perf_counter() - batch_start)
+        inserted += BATCH_MAX_ROWS
+        next_batch += period
+    elapsed = time.perf_counter() - start
+
+    report_start = time.perf_counter()
+    reports = storage.fetch_reports()
+    report_time = time.perf_counter() - report_start
+    assert sum(cargas for _, _, cargas in reports[0]) == inserted, "Faltan transacciones"
+    storage.close()
+
+    reopen_start = time.perf_counter()
+    reopened = reopen()
+    reopened.init()
+    reopen_time = time.perf_counter() - reopen_start
+    assert reopened.fetch_reports() == reports, "Los reportes cambiaron al reabrir"
+
+    print(f"--- {name} ---")
+    print(f"  {inserted} tx en {elapsed:.1f} s = {inserted / elapsed:.0f} tx/s "
+          f"(objetivo {rate}, atraso máximo {max_lag * 1000:.0f} ms)")
+    print(f"  lote de {BATCH_MAX_ROWS}: {histogram.summary().split(': ', 1)[1]}")
+    line = f"  en disco: {disk_usage(path) / inserted:.1f} bytes/tx"
+    if isinstance(storage, LogStorage):
+        # Los segmentos se reservan completos: se informa también lo escrito
+        written = (storage.segment - 1) * storage.segment_size + storage.offset
+        line += f" reservados, {written / inserted:.1f} bytes/tx escritos"
+    print(line)
+    print(f"  reportes: {report_time * 1000:.1f} ms, reabrir: {reopen_time * 1000:.0f} ms")
+    if isinstance(storage, LogStorage):
+        reopened.close()
+        os.remove(os.path.join(path, CHECKPOINT_FILE))
+        replay_start = time.perf_counter()
+        replayed = reopen()
+        replayed.init()
+        replay_time = time.perf_counter() - replay_start
+        assert replayed.fetch_reports() == reports, "Los reportes cambiaron al reproducir el log"
+        print(f"  reabrir sin checkpoint (reproduce todo el log): {replay_time * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    rate = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    random.seed(42)
+    quiet = lambda message: None
+
+    directory = tempfile.mkdtemp()
+    sqlite_path = os.path.join(directory, "matriz.sqlite")
+    run("sqlite", SQLiteStorage(sqlite_path, quiet), lambda: SQLiteStorage(sqlite_path, quiet),
+        sqlite_path, rate, duration)
+
+    log_dir = os.path.join(directory, "log_matriz")
+    run("log", LogStorage(log_dir, quiet), lambda: LogStorage(log_dir, quiet),
+        log_dir, rate, duration)
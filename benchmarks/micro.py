@@ -0,0 +1,293 @@
+# micro-benchmarks de las rutas críticas, con líneas base en JSON
+#
+# Uso:
+#   python -m benchmarks.micro run [--salida archivo.json] [--filtro TEXTO]
+#   python -m benchmarks.micro compare <baseline.json> [<actual.json>] [--umbral 0.25]
+#
+# 'run' mide todos los casos e imprime (o guarda) los resultados.
+# 'compare' compara contra una línea base (si no se da <actual.json>, mide
+# ahora) y termina con código 1 si algún caso es más lento que la base en más
+# de 'umbral' (0.25 = 25%). Las líneas base solo son comparables en la misma
+# máquina: el JSON guarda la plataforma para poder revisarlo.
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.framer import frame_message, receive_message
+from common.messages import (
+    serialize, deserialize, TransaccionReportMessage, ResumenVentasMessage
+)
+from distribuidor.server_distrib import DistribuidorServer
+from matriz.server_matriz import MatrizServer, COMBUSTIBLES
+# --- FIN: Hack para importar 'common' ---
+
+# Tiempo mínimo (segundos) de cada ronda y cantidad de rondas por caso
+ROUND_TIME = 0.2
+ROUNDS = 7
+DEFAULT_THRESHOLD = 0.25
+
+PAYLOAD_SIZES = [64, 1024, 65536]
+SUMMARY_ROWS = [1, 100, 1000]
+REPORT_DATASETS = [1000, 10000, 100000]
+
+# --- Datos de prueba ---
+
+def _payload(size) -> bytes:
+    """JSON con la forma de nuestros mensajes (comprime como el tráfico real)."""
+    rows = []
+    while len(json.dumps(rows)) < size:
+        rows.append([f"S-1.{len(rows) % 8}", random.choice(COMBUSTIBLES), round(random.uniform(5, 60), 2), 1])
+    return json.dumps(rows).encode("utf-8")[:size]
+
+def _summary(num_rows) -> ResumenVentasMessage:
+    rows = [
+        [f"S-1.{i % 8}", random.choice(COMBUSTIBLES), round(random.uniform(5, 60), 2), 1]
+        for i in range(num_rows)
+    ]
+    return ResumenVentasMessage("Dist-1", 1762176000, 60, rows)
+
+def _tx() -> TransaccionReportMessage:
+    return TransaccionReportMessage("S-1.1", "95", 36.57, 1, "Dist-1")
+
+@contextlib.contextmanager
+def _temp_cwd():
+    """Los servidores usan rutas de BD relativas: se trabaja en un directorio temporal."""
+    previous = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("matriz")
+    os.makedirs("distribuidor")
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+@contextlib.contextmanager
+def _quiet():
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+# --- Medición ---
+
+def measure(func) -> dict:
+    """
+    Llama a func() en rondas de al menos ROUND_TIME segundos. Retorna el
+    tiempo por llamada de la mejor ronda (el menos afectado por ruido) y la
+    mediana de las rondas, en microsegundos. Como timeit, desactiva el
+    recolector de basura mientras mide.
+    """
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _measure(func)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def _measure(func) -> dict:
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= ROUND_TIME / 4:
+            break
+        iterations *= 2
+    iterations = max(1, int(iterations * ROUND_TIME / max(elapsed, 1e-9)))
+
+    per_call = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        per_call.append((time.perf_counter() - start) / iterations)
+    per_call.sort()
+    return {
+        "us_min": round(per_call[0] * 1e6, 3),
+        "us_mediana": round(per_call[len(per_call) // 2] * 1e6, 3),
+        "iteraciones": iterations,
+    }
+
+# --- Casos ---
+
+def bench_frame_message(results):
+    for size in PAYLOAD_SIZES:
+        payload = _payload(size)
+        results[f"frame_message/{size}B"] = measure(lambda: frame_message(payload))
+        results[f"frame_message/{size}B/comprimido"] = measure(lambda: frame_message(payload, compress=True))
+
+def bench_receive_message(results):
+    """Recepción por loopback: un hilo envía los frames y se mide el lado que lee."""
+    for size in PAYLOAD_SIZES:
+        framed = frame_message(_payload(size))
+        batch = framed * max(1, 65536 // len(framed))
+        frames_per_batch = len(batch) // len(framed)
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            sender = socket.create_connection(listener.getsockname())
+            receiver, _ = listener.accept()
+
+        stop = threading.Event()
+        def send_forever():
+            try:
+                while not stop.is_set():
+                    sender.sendall(batch)
+            except OSError:
+                pass
+        threading.Thread(target=send_forever, daemon=True).start()
+
+        def receive_batch():
+            for _ in range(frames_per_batch):
+                receive_message(receiver)
+        result = measure(receive_batch)
+        result["us_min"] = round(result["us_min"] / frames_per_batch, 3)
+        result["us_mediana"] = round(result["us_mediana"] / frames_per_batch, 3)
+        results[f"receive_message/{size}B"] = result
+
+        stop.set()
+        receiver.close() # Despierta al emisor si quedó bloqueado
+        sender.close()
+
+def bench_serialization(results):
+    tx = _tx()
+    tx_bytes = serialize(tx)
+    results["serialize/transaccion"] = measure(lambda: serialize(tx))
+    results["deserialize/transaccion"] = measure(lambda: deserialize(tx_bytes))
+    for num_rows in SUMMARY_ROWS:
+        summary = _summary(num_rows)
+        summary_bytes = serialize(summary)
+        results[f"serialize/resumen/{num_rows}filas"] = measure(lambda: serialize(summary))
+        results[f"deserialize/resumen/{num_rows}filas"] = measure(lambda: deserialize(summary_bytes))
+
+def bench_save_transaction(results):
+    tx = _tx()
+    with _temp_cwd(), _quiet():
+        distribuidor = DistribuidorServer("Dist-bench", "127.0.0.1", 0)
+        matriz = MatrizServer("127.0.0.1", 0, None)
+        results["distribuidor._save_transaction"] = measure(lambda: distribuidor._save_transaction(tx))
+        results["matriz._save_transaction"] = measure(lambda: matriz._save_transaction(tx))
+
+def bench_fetch_reports(results):
+    for num_rows in REPORT_DATASETS:
+        with _temp_cwd(), _quiet():
+            matriz = MatrizServer("127.0.0.1", 0, None)
+            rows = [
+                (int(time.time() * 1000), f"Dist-{i % 10}", f"S-{i % 10}.{i % 4}",
+                 random.choice(COMBUSTIBLES), round(random.uniform(5, 60), 2), 1)
+                for i in range(num_rows)
+            ]
+            matriz._insert_rows(rows, [])
+            # La consulta al almacenamiento (los reportes de la GUI salen de la réplica)
+            results[f"fetch_reports/{num_rows}filas"] = measure(matriz.storage.fetch_reports)
+
+BENCHES = [
+    bench_frame_message,
+    bench_receive_message,
+    bench_serialization,
+    bench_save_transaction,
+    bench_fetch_reports,
+]
+
+def run_suite(name_filter="") -> dict:
+    cases = {}
+    for bench in BENCHES:
+        if name_filter and name_filter not in bench.__name__:
+            continue
+        random.seed(42) # Mismos datos en cada corrida, aunque se filtre
+        results = {}
+        bench(results)
+        for name, result in results.items():
+            print(f"  {name:40s} {result['us_min']:12.3f} µs", file=sys.stderr)
+        cases.update(results)
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "casos": cases,
+    }
+
+def compare(baseline, current, threshold) -> list:
+    """
+    Retorna los casos más lentos que la base en más de 'threshold'. Para no
+    marcar ruido, tanto la mejor ronda como la mediana deben empeorar.
+    """
+    regressions = []
+    print(f"{'caso':40s} {'base µs':>12s} {'actual µs':>12s} {'cambio':>8s}")
+    for name, base in sorted(baseline["casos"].items()):
+        result = current["casos"].get(name)
+        if result is None:
+            print(f"{name:40s} {base['us_min']:12.3f} {'-':>12s} {'(falta)':>8s}")
+            continue
+        change = result["us_min"] / base["us_min"] - 1 if base["us_min"] else 0.0
+        median_change = result["us_mediana"] / base["us_mediana"] - 1 if base["us_mediana"] else 0.0
+        flag = ""
+        if change > threshold and median_change > threshold:
+            flag = "  <-- REGRESIÓN"
+            regressions.append(name)
+        print(f"{name:40s} {base['us_min']:12.3f} {result['us_min']:12.3f} {change:+8.1%}{flag}")
+    if baseline.get("plataforma") != current.get("plataforma"):
+        print(f"Aviso: la base es de otra plataforma ({baseline.get('plataforma')}).")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de las rutas críticas.")
+    commands = parser.add_subparsers(dest="comando", required=True)
+
+    run_parser = commands.add_parser("run", help="mide todos los casos")
+    run_parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    run_parser.add_argument("--filtro", default="", help="solo los benchmarks cuyo nombre contiene este texto")
+
+    compare_parser = commands.add_parser("compare", help="compara contra una línea base")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("actual", nargs="?", help="resultados ya medidos (si no, se mide ahora)")
+    compare_parser.add_argument("--umbral", type=float, default=DEFAULT_THRESHOLD)
+    compare_parser.add_argument("--filtro", default="")
+
+    args = parser.parse_args()
+
+    if args.comando == "run":
+        results = run_suite(args.filtro)
+        if args.salida:
+            with open(args.salida, "w", encoding="utf-8") as out:
+                json.dump(results, out, indent=2)
+            print(f"Resultados guardados en {args.salida}")
+        else:
+            print(json.dumps(results, indent=2))
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if args.actual:
+        with open(args.actual, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args.filtro)
+    if args.filtro:
+        baseline["casos"] = {name: case for name, case in baseline["casos"].items() if name in current["casos"]}
+
+    regressions = compare(baseline, current, args.umbral)
+    if regressions:
+        print(f"❌ {len(regressions)} casos más lentos que la base en más de {args.umbral:.0%}.")
+        sys.exit(1)
+    print("✅ Sin regresiones.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# control de admisión: límites por token bucket y atención por turnos entre surtidores
+import collections
+import threading
+import time
+
+# Reportes que un surtidor puede tener esperando turno. Si se llena, put()
+# bloquea al hilo lector de esa conexión (y el surtidor siente la contrapresión TCP).
+LANE_LIMIT = 50
+
+class TokenBucket:
+    """
+    Límite de tasa con ráfaga: se recargan 'rate' fichas por segundo hasta un
+    máximo de 'burst', y cada reporte consume una. rate <= 0 = sin límite.
+    No tiene lock propio; lo usa AdmissionQueue con su condición tomada.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now) -> float:
+        """Segundos que faltan para la próxima ficha (0 si ya hay una)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class AdmissionQueue:
+    """
+    Cola de entrada de reportes con un carril por surtidor.
+
+    La clave de cada carril la elige quien encola y debe identificar la
+    conexión (o el canal de gateway) por la que llegó el reporte, no un ID que
+    manda el propio cliente: si no, cualquiera puede crear carriles sin límite
+    o gastar las fichas de otro surtidor.
+
+    Los hilos lectores encolan con put(); un único hilo (run) atiende los
+    carriles por turnos, uno a la vez, y llama a 'handler(clave, item)'. Cada
+    surtidor tiene su token bucket y además hay uno para todo el distribuidor,
+    así un surtidor que inunda (o que reproduce su backlog de golpe) solo
+    alarga su propio carril: los demás esperan como mucho un turno por cada
+    surtidor activo.
+    """
+    def __init__(self, handler, key_rate, key_burst, total_rate, total_burst, lane_limit=LANE_LIMIT):
+        self.handler = handler
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.lane_limit = lane_limit
+        self.total = TokenBucket(total_rate, total_burst)
+        self.buckets = {} # clave -> TokenBucket (se conservan aunque el carril se vacíe, hasta discard)
+        self.discarded = set() # Claves olvidadas que todavía tienen items en su carril
+        self.lanes = {}   # clave -> deque de items pendientes
+        self.turns = collections.deque() # Claves con items, en orden de turno
+        self.condition = threading.Condition()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def put(self, key, item) -> int:
+        """
+        Encola un item en el carril de 'key' (bloquea si está lleno).
+        Retorna cuántos items quedan esperando en ese carril.
+        """
+        with self.condition:
+            while len(self.lanes.get(key, ())) >= self.lane_limit:
+                self.condition.wait()
+            lane = self.lanes.get(key)
+            if lane is None:
+                lane = self.lanes[key] = collections.deque()
+                self.turns.append(key)
+                if key not in self.buckets:
+                    self.buckets[key] = TokenBucket(self.key_rate, self.key_burst)
+            lane.append(item)
+            self.condition.notify_all()
+            return len(lane)
+
+    def discard(self, key):
+        """
+        Olvida el token bucket de una clave que ya no va a encolar (ej: se
+        cerró la conexión). Si su carril tiene items, se borra al vaciarse.
+        """
+        with self.condition:
+            if key in self.lanes:
+                self.discarded.add(key)
+            else:
+                self.buckets.pop(key, None)
+
+    def estimated_wait(self, pending) -> float:
+        """Segundos que tarda en atenderse un carril con 'pending' items a la tasa por surtidor."""
+        return pending / self.key_rate if self.key_rate > 0 else 0.0
+
+    def run(self):
+        while True:
+            with self.condition:
+                key, item = self._next_item()
+            try:
+                self.handler(key, item)
+            except Exception as e:
+                print(f"Error procesando un reporte: {e}")
+
+    def _next_item(self):
+        """Función interna. Asume que la condición ya está adquirida."""
+        while True:
+            if not self.turns:
+                self.condition.wait()
+                continue
+            now = time.monotonic()
+            total_wait = self.total.wait_time(now)
+            if total_wait > 0:
+                self.condition.wait(total_wait)
+                continue
+            # Primer carril (en orden de turno) cuyo surtidor tiene fichas
+            wait = None
+            for _ in range(len(self.turns)):
+                key = self.turns[0]
+                self.turns.rotate(-1) # Pasa al final: el próximo turno es del siguiente
+                bucket = self.buckets[key]
+                if bucket.try_take(now):
+                    self.total.try_take(now)
+                    lane = self.lanes[key]
+                    item = lane.popleft()
+                    if not lane:
+                        del self.lanes[key]
+                        self.turns.remove(key)
+                        if key in self.discarded:
+                            self.discarded.remove(key)
+                            del self.buckets[key]
+                    self.condition.notify_all() # Despierta a un put() bloqueado
+                    return key, item
+                key_wait = bucket.wait_time(now)
+                wait = key_wait if wait is None else min(wait, key_wait)
+            self.condition.wait(wait)
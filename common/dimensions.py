@@ -0,0 +1,66 @@
+# tablas de dimensiones: IDs y combustibles guardados como enteros en las BDs
+import sqlite3
+import threading
+
+# Cada dimensión es una tabla (cod, nombre). Las tablas de hechos guardan solo
+# el código entero en vez de repetir el texto en cada fila.
+DIM_DISTRIBUIDORES = "dim_distribuidores"
+DIM_SURTIDORES = "dim_surtidores"
+DIM_COMBUSTIBLES = "dim_combustibles"
+DIMENSIONES = (DIM_DISTRIBUIDORES, DIM_SURTIDORES, DIM_COMBUSTIBLES)
+
+# Expresión SQL que convierte un DATETIME de texto (hora local, como lo
+# guardaban las versiones anteriores) a epoch en milisegundos
+SQL_DATETIME_A_MS = "CAST(ROUND((julianday({columna}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+
+def create_dimension_tables(cursor):
+    for table in DIMENSIONES:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            cod INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL UNIQUE
+        )
+        """)
+
+def fill_dimensions(cursor, source_sql: dict):
+    """
+    Migración: agrega a cada dimensión los nombres distintos que retorna su
+    consulta. 'source_sql' es {tabla_dimension: "SELECT ... (una columna)"}.
+    """
+    for table, sql in source_sql.items():
+        cursor.execute(f"INSERT OR IGNORE INTO {table} (nombre) {sql}")
+
+class DimensionCache:
+    """
+    Traduce nombres a códigos al guardar. Los códigos conocidos se resuelven
+    en memoria; un nombre nuevo se inserta y se confirma en su propia
+    conexión, así el código nunca queda apuntando a una fila que se deshizo
+    con un rollback. Hay que llamar a encode() antes de abrir la transacción
+    que lo usa (SQLite permite un solo escritor a la vez).
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.codes = {table: {} for table in DIMENSIONES}
+        self.lock = threading.Lock()
+
+    def encode(self, table, nombre) -> int:
+        code = self.codes[table].get(nombre)
+        if code is None:
+            code = self._insert(table, nombre)
+        return code
+
+    def _insert(self, table, nombre) -> int:
+        with self.lock:
+            code = self.codes[table].get(nombre)
+            if code is not None:
+                return code # Otro hilo lo insertó mientras esperábamos
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"INSERT OR IGNORE INTO {table} (nombre) VALUES (?)", (nombre,))
+                conn.commit()
+                (code,) = cursor.execute(f"SELECT cod FROM {table} WHERE nombre = ?", (nombre,)).fetchone()
+            finally:
+                conn.close()
+            self.codes[table][nombre] = code
+            return code
@@ -1,23 +1,389 @@
 # utilidades de framing (longitud-prefijo) y JSON
+import errno
+import heapq
+import os
+import select
 import socket
 import struct
+import threading
+import time
+import weakref
+import zlib
+
+from common.profiling import get_histogram
 
 # Usamos '!I' para el formato del struct:
 # ! = Network byte order (big-endian), estándar para redes.
 # I = Unsigned Integer (4 bytes).
-# Esto nos permite manejar mensajes de hasta 4GB.
+# Los 2 bits más altos del header son flags (mensaje comprimido y canal),
+# así que los 30 bits restantes permiten mensajes de hasta 1GB.
 HEADER_FORMAT = "!I"
 HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FLAG_COMPRIMIDO = 0x80000000
+FLAG_CANAL = 0x40000000
+LENGTH_MASK = 0x3FFFFFFF
+# Con FLAG_CANAL, después del header va el ID de canal (2 bytes). Lo usa el
+# gateway de estación para multiplexar varios surtidores en una conexión.
+CHANNEL_FORMAT = "!H"
+CHANNEL_SIZE = struct.calcsize(CHANNEL_FORMAT)
+
+# --- Compresión negociada ---
+# Nombre de la capacidad que se anuncia en el heartbeat "online". Incluye la
+# versión del diccionario: si el diccionario cambia, cambia el nombre.
+COMPRESSION_CAPABILITY = "zlib-dict1"
+# Solo se comprimen los mensajes de al menos este tamaño (los chicos no ganan nada)
+COMPRESS_THRESHOLD = 128
+# Tamaño máximo de un mensaje descomprimido: un frame chico no puede inflarse
+# sin límite (bomba zlib)
+MAX_DESCOMPRIMIDO = 16 * 1024 * 1024
+# Diccionario pre-cargado para zlib, armado con la forma de nuestros mensajes
+# (mismas claves, combustibles e IDs en cada uno). zlib busca coincidencias
+# en él desde el primer byte, lo que sirve mucho en mensajes cortos.
+# Lo más frecuente va al final (zlib prefiere distancias cortas).
+ZLIB_DICT = (
+    b'{"tipo": "HEARTBEAT", "id": "Dist-1", "estado": "online", "capacidades": ["zlib-dict1"]}'
+    b'{"tipo": "PRECIO_UPDATE", "combustible": "Kerosene", "precio_base": 1500}'
+    b'{"tipo": "PRECIO_LOCAL", "combustible": "Diesel", "precio_final": 1725}'
+    b'{"tipo": "RESUMEN_VENTAS", "distribuidor_id": "Dist-2", "intervalo": 1762176000, "duracion": 60, '
+    b'"filas": [["S-2.1", "97", 58.84, 1], ["S-2.2", "93", 7.74, 2]]}'
+    b'{"tipo": "TRANSACCION", "surtidor_id": "S-1.1", "combustible": "95", "litros": 36.57, '
+    b'"cargas": 1, "distribuidor_id": "Dist-1"}'
+    b'{"tipo": "TRANSACCION", "surtidor_id": "S-2.1", "combustible": "93", "litros": 16.82, '
+    b'"cargas": 1, "distribuidor_id": "Dist-2"}'
+)
+
+def _compress(message_bytes: bytes) -> bytes:
+    # wbits=-15: deflate "crudo", sin header ni checksum de zlib (6 bytes menos por frame)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=ZLIB_DICT)
+    return compressor.compress(message_bytes) + compressor.flush()
+
+def _decompress(payload: bytes) -> bytes:
+    decompressor = zlib.decompressobj(-15, zdict=ZLIB_DICT)
+    # Con un byte más del máximo: si se llega a él, el mensaje es demasiado grande
+    message_bytes = decompressor.decompress(payload, MAX_DESCOMPRIMIDO + 1)
+    if len(message_bytes) > MAX_DESCOMPRIMIDO:
+        raise zlib.error(f"mensaje descomprimido de más de {MAX_DESCOMPRIMIDO} bytes")
+    return message_bytes
 
-def frame_message(message_bytes: bytes) -> bytes:
+def frame_message(message_bytes: bytes, compress: bool = False, channel: int | None = None) -> bytes:
     """
     Agrega un prefijo de 4 bytes con la longitud del mensaje.
+    Si 'compress' es True (el peer negoció la compresión) y el mensaje supera
+    COMPRESS_THRESHOLD, se comprime y se marca con FLAG_COMPRIMIDO en el header.
+    Si 'channel' no es None, se marca con FLAG_CANAL y se agrega el ID de canal.
     """
-    # 1. Empaqueta la longitud del mensaje en 4 bytes
-    header = struct.pack(HEADER_FORMAT, len(message_bytes))
-    # 2. Retorna [Header de 4 bytes] + [Mensaje]
+    header, message_bytes = frame_parts(message_bytes, compress, channel)
     return header + message_bytes
 
+def frame_parts(message_bytes: bytes, compress: bool = False, channel: int | None = None) -> tuple[bytes, bytes]:
+    """
+    Igual que frame_message, pero retorna (header, mensaje) sin concatenarlos.
+    Los senders aceptan esta tupla como frame y la envían con sendmsg tal cual.
+    """
+    flags = 0
+    if compress and len(message_bytes) >= COMPRESS_THRESHOLD:
+        compressed = _compress(message_bytes)
+        if len(compressed) < len(message_bytes):
+            message_bytes = compressed
+            flags = FLAG_COMPRIMIDO
+
+    if channel is not None:
+        flags |= FLAG_CANAL
+
+    # 1. Empaqueta la longitud del mensaje (y los flags) en 4 bytes
+    header = struct.pack(HEADER_FORMAT, len(message_bytes) | flags)
+    if channel is not None:
+        header += struct.pack(CHANNEL_FORMAT, channel)
+    # 2. Retorna [Header de 4 bytes] + [Canal opcional], [Mensaje]
+    return header, message_bytes
+
+# --- Grabación de tráfico (capturas para reproducir incidentes) ---
+# Si CAPTURA_TRAFICO tiene una ruta, cada proceso graba todos los frames que
+# envía y recibe. Con varios procesos (ej: workers de la Matriz) conviene
+# incluir "{pid}" en la ruta para que cada uno use su propio archivo.
+CAPTURA_TRAFICO = os.environ.get('CAPTURA_TRAFICO', '')
+
+CAPTURE_MAGIC = b"PDCAP1\n"
+# Registro: dirección (1 byte), timestamp monotónico (double), largo del
+# peer ID (2 bytes) y largo del frame (4 bytes); luego el peer ID y el frame
+# tal como viajó por el socket (header incluido, comprimido si lo estaba).
+RECORD_FORMAT = "!BdHI"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_FORMAT)
+DIRECCION_RECIBIDO = 0
+DIRECCION_ENVIADO = 1
+
+class TrafficRecorder:
+    """Agrega cada frame enviado o recibido a un archivo binario de captura."""
+    def __init__(self, path):
+        self.path = path.format(pid=os.getpid())
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, "ab", buffering=0) # Un write() por registro
+        if is_new:
+            self.file.write(CAPTURE_MAGIC)
+        self.lock = threading.Lock()
+
+    def record(self, direction, sock, frame_bytes):
+        try:
+            host, port = sock.getpeername()[:2]
+            peer_id = f"{host}:{port}".encode("utf-8")
+        except OSError:
+            peer_id = b"?"
+        header = struct.pack(RECORD_FORMAT, direction, time.monotonic(), len(peer_id), len(frame_bytes))
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(header + peer_id + frame_bytes)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+_recorder = None
+
+def start_recording(path):
+    """Activa la grabación de todos los frames de este proceso en 'path'."""
+    global _recorder
+    stop_recording()
+    _recorder = TrafficRecorder(path)
+    print(f"🎙️ Grabando tráfico en {_recorder.path}")
+
+def stop_recording():
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder:
+        recorder.close()
+
+def read_capture(path):
+    """Lee un archivo de captura. Genera tuplas (dirección, timestamp, peer_id, frame)."""
+    with open(path, "rb") as capture:
+        if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} no es un archivo de captura.")
+        while True:
+            header = capture.read(RECORD_HEADER_SIZE)
+            if len(header) < RECORD_HEADER_SIZE:
+                return # Fin del archivo (o registro cortado por un cierre abrupto)
+            direction, timestamp, peer_len, frame_len = struct.unpack(RECORD_FORMAT, header)
+            peer_id = capture.read(peer_len).decode("utf-8")
+            frame_bytes = capture.read(frame_len)
+            if len(frame_bytes) < frame_len:
+                return
+            yield direction, timestamp, peer_id, frame_bytes
+
+# --- Envío (un escritor por socket, con escritura vectorizada) ---
+# Un frame es un 'bytes' (frame_message) o una tupla de buffers (frame_parts).
+# Se envían varios a la vez con sendmsg (scatter/gather), sin concatenarlos.
+# Con queue_frame, los frames esperan hasta juntar FLUSH_BYTES o hasta que
+# pasen FLUSH_DELAY segundos, lo que ocurra primero.
+FLUSH_BYTES = 64 * 1024
+FLUSH_DELAY = 0.002
+# Reintento de un flush diferido cuyo socket no aceptaba más datos
+FLUSH_RETRY = 0.05
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX") # Buffers que acepta un solo sendmsg
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+def set_nodelay(sock: socket.socket):
+    """
+    Desactiva Nagle: los frames chicos (precios, heartbeats) salen de inmediato
+    en vez de esperar el ACK del anterior. La agrupación la hace FrameSender.
+    """
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass # Socket que no es TCP (ej: socketpair en pruebas)
+
+def _frame_buffers(frame) -> tuple:
+    return frame if isinstance(frame, tuple) else (frame,)
+
+def _sendmsg_all(sock: socket.socket, buffers: list):
+    """Envía todos los buffers con la menor cantidad de sendmsg posible (maneja envíos parciales)."""
+    views = [memoryview(b) for b in buffers if len(b)]
+    first = 0
+    while first < len(views):
+        sent = sock.sendmsg(views[first:first + IOV_MAX])
+        first = _skip_sent(views, first, sent)
+
+def _sendmsg_ready(sock: socket.socket, buffers: list) -> list:
+    """
+    Como _sendmsg_all pero sin bloquear: envía lo que entra en el buffer del
+    socket y retorna los buffers (o restos) que quedaron sin enviar.
+    """
+    if sock.fileno() < 0:
+        raise OSError(errno.EBADF, "Socket cerrado")
+    views = [memoryview(b) for b in buffers if len(b)]
+    poller = select.poll()
+    poller.register(sock, select.POLLOUT)
+    first = 0
+    while first < len(views) and poller.poll(0):
+        try:
+            sent = sock.sendmsg(views[first:first + IOV_MAX], [], socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            break
+        first = _skip_sent(views, first, sent)
+    return views[first:]
+
+def _skip_sent(views: list, first: int, sent: int) -> int:
+    """Salta los buffers que salieron completos y recorta el que quedó a medias."""
+    while sent:
+        size = views[first].nbytes
+        if sent >= size:
+            sent -= size
+            first += 1
+        else:
+            views[first] = views[first][sent:]
+            sent = 0
+    return first
+
+class FrameSender:
+    """
+    Único escritor de un socket. Todos los envíos pasan por aquí, así los
+    frames de distintos hilos no se intercalan y los encolados con
+    flush=False salen en orden, antes que cualquier envío posterior.
+    """
+    def __init__(self, sock: socket.socket, max_bytes=FLUSH_BYTES, max_delay=FLUSH_DELAY):
+        # Referencia débil: _senders tiene al socket como clave débil y una
+        # referencia fuerte desde aquí no lo dejaría liberar nunca.
+        self.sock_ref = weakref.ref(sock)
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.buffers = []
+        self.pending_bytes = 0
+        self.unrecorded = [] # Frames pendientes que se graban al salir (captura activa)
+        self.scheduled = False # Hay un flush diferido agendado
+        self.error = None      # Error de un flush diferido; se lanza en el próximo envío
+
+    @property
+    def sock(self) -> socket.socket:
+        sock = self.sock_ref()
+        if sock is None:
+            raise OSError(errno.EBADF, "Socket cerrado")
+        return sock
+
+    def send(self, frames, flush=True):
+        """
+        Agrega frames a lo pendiente. Con flush=True (o si se juntaron
+        max_bytes) envía todo lo pendiente en un solo sendmsg; si no, lo
+        envía el hilo de flush diferido dentro de max_delay segundos.
+        """
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+            for frame in frames:
+                buffers = _frame_buffers(frame)
+                self.buffers.extend(buffers)
+                self.pending_bytes += sum(len(b) for b in buffers)
+                if _recorder:
+                    self.unrecorded.append(b"".join(buffers))
+            if flush or self.pending_bytes >= self.max_bytes:
+                self._flush()
+            elif not self.scheduled and self.buffers:
+                self.scheduled = True
+                _delayed_flusher.schedule(self, time.monotonic() + self.max_delay)
+
+    def flush(self):
+        """
+        Flush diferido. Corre en el hilo compartido por todos los sockets, así
+        que nunca espera: si otro hilo está usando el socket o el peer no
+        acepta más datos, envía lo que puede y reintenta en FLUSH_RETRY.
+        """
+        if not self.lock.acquire(blocking=False):
+            _delayed_flusher.schedule(self, time.monotonic() + FLUSH_RETRY)
+            return
+        try:
+            self.scheduled = False
+            try:
+                self._record_pending()
+                self.buffers = _sendmsg_ready(self.sock, self.buffers)
+            except OSError as e:
+                self.error = e # Lo ve quien envíe después (ej: el próximo broadcast)
+                self.buffers = []
+            self.pending_bytes = sum(len(b) for b in self.buffers)
+            if self.buffers:
+                self.scheduled = True
+                _delayed_flusher.schedule(self, time.monotonic() + FLUSH_RETRY)
+        finally:
+            self.lock.release()
+
+    def _flush(self):
+        """Función interna. Asume que el lock ya está adquirido."""
+        buffers = self.buffers
+        self.buffers = []
+        self.pending_bytes = 0
+        self._record_pending()
+        if buffers:
+            _sendmsg_all(self.sock, buffers)
+
+    def _record_pending(self):
+        """
+        Función interna. Asume que el lock ya está adquirido.
+        Graba los frames que se escriben ahora en el socket: la captura tiene
+        la hora en que salieron (los agrupados, juntos), no la de encolado.
+        """
+        recorder = _recorder
+        if recorder:
+            for frame_bytes in self.unrecorded:
+                recorder.record(DIRECCION_ENVIADO, self.sock, frame_bytes)
+        self.unrecorded = []
+
+class _DelayedFlusher:
+    """
+    Un hilo para todo el proceso que ejecuta los flush diferidos en orden de
+    vencimiento. Ningún flush diferido bloquea: un peer lento no frena a los demás.
+    """
+    def __init__(self):
+        self.heap = []
+        self.counter = 0 # Desempate en el heap (los FrameSender no se comparan)
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def schedule(self, sender: FrameSender, deadline: float):
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.counter += 1
+            heapq.heappush(self.heap, (deadline, self.counter, sender))
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                _, _, sender = heapq.heappop(self.heap)
+            sender.flush()
+
+_delayed_flusher = _DelayedFlusher()
+
+_senders = weakref.WeakKeyDictionary()
+_senders_lock = threading.Lock()
+
+def get_sender(sock: socket.socket) -> FrameSender:
+    sender = _senders.get(sock)
+    if sender is None:
+        with _senders_lock:
+            sender = _senders.setdefault(sock, FrameSender(sock))
+    return sender
+
+def send_frame(sock: socket.socket, framed_msg):
+    """
+    Envía un frame ya enmarcado (y lo graba si la captura está activa).
+    Es seguro llamarla desde varios hilos para el mismo socket.
+    """
+    get_sender(sock).send((framed_msg,))
+
+def send_frames(sock: socket.socket, frames):
+    """Envía varios frames con un solo sendmsg (más los que estaban encolados)."""
+    get_sender(sock).send(frames)
+
+def queue_frame(sock: socket.socket, framed_msg):
+    """
+    Encola un frame sin enviarlo todavía: sale junto con los que lleguen en
+    los próximos FLUSH_DELAY segundos (ej: varios precios seguidos).
+    """
+    get_sender(sock).send((framed_msg,), flush=False)
+
 def _read_n_bytes(sock: socket.socket, n: int) -> bytes:
     """
     Función de ayuda para leer exactamente 'n' bytes de un socket.
@@ -36,33 +402,70 @@ def _read_n_bytes(sock: socket.socket, n: int) -> bytes:
         data_buffer += chunk
     return data_buffer
 
+_receive_histogram = get_histogram("receive_message")
+
 def receive_message(sock: socket.socket) -> bytes | None:
     """
     Recibe un mensaje completo con prefijo de longitud desde un socket.
     Retorna los bytes del mensaje, o None si el cliente se desconectó limpiamente.
     """
+    channel, message_bytes = receive_frame(sock)
+    return message_bytes
+
+def receive_frame(sock: socket.socket) -> tuple[int | None, bytes | None]:
+    """
+    Igual que receive_message, pero retorna (canal, mensaje). El canal es
+    None si el frame no traía FLAG_CANAL.
+    """
     try:
         # 1. Leer el header (4 bytes) para obtener la longitud
         header_data = _read_n_bytes(sock, HEADER_SIZE)
+        # Se mide desde que llega el header: la espera previa es tiempo ocioso
+        start = time.perf_counter()
         
-        # 2. Desempacar el header para obtener el entero de la longitud
-        (message_length,) = struct.unpack(HEADER_FORMAT, header_data)
+        # 2. Desempacar el header para obtener la longitud y el flag
+        (header_value,) = struct.unpack(HEADER_FORMAT, header_data)
+        message_length = header_value & LENGTH_MASK
+        channel = None
+        if header_value & FLAG_CANAL:
+            channel_data = _read_n_bytes(sock, CHANNEL_SIZE)
+            (channel,) = struct.unpack(CHANNEL_FORMAT, channel_data)
+            header_data += channel_data
         
         # 3. Leer exactamente 'message_length' bytes
         message_bytes = _read_n_bytes(sock, message_length)
-        
-        return message_bytes
+
+        if _recorder:
+            _recorder.record(DIRECCION_RECIBIDO, sock, header_data + message_bytes)
+
+        # 4. Descomprimir si el emisor lo marcó como comprimido
+        if header_value & FLAG_COMPRIMIDO:
+            message_bytes = _decompress(message_bytes)
+
+        _receive_histogram.record(time.perf_counter() - start)
+        return channel, message_bytes
         
     except ConnectionError as e:
         # El socket se cerró inesperadamente (manejado en _read_n_bytes)
         print(f"Error de conexión: {e}")
-        return None
+        return None, None
+    except TimeoutError:
+        # Se cumplió el deadline de lectura (sock.settimeout): el peer no
+        # envió nada, ni siquiera heartbeats. Se trata como desconexión.
+        print("Timeout de lectura: el peer no responde.")
+        return None, None
     except struct.error as e:
         print(f"Error de struct (posiblemente header malformado): {e}")
-        return None
+        return None, None
+    except zlib.error as e:
+        print(f"Error descomprimiendo mensaje: {e}")
+        return None, None
     except Exception as e:
         # Maneja el caso de desconexión limpia (recv() devuelve b"")
         # Esto sucede si _read_n_bytes falla al leer el header
         # porque el cliente cerró la conexión.
         # print("Cliente desconectado limpiamente.")
-        return None
\ No newline at end of file
+        return None, None
+
+if CAPTURA_TRAFICO:
+    start_recording(CAPTURA_TRAFICO)
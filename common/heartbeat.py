@@ -0,0 +1,103 @@
+# heartbeats periódicos y cierre de conexiones inactivas
+import socket
+import threading
+import time
+
+# Cada cuánto (segundos) se envía un heartbeat periódico en cada conexión
+HEARTBEAT_INTERVAL = 10
+# Un peer que no envía nada en este tiempo se considera muerto (3 latidos perdidos)
+IDLE_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+# Deadline de lectura de los sockets. Es un respaldo del reaper: si por algún
+# motivo el reaper no cierra el socket, el recv() bloqueado igual termina.
+READ_TIMEOUT = IDLE_TIMEOUT + HEARTBEAT_INTERVAL
+# Estado usado en los heartbeats periódicos (el "online" se usa al conectar)
+ESTADO_ALIVE = "alive"
+
+class IdleReaper:
+    """
+    Cierra las conexiones que llevan más de 'timeout' segundos sin actividad.
+
+    Usa una "timer wheel": un arreglo circular de slots donde cada slot
+    agrupa las conexiones que deben revisarse en ese tick. touch() solo
+    actualiza la hora del último mensaje (O(1), sin mover nada en la rueda);
+    al llegar al slot, la conexión se cierra si sigue inactiva o se vuelve a
+    agendar según su última actividad. Cada tick revisa un solo slot, sin
+    recorrer todas las conexiones.
+    """
+    def __init__(self, timeout=IDLE_TIMEOUT, tick=1.0, name="reaper"):
+        self.timeout = timeout
+        self.tick = tick
+        self.name = name
+        self.num_slots = int(timeout / tick) + 2
+        self.slots = [set() for _ in range(self.num_slots)]
+        self.current_slot = 0
+        self.last_seen = {} # key -> time.monotonic() del último mensaje
+        self.callbacks = {} # key -> función a llamar al expirar
+        self.lock = threading.Lock()
+
+    def start(self):
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def register(self, key, on_expire):
+        """Empieza a vigilar una conexión. 'on_expire' se llama si queda inactiva."""
+        with self.lock:
+            self.last_seen[key] = time.monotonic()
+            self.callbacks[key] = on_expire
+            self._schedule(key, self.timeout)
+
+    def touch(self, key):
+        """Marca actividad de la conexión (se llama al recibir cualquier mensaje)."""
+        with self.lock:
+            if key in self.last_seen:
+                self.last_seen[key] = time.monotonic()
+
+    def unregister(self, key):
+        with self.lock:
+            self.last_seen.pop(key, None)
+            self.callbacks.pop(key, None)
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def _schedule(self, key, delay):
+        """Función interna. Asume que el lock ya está adquirido."""
+        ticks = max(1, min(self.num_slots - 1, int(delay / self.tick) + 1))
+        self.slots[(self.current_slot + ticks) % self.num_slots].add(key)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            expired = []
+            with self.lock:
+                self.current_slot = (self.current_slot + 1) % self.num_slots
+                due = self.slots[self.current_slot]
+                self.slots[self.current_slot] = set()
+                now = time.monotonic()
+                for key in due:
+                    last_seen = self.last_seen.get(key)
+                    if last_seen is None:
+                        continue # Ya fue desregistrada
+                    idle = now - last_seen
+                    if idle >= self.timeout:
+                        expired.append((key, self.callbacks.pop(key)))
+                        del self.last_seen[key]
+                    else:
+                        self._schedule(key, self.timeout - idle)
+
+            # Los callbacks se llaman fuera del lock
+            for key, on_expire in expired:
+                try:
+                    on_expire(key)
+                except Exception as e:
+                    print(f"Error cerrando conexión inactiva ({self.name}): {e}")
+
+def close_idle_socket(sock: socket.socket):
+    """
+    Callback de expiración para sockets: hace shutdown para despertar al
+    hilo bloqueado en recv(), que se encarga de la limpieza normal.
+    """
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass # Ya estaba cerrado
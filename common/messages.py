@@ -1,30 +1,124 @@
 # tipos de mensajes y validación de mensajes
 import json
 
+from common.profiling import timed_stage
+
 # --- Clases de Mensajes (Estructuras de datos) ---
 # Estas clases son "data classes" simples para definir la estructura
 # de nuestros mensajes, basadas en tu tabla.
 
 class PrecioUpdateMessage:
     """Matriz -> Distribuidor"""
-    def __init__(self, tipo_combustible, precio_base):
+    def __init__(self, tipo_combustible, precio_base, traza=None, grupo=None, version=None):
         self.tipo = "PRECIO_UPDATE"
         self.combustible = tipo_combustible
         self.precio_base = precio_base
+        # Opcional: ID y marcas de tiempo por salto (ver common/tracing.py)
+        self.traza = traza
+        # Opcional: solo para los surtidores de este grupo de estación
+        self.grupo = grupo
+        # Versión del catálogo de precios de la Matriz con que se guardó
+        self.version = version
     
     def __repr__(self):
         return f"PrecioUpdate(comb={self.combustible}, base=${self.precio_base})"
 
+class HojaPreciosMessage:
+    """
+    Matriz -> Distribuidor: varios precios base que entran en vigencia
+    juntos a la hora 'vigencia_ms' (epoch ms; una hora pasada = de inmediato).
+    """
+    def __init__(self, precios, vigencia_ms, grupo=None, version=None):
+        self.tipo = "PRICE_SHEET"
+        self.precios = precios # {combustible: precio_base}
+        self.vigencia_ms = vigencia_ms
+        self.grupo = grupo     # Opcional, como en PrecioUpdateMessage
+        self.version = version # Versión del catálogo (la misma para toda la hoja)
+
+    def __repr__(self):
+        return f"HojaPrecios({len(self.precios)} precios, vigencia={self.vigencia_ms})"
+
+class CatalogoPreciosMessage:
+    """
+    Matriz -> Distribuidor, al conectarse: los precios del catálogo
+    posteriores a la versión que informó el distribuidor, en orden.
+    'completo' = el catálogo se reinició y son todas sus entradas.
+    """
+    def __init__(self, version, entradas, completo=False):
+        self.tipo = "PRECIO_CATALOGO"
+        self.version = version     # Versión actual del catálogo
+        self.entradas = entradas   # [[version, combustible, precio_base, grupo, vigencia_ms], ...]
+        self.completo = completo
+
+    def __repr__(self):
+        return f"CatalogoPrecios(v{self.version}, {len(self.entradas)} entradas)"
+
 class PrecioLocalUpdateMessage:
     """Distribuidor -> Surtidor"""
-    def __init__(self, tipo_combustible, precio_final):
+    def __init__(self, tipo_combustible, precio_final, traza=None, seq=None, version=None):
         self.tipo = "PRECIO_LOCAL"
         self.combustible = tipo_combustible
         self.precio_final = precio_final
+        self.traza = traza # Traza del PrecioUpdateMessage que lo originó (si traía)
+        # Secuencia multicast (ver common/multicast.py). None = solo por TCP
+        self.seq = seq
+        # Versión del catálogo de la Matriz de este precio: solo reemplaza las
+        # hojas en espera más viejas. None = desconocida, cuenta como la más nueva.
+        self.version = version
 
     def __repr__(self):
         return f"PrecioLocalUpdate(comb={self.combustible}, final=${self.precio_final})"
 
+class HojaPreciosLocalMessage:
+    """Distribuidor -> Surtidor: precios finales a aplicar juntos a la hora 'vigencia_ms'."""
+    def __init__(self, precios, vigencia_ms, version=None):
+        self.tipo = "PRICE_SHEET_LOCAL"
+        self.precios = precios # {combustible: precio_final}
+        self.vigencia_ms = vigencia_ms
+        self.version = version # Versión del catálogo de la Matriz de la hoja
+
+    def __repr__(self):
+        return f"HojaPreciosLocal({len(self.precios)} precios, vigencia={self.vigencia_ms})"
+
+class MulticastAltaMessage:
+    """
+    Distribuidor -> Surtidor que ofreció multicast: desde ahora los precios
+    generales le llegan por el grupo 'direccion', a partir de ultimo_seq + 1.
+    """
+    def __init__(self, emisor, direccion, epoch, ultimo_seq):
+        self.tipo = "MULTICAST_ALTA"
+        self.emisor = emisor
+        self.direccion = direccion # 'grupo:puerto'
+        self.epoch = epoch
+        self.ultimo_seq = ultimo_seq
+
+    def __repr__(self):
+        return f"MulticastAlta(emisor={self.emisor}, dir={self.direccion}, seq={self.ultimo_seq})"
+
+class NackMessage:
+    """Surtidor -> Distribuidor: faltan los precios multicast 'desde'..'hasta' (inclusive)."""
+    def __init__(self, surtidor_id, desde, hasta):
+        self.tipo = "NACK"
+        self.surtidor_id = surtidor_id
+        self.desde = desde
+        self.hasta = hasta
+
+    def __repr__(self):
+        return f"Nack(surtidor={self.surtidor_id}, {self.desde}..{self.hasta})"
+
+class PrecioAplicadoMessage:
+    """Surtidor -> Distribuidor -> Matriz. Confirma que un precio con traza se aplicó."""
+    def __init__(self, surtidor_id, combustible, traza, retenido, distribuidor_id=None):
+        self.tipo = "PRECIO_APLICADO"
+        self.surtidor_id = surtidor_id
+        self.combustible = combustible
+        self.traza = traza         # Con todos los saltos, hasta surtidor_aplica
+        self.retenido = retenido   # Segundos que esperó en cola porque el surtidor estaba operando
+        self.distribuidor_id = distribuidor_id
+
+    def __repr__(self):
+        return f"PrecioAplicado(surtidor={self.surtidor_id}, comb={self.combustible}, traza={self.traza['id']})"
+
 # ESTE ES EL CÓDIGO CORREGIDO
 class TransaccionReportMessage:
     """Surtidor -> Distribuidor -> Matriz"""
@@ -41,12 +135,78 @@ class TransaccionReportMessage:
         dist_info = f" (de {self.distribuidor_id})" if self.distribuidor_id else ""
         return f"Transaccion(surtidor={self.surtidor_id}, comb={self.combustible}, {self.litros}L, {self.cargas} cargas{dist_info})"
 
+class ResumenVentasMessage:
+    """Distribuidor -> Matriz (modo pre-agregado)"""
+    def __init__(self, distribuidor_id, intervalo, duracion, filas):
+        self.tipo = "RESUMEN_VENTAS"
+        self.distribuidor_id = distribuidor_id
+        self.intervalo = intervalo # Inicio del intervalo (epoch en segundos)
+        self.duracion = duracion   # Largo del intervalo en segundos
+        # Lista de [surtidor_id, combustible, litros, cargas] con los
+        # totales COMPLETOS del intervalo (reenviar un resumen es idempotente)
+        self.filas = filas
+
+    def __repr__(self):
+        return f"ResumenVentas(dist={self.distribuidor_id}, intervalo={self.intervalo}, {len(self.filas)} filas)"
+
+class PerfilMessage:
+    """Matriz -> Distribuidor (-> Surtidor). Controla el perfilado en tiempo de ejecución."""
+    def __init__(self, accion, incluir_surtidores=False):
+        self.tipo = "PERFIL"
+        self.accion = accion # "start", "stop", "toggle" o "dump"
+        self.incluir_surtidores = incluir_surtidores
+
+    def __repr__(self):
+        return f"Perfil(accion={self.accion})"
+
+class ReportQueryMessage:
+    """Matriz -> Distribuidor. Pide los totales de ventas calculados en el distribuidor."""
+    def __init__(self, query_id):
+        self.tipo = "REPORT_QUERY"
+        self.query_id = query_id
+
+    def __repr__(self):
+        return f"ReportQuery(id={self.query_id})"
+
+class ReportResultMessage:
+    """Distribuidor -> Matriz. Respuesta a un ReportQueryMessage."""
+    def __init__(self, query_id, distribuidor_id, filas):
+        self.tipo = "REPORT_RESULT"
+        self.query_id = query_id
+        self.distribuidor_id = distribuidor_id
+        # Lista de [combustible, litros, cargas] con el total histórico del distribuidor
+        self.filas = filas
+
+    def __repr__(self):
+        return f"ReportResult(id={self.query_id}, dist={self.distribuidor_id}, {len(self.filas)} filas)"
+
+class SlowDownMessage:
+    """Distribuidor -> Surtidor. Pide no enviar más reportes durante 'espera_ms'."""
+    def __init__(self, surtidor_id, espera_ms):
+        self.tipo = "SLOW_DOWN"
+        self.surtidor_id = surtidor_id # Un gateway lo reenvía al surtidor de ese ID
+        self.espera_ms = espera_ms
+
+    def __repr__(self):
+        return f"SlowDown(surtidor={self.surtidor_id}, {self.espera_ms} ms)"
+
 class HeartbeatMessage:
     """Bidireccional"""
-    def __init__(self, id, estado):
+    def __init__(self, id, estado, capacidades=None, combustibles=None, grupo=None, version_precios=None):
         self.tipo = "HEARTBEAT"
         self.id = id
         self.estado = estado
+        # Opcional: capacidades que el emisor soporta (ej: compresión). Se
+        # envían en el heartbeat "online" y el otro extremo responde con las
+        # que acepta, lo que las habilita para esa conexión.
+        self.capacidades = capacidades or []
+        # Opcional, solo surtidores en el heartbeat "online": combustibles que
+        # despacha (None = todos) y su grupo de estación
+        self.combustibles = combustibles
+        self.grupo = grupo
+        # Opcional, solo distribuidores en el heartbeat "online": última
+        # versión del catálogo de precios de la Matriz que aplicaron
+        self.version_precios = version_precios
 
     def __repr__(self):
         return f"Heartbeat(id={self.id}, estado={self.estado})"
@@ -63,6 +223,7 @@ def serialize(message_obj) -> bytes:
         print(f"Error serializando mensaje: {e}")
         return b""
 
+@timed_stage("deserialize")
 def deserialize(message_bytes: bytes):
     """
     Convierte bytes (JSON codificado en UTF-8) en un objeto de mensaje específico.
@@ -79,9 +240,18 @@ def deserialize(message_bytes: bytes):
             data['tipo_combustible'] = data.pop('combustible')
             return PrecioUpdateMessage(**data)
             
+        elif msg_type == "PRICE_SHEET":
+            return HojaPreciosMessage(**data)
+
+        elif msg_type == "PRECIO_CATALOGO":
+            return CatalogoPreciosMessage(**data)
+
         elif msg_type == "PRECIO_LOCAL":
             data['tipo_combustible'] = data.pop('combustible')
             return PrecioLocalUpdateMessage(**data)
+
+        elif msg_type == "PRICE_SHEET_LOCAL":
+            return HojaPreciosLocalMessage(**data)
             
         elif msg_type == "TRANSACCION":
             # Renombramos 'surtidor_id' a 'surtidor' para el constructor
@@ -89,8 +259,32 @@ def deserialize(message_bytes: bytes):
             data['tipo_combustible'] = data.pop('combustible')
             return TransaccionReportMessage(**data)
             
+        elif msg_type == "RESUMEN_VENTAS":
+            return ResumenVentasMessage(**data)
+            
         elif msg_type == "HEARTBEAT":
             return HeartbeatMessage(**data)
+
+        elif msg_type == "PERFIL":
+            return PerfilMessage(**data)
+
+        elif msg_type == "REPORT_QUERY":
+            return ReportQueryMessage(**data)
+
+        elif msg_type == "REPORT_RESULT":
+            return ReportResultMessage(**data)
+
+        elif msg_type == "SLOW_DOWN":
+            return SlowDownMessage(**data)
+
+        elif msg_type == "PRECIO_APLICADO":
+            return PrecioAplicadoMessage(**data)
+
+        elif msg_type == "MULTICAST_ALTA":
+            return MulticastAltaMessage(**data)
+
+        elif msg_type == "NACK":
+            return NackMessage(**data)
             
         else:
             print(f"Error: Tipo de mensaje desconocido: {msg_type}")
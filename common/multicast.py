@@ -0,0 +1,177 @@
+# difusión de precios por UDP multicast: datagramas numerados y reparación por NACK (sobre TCP)
+import collections
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+# Nombre de la capacidad que el surtidor anuncia en su heartbeat "online"
+MULTICAST_CAPABILITY = "multicast1"
+# Interfaz por la que se envía y se escucha el multicast (0.0.0.0 = la que
+# elija el sistema; 127.0.0.1 para probar en una sola máquina)
+MULTICAST_INTERFAZ = os.environ.get('MULTICAST_INTERFAZ', '0.0.0.0')
+# Datagramas que el emisor recuerda para reparar (los más viejos se piden
+# de nuevo como caché completo)
+HISTORIAL = 1024
+# Tamaño máximo de un datagrama recibido
+MAX_DATAGRAM = 65507
+# Segundos entre latidos del emisor: acota cuánto tarda un receptor en
+# notar que perdió el último precio enviado
+LATIDO = 1.0
+
+# Header: época del emisor (cambia si reinicia), número de secuencia y
+# largo del ID del emisor, seguido del ID en UTF-8 y del mensaje (JSON).
+# Un datagrama sin mensaje es un latido: anuncia la última secuencia enviada.
+_HEADER = struct.Struct("!IQB")
+
+def parse_address(address: str) -> tuple:
+    """'239.255.10.1:5007' -> ('239.255.10.1', 5007)"""
+    group, port = address.rsplit(":", 1)
+    return group, int(port)
+
+class MulticastSender:
+    """
+    Envía cada mensaje en un datagrama con el siguiente número de secuencia
+    y guarda los últimos HISTORIAL para reenviarlos (por TCP) a quien
+    informe un hueco. El mensaje se envía ya serializado.
+    """
+    def __init__(self, address: str, sender_id: str, ttl=1):
+        self.group, self.port = parse_address(address)
+        self.address = address
+        self.sender_id = sender_id
+        self.id_bytes = sender_id.encode("utf-8")
+        self.epoch = random.getrandbits(32)
+        self.last_seq = 0
+        self.history = collections.OrderedDict() # seq -> mensaje serializado
+        self.lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(MULTICAST_INTERFAZ))
+
+    def send(self, serialize_with_seq) -> bytes:
+        """
+        Envía el mensaje que arma 'serialize_with_seq(seq)' con el siguiente
+        número de secuencia, lo guarda para reparaciones y lo retorna.
+        Tomar la secuencia, guardarla y enviarla es un solo paso bajo el lock:
+        un latido o una reparación nunca ven una secuencia sin su mensaje, y
+        los datagramas salen en orden.
+        """
+        with self.lock:
+            seq = self.last_seq + 1
+            msg_bytes = serialize_with_seq(seq)
+            self.history[seq] = msg_bytes
+            while len(self.history) > HISTORIAL:
+                self.history.popitem(last=False)
+            self.last_seq = seq
+            self._sendto(seq, msg_bytes)
+        return msg_bytes
+
+    def send_heartbeat(self):
+        """Latido: permite a los receptores detectar que perdieron el último mensaje."""
+        with self.lock:
+            self._sendto(self.last_seq, b"")
+
+    def start(self):
+        threading.Thread(target=self.run_heartbeats, daemon=True).start()
+
+    def run_heartbeats(self):
+        while True:
+            time.sleep(LATIDO)
+            self.send_heartbeat()
+
+    def _sendto(self, seq, msg_bytes):
+        datagram = _HEADER.pack(self.epoch, seq, len(self.id_bytes)) + self.id_bytes + msg_bytes
+        try:
+            self.sock.sendto(datagram, (self.group, self.port))
+        except OSError as e:
+            print(f"Error enviando multicast: {e}")
+
+    def repair(self, first: int, last: int) -> tuple:
+        """Retorna (mensajes guardados entre 'first' y 'last', True si faltó alguno)."""
+        last = min(last, self.last_seq)
+        if last < first:
+            return [], False
+        with self.lock:
+            messages = [msg_bytes for seq, msg_bytes in self.history.items() if first <= seq <= last]
+        return messages, len(messages) < last - first + 1
+
+class MulticastReceiver:
+    """
+    Escucha el grupo en su propio hilo y entrega los mensajes de un emisor
+    (el distribuidor al que estamos conectados) en orden de llegada. Si la
+    secuencia salta, llama a on_gap(primero, último) con los que faltan;
+    quien lo usa los pide por TCP (NACK). Los duplicados y atrasados se
+    descartan: las reparaciones llegan por TCP, no por aquí.
+    """
+    def __init__(self, address: str, on_message, on_gap):
+        self.group, self.port = parse_address(address)
+        self.address = address
+        self.on_message = on_message
+        self.on_gap = on_gap
+        self.lock = threading.Lock()
+        self.sender = None # (ID del emisor, época)
+        self.expected = None # Próxima secuencia esperada
+        self.last_heard = time.monotonic()
+        self.closed = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Varios receptores en el mismo host (ej: surtidores de prueba)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind(("", self.port))
+        membership = socket.inet_aton(self.group) + socket.inet_aton(MULTICAST_INTERFAZ)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+    def accept(self, sender_id: str, epoch: int, last_seq: int):
+        """Acepta al emisor desde la secuencia siguiente a 'last_seq' (la que informó al dar de alta)."""
+        with self.lock:
+            self.sender = (sender_id, epoch)
+            self.expected = last_seq + 1
+            self.last_heard = time.monotonic()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def silent_for(self) -> float:
+        """Segundos desde el último datagrama (o latido) del emisor aceptado."""
+        return time.monotonic() - self.last_heard
+
+    def run(self):
+        while not self.closed:
+            try:
+                datagram = self.sock.recv(MAX_DATAGRAM)
+            except OSError:
+                break
+            self._handle(datagram)
+
+    def _handle(self, datagram):
+        if len(datagram) < _HEADER.size:
+            return
+        epoch, seq, id_length = _HEADER.unpack_from(datagram)
+        start = _HEADER.size + id_length
+        sender = (datagram[_HEADER.size:start].decode("utf-8", "replace"), epoch)
+        msg_bytes = datagram[start:]
+
+        with self.lock:
+            if sender != self.sender:
+                return # Otro distribuidor en el mismo grupo, o uno que aún no nos aceptó
+            self.last_heard = time.monotonic()
+            # Un latido anuncia 'seq' como ya enviado; un mensaje es 'seq'
+            newest = seq if msg_bytes else seq + 1
+            gap = (self.expected, newest - 1) if newest > self.expected else None
+            deliver = bool(msg_bytes) and seq >= self.expected
+            self.expected = max(self.expected, seq + 1)
+
+        if gap:
+            self.on_gap(*gap)
+        if deliver:
+            self.on_message(msg_bytes)
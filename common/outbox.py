@@ -0,0 +1,120 @@
+# cola de salida con prioridades (un solo hilo escritor por conexión)
+import collections
+import threading
+
+from common.framer import send_frames, FLUSH_BYTES
+
+# Carriles de prioridad (menor número = más prioritario)
+PRIORIDAD_CONTROL = 0  # Heartbeats, precios y mensajes de control
+PRIORIDAD_LIVE = 1     # Transacciones en vivo
+PRIORIDAD_BACKLOG = 2  # Sincronización de pendientes
+NUM_PRIORIDADES = 3
+
+# Frames de backlog que pueden esperar en memoria. Si se llena, put() bloquea
+# al hilo de sincronización hasta que el escritor avance.
+BACKLOG_LIMIT = 1000
+
+class PriorityOutbox:
+    """
+    Agenda los envíos de una conexión por prioridad.
+
+    Todos los hilos encolan frames ya enmarcados con put(); un único hilo
+    escritor (run) los envía siempre desde el carril más prioritario que
+    tenga algo. Así un heartbeat o una transacción en vivo nunca esperan
+    detrás de miles de frames de backlog: como mucho esperan a que termine
+    el envío en curso. El escritor toma todo lo que haya encolado (hasta
+    FLUSH_BYTES, en orden de prioridad) y lo envía con un solo sendmsg.
+    """
+    def __init__(self, sock, on_error=None, backlog_limit=BACKLOG_LIMIT):
+        self.sock = sock
+        self.on_error = on_error # Se llama (una vez) si falla un envío
+        self.backlog_limit = backlog_limit
+        self.lanes = [collections.deque() for _ in range(NUM_PRIORIDADES)]
+        self.condition = threading.Condition()
+        self.closed = False
+        self.sending = False
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def put(self, framed_msg: bytes | tuple, priority=PRIORIDAD_LIVE, on_sent=None) -> bool:
+        """
+        Encola un frame (bytes o tupla de frame_parts). 'on_sent' se llama
+        desde el hilo escritor después de enviarlo. Retorna False si la
+        conexión ya está cerrada.
+        """
+        with self.condition:
+            if priority == PRIORIDAD_BACKLOG:
+                while len(self.lanes[priority]) >= self.backlog_limit and not self.closed:
+                    self.condition.wait()
+            if self.closed:
+                return False
+            self.lanes[priority].append((framed_msg, on_sent))
+            self.condition.notify_all()
+            return True
+
+    def pending(self) -> int:
+        with self.condition:
+            return sum(len(lane) for lane in self.lanes)
+
+    def wait_idle(self, timeout=None) -> bool:
+        """Espera a que se envíe todo lo encolado. Retorna False si se cerró o venció el timeout."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or (not self.sending and not any(self.lanes)),
+                timeout
+            )
+            return not self.closed and not self.sending and not any(self.lanes)
+
+    def close(self):
+        """Cierra la cola. Lo que no se alcanzó a enviar se descarta (sin llamar a on_sent)."""
+        with self.condition:
+            self.closed = True
+            for lane in self.lanes:
+                lane.clear()
+            self.condition.notify_all()
+
+    def _next_batch(self) -> list:
+        """
+        Función interna. Asume que la condición ya está adquirida.
+        Retorna [(frame, on_sent), ...] en orden de prioridad, hasta FLUSH_BYTES.
+        """
+        batch = []
+        size = 0
+        for lane in self.lanes:
+            while lane and size < FLUSH_BYTES:
+                entry = lane.popleft()
+                batch.append(entry)
+                frame = entry[0]
+                size += len(frame) if isinstance(frame, bytes) else sum(len(b) for b in frame)
+        return batch
+
+    def run(self):
+        """Bucle del hilo escritor."""
+        while True:
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+                self.condition.wait_for(lambda: self.closed or any(self.lanes))
+                if self.closed:
+                    return
+                batch = self._next_batch()
+                self.sending = True
+                self.condition.notify_all() # Libera a un put() de backlog bloqueado
+
+            try:
+                send_frames(self.sock, [framed_msg for framed_msg, _ in batch])
+            except Exception as e:
+                print(f"Error enviando frame: {e}")
+                self.close()
+                if self.on_error:
+                    self.on_error()
+                return
+
+            for _, on_sent in batch:
+                if on_sent:
+                    try:
+                        on_sent()
+                    except Exception as e:
+                        print(f"Error en callback de envío: {e}")
@@ -0,0 +1,104 @@
+# tablero de precios en memoria compartida para surtidores en el mismo host
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from common.prices import PriceSnapshot
+
+# Código interno de cada combustible: su posición en el arreglo del tablero
+COMBUSTIBLES = ["93", "95", "97", "Diesel", "Kerosene"]
+CODIGOS_COMBUSTIBLE = {combustible: code for code, combustible in enumerate(COMBUSTIBLES)}
+NOMBRE_TABLERO = "tablero_precios"
+SIN_PRECIO = -1
+
+# Layout: [secuencia][versión][precio de cada combustible], enteros de 8 bytes.
+# Formato nativo: cada campo se escribe con un solo acceso de 8 bytes alineado
+# (con "=" o "!" struct los escribe byte a byte y un lector podría ver la mitad).
+_SEQ = struct.Struct("Q")
+_DATA = struct.Struct(f"Q{len(COMBUSTIBLES)}q")
+BOARD_SIZE = _SEQ.size + _DATA.size
+
+class PriceBoard:
+    """
+    Arreglo de precios en memoria compartida protegido por un seqlock.
+
+    Un solo proceso escribe (publish): incrementa la secuencia (queda impar),
+    escribe la versión y los precios y la vuelve a incrementar (queda par).
+    Los lectores (read) leen la secuencia, los datos y otra vez la secuencia;
+    si era impar o cambió, hubo una escritura en medio y se reintenta. Leer no toma
+    locks ni hace syscalls: son lecturas de memoria del proceso.
+    """
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner # El creador es el único que escribe y el que libera el bloque
+        self.lock_writer = threading.Lock() # Solo entre hilos del proceso escritor
+
+    @classmethod
+    def create(cls, name=NOMBRE_TABLERO) -> "PriceBoard":
+        shm = shared_memory.SharedMemory(name=name, create=True, size=BOARD_SIZE)
+        _SEQ.pack_into(shm.buf, 0, 0)
+        _DATA.pack_into(shm.buf, _SEQ.size, 0, *([SIN_PRECIO] * len(COMBUSTIBLES)))
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=NOMBRE_TABLERO, child_of_creator=False) -> "PriceBoard":
+        shm = shared_memory.SharedMemory(name=name)
+        # El resource_tracker también registra a quien solo se conecta, y
+        # borraría el bloque al terminar el lector. Un hijo (multiprocessing)
+        # del creador comparte su tracker: ahí no hay que tocar el registro.
+        if not child_of_creator:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    def publish(self, prices: dict):
+        """
+        Escribe uno o más precios ({combustible: precio}) como una sola
+        actualización. Los combustibles que no están en el layout del
+        tablero (ej: uno propio de SURTIDOR_COMBUSTIBLES) se ignoran.
+        """
+        codes = [
+            (CODIGOS_COMBUSTIBLE[combustible], precio) for combustible, precio in prices.items()
+            if combustible in CODIGOS_COMBUSTIBLE
+        ]
+        unknown = [combustible for combustible in prices if combustible not in CODIGOS_COMBUSTIBLE]
+        if unknown:
+            print(f"Aviso: el tablero no tiene lugar para {', '.join(unknown)}; se ignora.")
+        if not codes:
+            return
+        with self.lock_writer:
+            (seq,) = _SEQ.unpack_from(self.buf, 0)
+            version, *values = _DATA.unpack_from(self.buf, _SEQ.size)
+            for code, precio in codes:
+                values[code] = precio
+            _SEQ.pack_into(self.buf, 0, seq + 1) # Impar: escritura en curso
+            _DATA.pack_into(self.buf, _SEQ.size, version + 1, *values)
+            _SEQ.pack_into(self.buf, 0, seq + 2)
+
+    def read(self) -> tuple:
+        """Retorna (versión, precios por código) consistentes, sin locks."""
+        spins = 0
+        while True:
+            (seq_before,) = _SEQ.unpack_from(self.buf, 0)
+            if not seq_before & 1:
+                version, *values = _DATA.unpack_from(self.buf, _SEQ.size)
+                (seq_after,) = _SEQ.unpack_from(self.buf, 0)
+                if seq_before == seq_after:
+                    return version, values
+            spins += 1
+            if spins % 100 == 0:
+                time.sleep(0) # El escritor quedó a medias (ej: sin CPU): cederle el turno
+
+    def snapshot(self) -> PriceSnapshot:
+        version, values = self.read()
+        prices = {
+            COMBUSTIBLES[code]: precio for code, precio in enumerate(values) if precio != SIN_PRECIO
+        }
+        return PriceSnapshot(prices, version)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
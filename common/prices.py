@@ -0,0 +1,48 @@
+# tablas de precios inmutables y versionadas (copy-on-write)
+from types import MappingProxyType
+
+class PriceSnapshot:
+    """
+    Copia inmutable de la tabla de precios con un número de versión.
+
+    Nadie modifica un snapshot: para cambiar un precio se crea uno nuevo con
+    with_price() y se reemplaza la referencia (self.current_prices = ...),
+    lo que en Python es atómico. Así los lectores solo leen la referencia y
+    usan el snapshot sin tomar ningún lock, y nunca ven una tabla a medias.
+    Solo los escritores deben serializarse entre sí.
+    """
+    __slots__ = ("version", "prices")
+
+    def __init__(self, prices=None, version=0):
+        self.version = version
+        self.prices = MappingProxyType(dict(prices or {}))
+
+    def with_price(self, combustible, precio) -> "PriceSnapshot":
+        """Retorna un nuevo snapshot con el precio cambiado (y la versión siguiente)."""
+        prices = dict(self.prices)
+        prices[combustible] = precio
+        return PriceSnapshot(prices, self.version + 1)
+
+    def with_prices(self, new_prices: dict) -> "PriceSnapshot":
+        """Como with_price(), pero cambia varios precios en una sola versión (ej: una hoja de precios)."""
+        prices = dict(self.prices)
+        prices.update(new_prices)
+        return PriceSnapshot(prices, self.version + 1)
+
+    def get(self, combustible, default=None):
+        return self.prices.get(combustible, default)
+
+    def items(self):
+        return self.prices.items()
+
+    def __contains__(self, combustible) -> bool:
+        return combustible in self.prices
+
+    def __getitem__(self, combustible):
+        return self.prices[combustible]
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __repr__(self) -> str:
+        return f"PriceSnapshot(v{self.version}, {dict(self.prices)})"
@@ -0,0 +1,221 @@
+# perfilado bajo demanda y timers permanentes de las rutas críticas
+import functools
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# Carpeta donde se vuelcan los perfiles (se crea al hacer el primer volcado)
+PERFIL_DIR = os.environ.get('PERFIL_DIR', 'perfiles')
+# Intervalo (segundos) entre muestras de stacks
+SAMPLE_INTERVAL = 0.005
+# Frames de tracemalloc guardados por asignación
+TRACEMALLOC_FRAMES = 10
+
+# --- Histogramas de latencia por etapa ---
+
+class LatencyHistogram:
+    """
+    Histograma de latencias con buckets en potencias de 2 (en microsegundos):
+    el bucket i cuenta las muestras en [2^(i-1), 2^i) µs. Registrar una
+    muestra es un par de operaciones aritméticas, así que puede quedar
+    activado siempre. No usa locks: con varios hilos se puede perder alguna
+    cuenta suelta, lo que no afecta a las distribuciones.
+    """
+    NUM_BUCKETS = 32 # Hasta ~35 minutos
+
+    def __init__(self, name):
+        self.name = name
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        micros = int(seconds * 1_000_000)
+        self.buckets[min(micros.bit_length(), self.NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct: float) -> float:
+        """Cota superior (en segundos) del bucket donde cae el percentil 'pct'."""
+        if not self.count:
+            return 0.0
+        target = self.count * pct / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return min((2 ** index) / 1_000_000, self.max)
+        return self.max
+
+    def summary(self) -> str:
+        if not self.count:
+            return f"{self.name}: sin muestras"
+        mean = self.total / self.count
+        return (f"{self.name}: n={self.count} media={mean * 1000:.3f}ms "
+                f"p50<={self.percentile(50) * 1000:.3f}ms p90<={self.percentile(90) * 1000:.3f}ms "
+                f"p99<={self.percentile(99) * 1000:.3f}ms max={self.max * 1000:.3f}ms")
+
+_histograms = {}
+
+def get_histogram(stage: str) -> LatencyHistogram:
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        histogram = _histograms.setdefault(stage, LatencyHistogram(stage))
+    return histogram
+
+def record_stage(stage: str, seconds: float):
+    """Registra la duración de una etapa."""
+    get_histogram(stage).record(seconds)
+
+def timed_stage(stage: str):
+    """Decorador que mide cada llamada a la función en el histograma 'stage'."""
+    def decorator(func):
+        histogram = get_histogram(stage)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.record(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def format_histograms() -> str:
+    return "\n".join(_histograms[stage].summary() for stage in sorted(_histograms))
+
+# --- Muestreo de stacks ---
+
+class StackSampler:
+    """
+    Toma una muestra de los stacks de TODOS los hilos cada SAMPLE_INTERVAL
+    (a diferencia de cProfile, que solo perfila el hilo que lo activa) y
+    cuenta cuántas veces aparece cada stack. El volcado usa el formato
+    "folded" (una línea por stack con su cuenta), compatible con flamegraph.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.running = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.running.is_set():
+            return
+        if self.thread is not None:
+            # Un stop() reciente: el hilo anterior puede seguir en su sleep y,
+            # si viera 'running' de nuevo, quedarían dos muestreando
+            self.thread.join()
+        self.counts = {}
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while self.running.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            time.sleep(self.interval)
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as out:
+            for stack, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+                out.write(f"{stack} {count}\n")
+
+# --- Control en tiempo de ejecución ---
+
+class ProfilingControl:
+    """
+    Activa, detiene y vuelca el perfilado de un proceso sin reiniciarlo.
+    Acciones: "start" (muestreo de stacks + tracemalloc), "stop", "toggle"
+    y "dump" (escribe stacks, snapshot de memoria e histogramas en PERFIL_DIR).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.sampler = StackSampler()
+        self.lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.sampler.running.is_set()
+
+    def handle(self, accion: str):
+        with self.lock:
+            if accion == "start":
+                self._start()
+            elif accion == "stop":
+                self._stop()
+            elif accion == "toggle":
+                if self.active:
+                    self._stop()
+                else:
+                    self._start()
+            elif accion == "dump":
+                self._dump()
+            else:
+                print(f"Acción de perfilado desconocida: {accion}")
+
+    def _start(self):
+        self.sampler.start()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        print(f"🔬 Perfilado activado en {self.name}.")
+
+    def _stop(self):
+        self._dump() # Detener siempre deja un volcado
+        self.sampler.stop()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        print(f"🔬 Perfilado desactivado en {self.name}.")
+
+    def _dump(self):
+        os.makedirs(PERFIL_DIR, exist_ok=True)
+        prefix = os.path.join(
+            PERFIL_DIR, f"{self.name}-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        )
+        with open(f"{prefix}.latencias.txt", "w", encoding="utf-8") as out:
+            out.write(format_histograms() + "\n")
+        if self.sampler.counts:
+            self.sampler.dump(f"{prefix}.stacks.folded")
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            snapshot.dump(f"{prefix}.tracemalloc")
+            with open(f"{prefix}.memoria.txt", "w", encoding="utf-8") as out:
+                for stat in snapshot.statistics("lineno")[:50]:
+                    out.write(f"{stat}\n")
+        print(f"🔬 Perfil volcado en {prefix}.*")
+
+def install_signal_handlers(control: ProfilingControl):
+    """
+    SIGUSR1 activa/desactiva el perfilado y SIGUSR2 hace un volcado.
+    Solo en POSIX y desde el hilo principal (en Windows usar el mensaje PERFIL).
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    # El trabajo se hace en otro hilo: el handler corre en el hilo principal
+    # y no debe bloquearse escribiendo archivos.
+    def on_signal(accion):
+        return lambda signum, frame: threading.Thread(
+            target=control.handle, args=(accion,), daemon=True
+        ).start()
+    signal.signal(signal.SIGUSR1, on_signal("toggle"))
+    signal.signal(signal.SIGUSR2, on_signal("dump"))
@@ -0,0 +1,50 @@
+# política de reconexión compartida (backoff exponencial con jitter)
+import random
+
+class ReconnectPolicy:
+    """
+    Calcula la espera entre intentos de reconexión.
+
+    - El primer reintento es inmediato (fast-path): una caída breve del
+      otro extremo se recupera sin esperar.
+    - Los siguientes usan backoff exponencial con tope y "full jitter":
+      espera = random(0, min(tope, base * 2^intento)).
+      Así los clientes que perdieron la conexión al mismo tiempo (ej: la
+      Matriz se reinició) no vuelven a conectarse todos juntos.
+    """
+    def __init__(self, base_delay=0.5, max_delay=30.0, immediate_first=True):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.immediate_first = immediate_first
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        """Retorna los segundos a esperar antes del próximo intento."""
+        attempt = self.attempt
+        self.attempt += 1
+
+        if self.immediate_first:
+            if attempt == 0:
+                return 0.0
+            attempt -= 1
+
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def reset(self):
+        """Se llama tras un intercambio exitoso (el otro extremo ya respondió), no al conectar."""
+        self.attempt = 0
+
+def sync_start_delay(backlog_size: int, per_item=0.002, max_delay=20.0) -> float:
+    """
+    Retraso (con jitter) antes de iniciar la sincronización de pendientes.
+
+    La ventana crece con el tamaño del backlog: los clientes con poco
+    pendiente sincronizan casi de inmediato y los que traen backlogs grandes
+    se reparten en el tiempo, en vez de empezar todos juntos tras una
+    reconexión masiva.
+    """
+    if backlog_size <= 0:
+        return 0.0
+    window = min(max_delay, backlog_size * per_item)
+    return random.uniform(0, window)
@@ -0,0 +1,31 @@
+# trazas de propagación de precios: un ID y una marca de tiempo por salto
+import time
+import uuid
+
+# Saltos que se marcan en el camino de un precio, en orden
+SALTO_MATRIZ_ENVIA = "matriz_envia"
+SALTO_DISTRIBUIDOR_RECIBE = "distribuidor_recibe"
+SALTO_DISTRIBUIDOR_ENVIA = "distribuidor_envia"
+SALTO_SURTIDOR_RECIBE = "surtidor_recibe"
+SALTO_SURTIDOR_APLICA = "surtidor_aplica"
+
+# La traza viaja en los mensajes de precio como {"id": ..., "saltos": [[salto, epoch], ...]}.
+# Las marcas usan el reloj de pared de cada host (time.time): entre hosts
+# distintos, el desfase de los relojes se suma al tiempo de red.
+
+def new_trace() -> dict:
+    return {"id": uuid.uuid4().hex[:12], "saltos": [[SALTO_MATRIZ_ENVIA, time.time()]]}
+
+def add_hop(traza: dict | None, salto: str) -> dict | None:
+    """
+    Retorna una copia de la traza con 'salto' marcado ahora (None si el
+    mensaje no traía traza). No modifica la original: un gateway entrega el
+    mismo mensaje a todos sus surtidores.
+    """
+    if traza is None:
+        return None
+    return {"id": traza["id"], "saltos": traza["saltos"] + [[salto, time.time()]]}
+
+def hop_times(traza: dict) -> dict:
+    """{salto: epoch} de una traza."""
+    return {salto: timestamp for salto, timestamp in traza["saltos"]}
@@ -0,0 +1,150 @@
+# registro de surtidores del distribuidor: conexiones, combustibles y grupos de estación
+import threading
+import time
+
+class SurtidorInfo:
+    """Lo que el distribuidor sabe de un surtidor (lo anuncia en su heartbeat "online")."""
+    def __init__(self, id, sock, channel, combustibles, grupo):
+        self.id = id
+        self.sock = sock         # Conexión por la que llega (la del gateway si tiene canal)
+        self.channel = channel   # Canal dentro del gateway (None = conexión propia)
+        self.combustibles = combustibles # frozenset, o None = todos
+        self.grupo = grupo       # Grupo de estación (None = sin grupo)
+        self.last_seen = time.time()
+
+    def sells(self, combustible) -> bool:
+        return self.combustibles is None or combustible in self.combustibles
+
+class SurtidorRegistry:
+    """
+    Conexiones de surtidores y los surtidores anunciados en cada una, con
+    índices por combustible y por grupo para que un precio salga solo por
+    las conexiones que lo necesitan. Registrar y quitar son O(1) (O(k) para
+    una conexión de gateway con k surtidores).
+
+    Un gateway reparte el precio a sus surtidores, así que el destino es
+    siempre la conexión: los índices cuentan cuántos surtidores de cada
+    conexión venden cada combustible. Una conexión que todavía no anunció
+    ningún surtidor recibe todo, como antes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {} # socket -> set de IDs de surtidores anunciados en él
+        self.pumps = {}       # ID -> SurtidorInfo
+        self.by_fuel = {}     # combustible -> {socket: surtidores que lo venden}
+        self.all_fuels = {}   # socket -> surtidores que venden todo (sin lista de combustibles)
+        self.by_group = {}    # grupo -> set de IDs
+        self.multicast = set() # Conexiones que reciben los precios generales por multicast
+
+    def __len__(self):
+        return len(self.connections)
+
+    def add_connection(self, sock):
+        with self.lock:
+            self.connections.setdefault(sock, set())
+
+    def remove_connection(self, sock) -> int:
+        """Quita una conexión y sus surtidores. Retorna cuántos surtidores tenía."""
+        with self.lock:
+            pump_ids = self.connections.pop(sock, None)
+            self.multicast.discard(sock)
+            if pump_ids is None:
+                return 0
+            for pump_id in pump_ids:
+                self._unindex(self.pumps.pop(pump_id))
+            return len(pump_ids)
+
+    def register(self, surtidor_id, sock, channel=None, combustibles=None, grupo=None) -> SurtidorInfo:
+        """Anota (o reemplaza, si reconectó) un surtidor en la conexión 'sock'."""
+        info = SurtidorInfo(
+            surtidor_id, sock, channel,
+            frozenset(combustibles) if combustibles is not None else None, grupo or None
+        )
+        with self.lock:
+            old = self.pumps.get(surtidor_id)
+            if old is not None:
+                self._unindex(old)
+                self.connections.get(old.sock, set()).discard(surtidor_id)
+            if sock not in self.connections:
+                return info # La conexión ya se cerró
+            self.pumps[surtidor_id] = info
+            self.connections[sock].add(surtidor_id)
+            self._index(info)
+        return info
+
+    def set_multicast(self, sock, enabled: bool) -> bool:
+        """Marca (o desmarca) una conexión como receptora de multicast. Retorna el estado anterior."""
+        with self.lock:
+            previous = sock in self.multicast
+            if not enabled:
+                self.multicast.discard(sock)
+            elif sock in self.connections:
+                self.multicast.add(sock)
+            return previous
+
+    def touch(self, surtidor_id):
+        info = self.pumps.get(surtidor_id)
+        if info is not None:
+            info.last_seen = time.time()
+
+    def get(self, surtidor_id) -> SurtidorInfo | None:
+        return self.pumps.get(surtidor_id)
+
+    def targets(self, combustible=None, grupo=None, skip_multicast=False) -> list:
+        """
+        Conexiones a las que hay que enviar un mensaje: las que tienen algún
+        surtidor que vende 'combustible' (o todas, si es None), limitadas al
+        grupo 'grupo' si se indica. Con 'skip_multicast' se omiten las que
+        ya lo reciben por multicast.
+        """
+        targets = self._targets(combustible, grupo)
+        if skip_multicast and self.multicast:
+            with self.lock:
+                targets = [sock for sock in targets if sock not in self.multicast]
+        return targets
+
+    def _targets(self, combustible, grupo) -> list:
+        with self.lock:
+            if grupo is not None:
+                pump_ids = self.by_group.get(grupo, ())
+                return list({
+                    self.pumps[pump_id].sock for pump_id in pump_ids
+                    if combustible is None or self.pumps[pump_id].sells(combustible)
+                })
+            if combustible is None:
+                return list(self.connections)
+            targets = set(self.by_fuel.get(combustible, ()))
+            targets.update(self.all_fuels)
+            # Recién conectados, todavía sin anunciarse: reciben todo
+            targets.update(sock for sock, pump_ids in self.connections.items() if not pump_ids)
+            return list(targets)
+
+    def _index(self, info):
+        """Función interna. Asume que el lock ya está adquirido."""
+        if info.combustibles is None:
+            _count(self.all_fuels, info.sock, 1)
+        else:
+            for combustible in info.combustibles:
+                _count(self.by_fuel.setdefault(combustible, {}), info.sock, 1)
+        if info.grupo is not None:
+            self.by_group.setdefault(info.grupo, set()).add(info.id)
+
+    def _unindex(self, info):
+        """Función interna. Asume que el lock ya está adquirido."""
+        if info.combustibles is None:
+            _count(self.all_fuels, info.sock, -1)
+        else:
+            for combustible in info.combustibles:
+                _count(self.by_fuel[combustible], info.sock, -1)
+        if info.grupo is not None:
+            group = self.by_group[info.grupo]
+            group.discard(info.id)
+            if not group:
+                del self.by_group[info.grupo]
+
+def _count(counts, sock, delta):
+    total = counts.get(sock, 0) + delta
+    if total > 0:
+        counts[sock] = total
+    else:
+        counts.pop(sock, None)
@@ -4,20 +4,45 @@ import threading
 import sys
 import os
 import time
+import json
 import sqlite3 # para almacenamiento local de transacciones 
-from datetime import datetime # para timestamps de sqlite
 
 # --- INICIO: Hack para importar 'common' ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 sys.path.append(project_root)
 
-from common.framer import frame_message, receive_message
+from common.framer import (
+    frame_message, frame_parts, receive_message, receive_frame,
+    send_frame, send_frames, queue_frame, set_nodelay, COMPRESSION_CAPABILITY
+)
+from common.reconnect import ReconnectPolicy, sync_start_delay
+from common.outbox import (
+    PriorityOutbox,
+    PRIORIDAD_CONTROL, PRIORIDAD_LIVE, PRIORIDAD_BACKLOG
+)
+from common.admission import AdmissionQueue
+from common.heartbeat import (
+    IdleReaper, close_idle_socket,
+    HEARTBEAT_INTERVAL, READ_TIMEOUT, ESTADO_ALIVE
+)
+from common.prices import PriceSnapshot
+from common.tracing import add_hop, SALTO_DISTRIBUIDOR_RECIBE, SALTO_DISTRIBUIDOR_ENVIA
+from common.multicast import MulticastSender, MULTICAST_CAPABILITY
+from common.profiling import ProfilingControl, install_signal_handlers, timed_stage
+from common.dimensions import (
+    DimensionCache, create_dimension_tables, fill_dimensions, SQL_DATETIME_A_MS,
+    DIM_DISTRIBUIDORES, DIM_SURTIDORES, DIM_COMBUSTIBLES
+)
 from common.messages import (
     serialize, deserialize, 
     PrecioUpdateMessage, PrecioLocalUpdateMessage,
-    TransaccionReportMessage, HeartbeatMessage
+    TransaccionReportMessage, ResumenVentasMessage, HeartbeatMessage, PerfilMessage,
+    ReportQueryMessage, ReportResultMessage, SlowDownMessage, PrecioAplicadoMessage,
+    CatalogoPreciosMessage, MulticastAltaMessage, NackMessage,
+    HojaPreciosMessage, HojaPreciosLocalMessage
 )
+from distribuidor.registry import SurtidorRegistry
 # --- FIN: Hack para importar 'common' ---
 
 # --- Configuración del Distribuidor ---
@@ -25,32 +50,89 @@ MATRIZ_HOST = os.environ.get('MATRIZ_HOST', '127.0.0.1')
 MATRIZ_PORT = 65432
 # Factor de utilidad (ej: 15% de margen)
 UTILIDAD_FACTOR = 1.15 
-# Tiempo (en segundos) para reintentar la conexión a la Matriz
-RECONNECT_DELAY = 5 
+# Backoff (en segundos) para reintentar la conexión a la Matriz
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+# Modo pre-agregado: si es > 0, las ventas no se reenvían una a una sino como
+# resúmenes por intervalo de este largo (en segundos). 0 = modo normal.
+AGREGACION_INTERVALO = int(os.environ.get('AGREGACION_INTERVALO', '0'))
+# Cada cuántas transacciones enviadas se marcan como sincronizadas (un solo UPDATE)
+SYNC_BATCH_SIZE = 500
+# Control de admisión: reportes por segundo (y ráfaga) que se aceptan de cada
+# surtidor y del total de surtidores del distribuidor. 0 = sin límite.
+LIMITE_SURTIDOR_TPS = float(os.environ.get('LIMITE_SURTIDOR_TPS', '5'))
+RAFAGA_SURTIDOR = int(os.environ.get('RAFAGA_SURTIDOR', '20'))
+LIMITE_DISTRIBUIDOR_TPS = float(os.environ.get('LIMITE_DISTRIBUIDOR_TPS', '200'))
+RAFAGA_DISTRIBUIDOR = int(os.environ.get('RAFAGA_DISTRIBUIDOR', '400'))
+# Reportes en espera a partir de los cuales se le pide al surtidor que frene (SLOW_DOWN)
+UMBRAL_SLOW_DOWN = 10
+# Grupo multicast para los precios generales, ej: "239.255.10.1:5007" (vacío = solo TCP).
+# Los surtidores que lo aceptan dejan de recibir esos precios por TCP.
+MULTICAST_PRECIOS = os.environ.get('MULTICAST_PRECIOS', '')
 
 class DistribuidorServer:
-    def __init__(self, id, host, port):
+    def __init__(self, id, host, port, aggregation_interval=AGREGACION_INTERVALO):
         self.id = id
         self.host = host  # IP en la que escucha a los Surtidores
         self.port = port  # Puerto en el que escucha a los Surtidores
+        self.aggregation_interval = aggregation_interval # 0 = sin pre-agregación
         
         # ---  Base de datos local --- #
         self.db_path = f"distribuidor/db_local_{self.id}.sqlite"
+        self.dimensions = DimensionCache(self.db_path) # Nombre -> código de cada dimensión
         self._init_db() # Llama a la función de la base de datos
 
         # --- Estado del Servidor (Nivel 2) ---
         self.server_socket = None # Socket para escuchar a los Surtidores
-        self.surtidores = [] # Lista de sockets de surtidores conectados
-        self.lock_surtidores = threading.Lock() # Lock para la lista de surtidores
+        # Conexiones de surtidores y lo que anunció cada surtidor (combustibles, grupo)
+        self.surtidores = SurtidorRegistry()
+        # Un solo datagrama por precio para todos los surtidores que lo aceptan
+        self.multicast = MulticastSender(MULTICAST_PRECIOS, self.id) if MULTICAST_PRECIOS else None
+        # Cierra surtidores (y la Matriz) que dejan de enviar heartbeats
+        self.reaper = IdleReaper(name=f"distribuidor {self.id}")
+        # Perfilado bajo demanda (señales o mensaje PERFIL de la Matriz)
+        self.profiling = ProfilingControl(f"distribuidor-{self.id}")
+        # Los reportes de surtidores se guardan y reenvían desde un solo hilo,
+        # por turnos entre surtidores y respetando los límites de tasa
+        self.admission = AdmissionQueue(
+            self._process_transaction,
+            LIMITE_SURTIDOR_TPS, RAFAGA_SURTIDOR,
+            LIMITE_DISTRIBUIDOR_TPS, RAFAGA_DISTRIBUIDOR
+        )
         
         # --- Caché Local y Lógica de Negocio ---
-        self.current_prices = {} # Ej: {'95': 1650, '93': 1600}
+        # Snapshot inmutable, ej: {'95': 1650, '93': 1600}. Se lee sin lock;
+        # lock_prices solo serializa a los que lo reemplazan.
+        self.current_prices = PriceSnapshot()
         self.lock_prices = threading.Lock()
+        # Precios propios de un grupo de estación: grupo -> {combustible: precio}.
+        # Un precio general posterior del mismo combustible los reemplaza.
+        self.group_prices = {}
+        # Versión del catálogo de la Matriz de cada precio en caché:
+        # (grupo o '', combustible) -> versión. Viaja con los precios que se
+        # reenvían, para que el surtidor no los tome por más nuevos que sus hojas.
+        self.price_versions = {}
+        # Última versión del catálogo de precios de la Matriz aplicada. Se
+        # informa al reconectar para recibir solo los precios que faltan.
+        self.matriz_price_version = 0
+        # Hojas de precios en espera de su hora de vigencia:
+        # [{"id", "precios", "vigencia_ms", "grupo", "version"}]
+        self.staged_sheets = []
+        # Los precios también se guardan en la BD local: tras un reinicio se
+        # sirven de inmediato, aunque la Matriz no esté disponible
+        self._load_price_cache()
+        self._load_staged_sheets()
         
         # --- Estado del Cliente (Nivel 2 -> 3) ---
         self.socket_to_matriz = None # Socket conectado a la Matriz
+        # Cola de salida con prioridades hacia la Matriz: control > en vivo > backlog.
+        # Su hilo escritor es el único que escribe en socket_to_matriz.
+        self.outbox_matriz = None
         self.lock_matriz_socket = threading.Lock()
         self.is_connected_to_matriz = threading.Event() # Flag para saber el estado
+        # Se activa cuando la Matriz confirma la compresión en esta conexión
+        self.matriz_compression = False
+        self.reconnect_policy = ReconnectPolicy(RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY)
 
     # --- INICIO: Funciones de Base de Datos ---
 
@@ -61,20 +143,20 @@ class DistribuidorServer:
             
             conn = sqlite3.connect(self.db_path, check_same_thread=False)
             cursor = conn.cursor()
+            columns = [row[1] for row in cursor.execute("PRAGMA table_info(transacciones)")]
+            if "timestamp" in columns:
+                self._migrate_v1(conn)
+            else:
+                self._create_tables(cursor)
             
-            # Crear tabla de transacciones
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transacciones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME NOT NULL,
-                surtidor_id TEXT NOT NULL,
-                combustible TEXT NOT NULL,
-                litros REAL NOT NULL,
-                cargas INTEGER NOT NULL,
-                distribuidor_id TEXT NOT NULL,
-                sincronizado_matriz INTEGER DEFAULT 0 
-            )
-            """)
+            # BD nueva o migrada: se calculan los totales una sola vez
+            if cursor.execute("SELECT COUNT(*) FROM totales").fetchone()[0] == 0:
+                cursor.execute("""
+                INSERT INTO totales (surtidor_cod, combustible_cod, litros, cargas)
+                SELECT surtidor_cod, combustible_cod, SUM(litros), SUM(cargas)
+                FROM transacciones
+                GROUP BY surtidor_cod, combustible_cod
+                """)
             
             conn.commit()
             conn.close()
@@ -82,29 +164,130 @@ class DistribuidorServer:
         except Exception as e:
             print(f"Error inicializando la base de datos: {e}")
 
+    def _create_tables(self, cursor):
+        # Crear tabla de transacciones. IDs y combustibles son códigos de las
+        # tablas de dimensiones; la hora es epoch en milisegundos.
+        create_dimension_tables(cursor)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transacciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp_ms INTEGER NOT NULL,
+            surtidor_cod INTEGER NOT NULL,
+            combustible_cod INTEGER NOT NULL,
+            litros REAL NOT NULL,
+            cargas INTEGER NOT NULL,
+            distribuidor_cod INTEGER NOT NULL,
+            sincronizado_matriz INTEGER DEFAULT 0 -- 0 = pendiente, 1 = enviada sola, 2 = en un resumen
+        )
+        """)
+
+        # Totales acumulados por surtidor y combustible. Se actualizan con
+        # cada venta, así las consultas de reportes de la Matriz se
+        # responden sin recorrer todo el historial.
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS totales (
+            surtidor_cod INTEGER NOT NULL,
+            combustible_cod INTEGER NOT NULL,
+            litros REAL NOT NULL,
+            cargas INTEGER NOT NULL,
+            PRIMARY KEY (surtidor_cod, combustible_cod)
+        )
+        """)
+
+        # Caché de precios finales. grupo = '' es el precio general; version
+        # es la del catálogo de la Matriz con que llegó; hora en epoch ms.
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS precios (
+            grupo TEXT NOT NULL DEFAULT '',
+            combustible TEXT NOT NULL,
+            precio INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            actualizado_ms INTEGER NOT NULL,
+            PRIMARY KEY (grupo, combustible)
+        )
+        """)
+
+        # Hojas de precios (precios finales en JSON) que todavía no entran en
+        # vigencia. Se borran al aplicarse.
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS hojas_precios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grupo TEXT NOT NULL DEFAULT '',
+            precios TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            vigencia_ms INTEGER NOT NULL
+        )
+        """)
+
+    def _migrate_v1(self, conn):
+        """
+        Convierte una BD con el esquema anterior (IDs y combustibles como
+        texto, hora como DATETIME) al esquema con dimensiones. Conserva los
+        IDs y el estado de sincronización de cada transacción.
+        """
+        print(f"🔧 Migrando {self.db_path} al esquema con tablas de dimensiones...")
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute("ALTER TABLE transacciones RENAME TO transacciones_v1")
+            cursor.execute("DROP TABLE IF EXISTS totales") # Se recalcula desde las transacciones
+            self._create_tables(cursor)
+            fill_dimensions(cursor, {
+                DIM_DISTRIBUIDORES: "SELECT DISTINCT distribuidor_id FROM transacciones_v1",
+                DIM_SURTIDORES: "SELECT DISTINCT surtidor_id FROM transacciones_v1",
+                DIM_COMBUSTIBLES: "SELECT DISTINCT combustible FROM transacciones_v1",
+            })
+            cursor.execute(f"""
+            INSERT INTO transacciones
+                (id, timestamp_ms, surtidor_cod, combustible_cod, litros, cargas,
+                 distribuidor_cod, sincronizado_matriz)
+            SELECT t.id, {SQL_DATETIME_A_MS.format(columna="t.timestamp")}, s.cod, c.cod,
+                   t.litros, t.cargas, d.cod, t.sincronizado_matriz
+            FROM transacciones_v1 t
+            JOIN dim_surtidores s ON s.nombre = t.surtidor_id
+            JOIN dim_combustibles c ON c.nombre = t.combustible
+            JOIN dim_distribuidores d ON d.nombre = t.distribuidor_id
+            """)
+            cursor.execute("DROP TABLE transacciones_v1")
+        except Exception:
+            conn.rollback()
+            raise
+
+    @timed_stage("distribuidor._save_transaction")
     def _save_transaction(self, msg: TransaccionReportMessage) -> int | None:
         """Guarda un reporte de transacción y retorna su ID de BD."""
         try:
+            # Antes de abrir la transacción: un nombre nuevo se inserta en su dimensión
+            surtidor_cod = self.dimensions.encode(DIM_SURTIDORES, msg.surtidor_id)
+            combustible_cod = self.dimensions.encode(DIM_COMBUSTIBLES, msg.combustible)
+            distribuidor_cod = self.dimensions.encode(DIM_DISTRIBUIDORES, self.id) # El ID de este distribuidor
+
             conn = sqlite3.connect(self.db_path, check_same_thread=False)
             cursor = conn.cursor()
             
             sql = """
             INSERT INTO transacciones 
-                (timestamp, surtidor_id, combustible, litros, cargas, distribuidor_id) 
+                (timestamp_ms, surtidor_cod, combustible_cod, litros, cargas, distribuidor_cod) 
             VALUES (?, ?, ?, ?, ?, ?)
             """
             
             params = (
-                datetime.now(),
-                msg.surtidor_id,
-                msg.combustible,
+                int(time.time() * 1000),
+                surtidor_cod,
+                combustible_cod,
                 msg.litros,
                 msg.cargas,
-                self.id # El ID de este distribuidor
+                distribuidor_cod
             )
             
             cursor.execute(sql, params)
             new_id = cursor.lastrowid # <--- OBTENER EL ID
+            cursor.execute("""
+            INSERT INTO totales (surtidor_cod, combustible_cod, litros, cargas) VALUES (?, ?, ?, ?)
+            ON CONFLICT (surtidor_cod, combustible_cod) DO UPDATE SET
+                litros = litros + excluded.litros,
+                cargas = cargas + excluded.cargas
+            """, (surtidor_cod, combustible_cod, msg.litros, msg.cargas))
             conn.commit()
             conn.close()
             return new_id # <--- RETORNAR EL ID
@@ -126,6 +309,203 @@ class DistribuidorServer:
         except Exception as e:
             print(f"Error actualizando estado sync de {db_id}: {e}")
 
+    def _update_transactions_sync_status(self, db_ids: list):
+        """Marca un lote de transacciones como sincronizadas (una sola transacción de BD)."""
+        if not db_ids:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            sql = "UPDATE transacciones SET sincronizado_matriz = 1 WHERE id = ?"
+            cursor.executemany(sql, [(db_id,) for db_id in db_ids])
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error actualizando estado sync de {len(db_ids)} transacciones: {e}")
+
+    def _fetch_local_totals(self) -> list:
+        """Retorna [combustible, litros, cargas] con el total histórico de este distribuidor."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            cursor.execute("""
+            SELECT c.nombre, SUM(t.litros), SUM(t.cargas)
+            FROM totales t
+            JOIN dim_combustibles c ON c.cod = t.combustible_cod
+            GROUP BY t.combustible_cod
+            """)
+            rows = [list(row) for row in cursor.fetchall()]
+            conn.close()
+            return rows
+        except Exception as e:
+            print(f"Error calculando totales locales: {e}")
+            return []
+
+    # Expresión SQL que calcula el inicio del intervalo (epoch en segundos) de una fila
+    SQL_INTERVALO = "timestamp_ms / 1000 / :dur * :dur"
+
+    def _fetch_closed_intervals(self) -> list[int]:
+        """Retorna los intervalos ya cerrados que tienen transacciones sin sincronizar."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            sql = f"""
+            SELECT DISTINCT {self.SQL_INTERVALO} AS intervalo
+            FROM transacciones
+            WHERE sincronizado_matriz = 0
+              AND intervalo < :ahora / :dur * :dur
+            ORDER BY intervalo ASC
+            """
+            cursor.execute(sql, {"dur": self.aggregation_interval, "ahora": int(time.time())})
+            intervals = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            return intervals
+        except Exception as e:
+            print(f"Error consultando intervalos pendientes: {e}")
+            return []
+
+    def _summarize_interval(self, intervalo: int) -> tuple:
+        """
+        Totales de un intervalo agrupados por surtidor y combustible. Retorna
+        (filas, mayor ID resumido).
+        """
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            # Se suman las pendientes y las que ya iban en un resumen anterior,
+            # para que reenviar el resumen reemplace el anterior sin duplicar.
+            # Las que ya se enviaron solas (ej: antes de activar el modo) no:
+            # la Matriz ya las contó.
+            params = {"dur": self.aggregation_interval, "intervalo": intervalo}
+            sql = f"""
+            SELECT s.nombre, c.nombre, SUM(t.litros), SUM(t.cargas)
+            FROM transacciones t
+            JOIN dim_surtidores s ON s.cod = t.surtidor_cod
+            JOIN dim_combustibles c ON c.cod = t.combustible_cod
+            WHERE {self.SQL_INTERVALO} = :intervalo AND t.sincronizado_matriz != 1
+            GROUP BY t.surtidor_cod, t.combustible_cod
+            """
+            cursor.execute(sql, params)
+            filas = [list(row) for row in cursor.fetchall()]
+            max_id = cursor.execute(
+                f"SELECT COALESCE(MAX(id), 0) FROM transacciones WHERE {self.SQL_INTERVALO} = :intervalo", params
+            ).fetchone()[0]
+            conn.close()
+            return filas, max_id
+        except Exception as e:
+            print(f"Error resumiendo intervalo {intervalo}: {e}")
+            return [], 0
+
+    def _update_interval_sync_status(self, intervalo: int, max_id: int):
+        """Marca como resumidas las transacciones pendientes del intervalo que entraron en el resumen."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            sql = f"""
+            UPDATE transacciones SET sincronizado_matriz = 2
+            WHERE {self.SQL_INTERVALO} = :intervalo AND sincronizado_matriz = 0 AND id <= :max_id
+            """
+            cursor.execute(sql, {"dur": self.aggregation_interval, "intervalo": intervalo, "max_id": max_id})
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error actualizando estado sync del intervalo {intervalo}: {e}")
+
+    def _load_price_cache(self):
+        """Carga el caché de precios (general y por grupo) guardado en la BD local."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            rows = conn.execute("SELECT grupo, combustible, precio, version, actualizado_ms FROM precios").fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"Error cargando el caché de precios: {e}")
+            return
+        if not rows:
+            return
+
+        general = {comb: precio for grupo, comb, precio, _, _ in rows if not grupo}
+        version = max(row[3] for row in rows)
+        with self.lock_prices:
+            self.current_prices = PriceSnapshot(general, version)
+            self.matriz_price_version = version
+            for grupo, comb, precio, row_version, _ in rows:
+                self.price_versions[(grupo, comb)] = row_version
+                if grupo:
+                    self.group_prices.setdefault(grupo, {})[comb] = precio
+        age = time.time() - min(row[4] for row in rows) / 1000
+        print(f"💾 Caché de precios cargado (v{version}): {len(general)} precios generales, "
+              f"{len(rows) - len(general)} de grupo, el más antiguo de hace {age / 60:.0f} min.")
+
+    def _save_prices(self, precios: dict, grupo, version):
+        """Guarda precios del caché en la BD local (un precio general borra los de grupo más viejos)."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            now_ms = int(time.time() * 1000)
+            for combustible, precio_final in precios.items():
+                if not grupo:
+                    cursor.execute("DELETE FROM precios WHERE combustible = ? AND grupo != '' AND (? = 0 OR version < ?)",
+                                   (combustible, version, version))
+                cursor.execute("""
+                INSERT INTO precios (grupo, combustible, precio, version, actualizado_ms) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (grupo, combustible) DO UPDATE SET
+                    precio = excluded.precio,
+                    version = excluded.version,
+                    actualizado_ms = excluded.actualizado_ms
+                """, (grupo or '', combustible, precio_final, version, now_ms))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error guardando precios de {', '.join(precios)} en BD local: {e}")
+
+    def _load_staged_sheets(self):
+        """Vuelve a dejar en espera las hojas de precios guardadas (las vencidas se aplican ya)."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            rows = conn.execute("SELECT id, grupo, precios, version, vigencia_ms FROM hojas_precios ORDER BY id").fetchall()
+            # Versión con que se guardó cada precio del caché, para descartar
+            # lo que un precio posterior ya reemplazó
+            saved = {(grupo, comb): version for grupo, comb, version in conn.execute(
+                "SELECT grupo, combustible, version FROM precios"
+            )}
+            conn.close()
+        except Exception as e:
+            print(f"Error cargando hojas de precios: {e}")
+            return
+        for sheet_id, grupo, precios_json, version, vigencia_ms in rows:
+            precios = {
+                comb: precio for comb, precio in json.loads(precios_json).items()
+                if saved.get((grupo, comb), 0) <= version and saved.get(('', comb), 0) <= version
+            }
+            sheet = {"id": sheet_id, "precios": precios, "vigencia_ms": vigencia_ms,
+                     "grupo": grupo or None, "version": version}
+            self.matriz_price_version = max(self.matriz_price_version, version)
+            print(f"💾 Hoja de precios v{version} en espera ({len(precios)} precios).")
+            self._schedule_sheet(sheet)
+
+    def _save_staged_sheet(self, sheet) -> int | None:
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.execute(
+                "INSERT INTO hojas_precios (grupo, precios, version, vigencia_ms) VALUES (?, ?, ?, ?)",
+                (sheet["grupo"] or '', json.dumps(sheet["precios"]), sheet["version"], sheet["vigencia_ms"])
+            )
+            conn.commit()
+            conn.close()
+            return cursor.lastrowid
+        except Exception as e:
+            print(f"Error guardando hoja de precios en BD local: {e}")
+            return None
+
+    def _delete_staged_sheet(self, sheet_id):
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("DELETE FROM hojas_precios WHERE id = ?", (sheet_id,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error borrando hoja de precios de BD local: {e}")
+
     # --- FIN: Funciones de Base de Datos ---
 
     def start(self):
@@ -142,6 +522,23 @@ class DistribuidorServer:
             daemon=True
         )
         client_thread.start()
+
+        self.reaper.start()
+        self.admission.start()
+        if self.multicast:
+            self.multicast.start()
+        heartbeat_thread = threading.Thread(
+            target=self.run_heartbeats,
+            daemon=True
+        )
+        heartbeat_thread.start()
+
+        if self.aggregation_interval:
+            aggregation_thread = threading.Thread(
+                target=self.run_aggregation,
+                daemon=True
+            )
+            aggregation_thread.start()
         
         print(f"📦 Distribuidor '{self.id}' iniciado.")
         print(f"   -> Escuchando surtidores en: {self.host}:{self.port}")
@@ -159,9 +556,11 @@ class DistribuidorServer:
             try:
                 client_socket, addr = self.server_socket.accept()
                 print(f"⛽ Nuevo Surtidor conectado desde {addr}")
+                client_socket.settimeout(READ_TIMEOUT) # Deadline de lectura
+                set_nodelay(client_socket)
 
-                with self.lock_surtidores:
-                    self.surtidores.append(client_socket)
+                self.surtidores.add_connection(client_socket)
+                self.reaper.register(client_socket, close_idle_socket)
                 
                 handler_thread = threading.Thread(
                     target=self.handle_surtidor, 
@@ -174,99 +573,299 @@ class DistribuidorServer:
                 print(f"Error aceptando conexión de surtidor: {e}")
 
     def handle_surtidor(self, client_socket, addr):
-        """Maneja la comunicación entrante de un solo surtidor."""
+        """
+        Maneja la comunicación entrante de un surtidor, o de un gateway de
+        estación que multiplexa varios surtidores (un canal por surtidor).
+        """
         
         self.send_current_prices_to_surtidor(client_socket)
+        channels = {} # canal -> ID de surtidor (solo conexiones de gateway)
+        lanes = set() # Carriles de admisión que abrió esta conexión
+        slowed_until = {} # ID de surtidor -> hasta cuándo ya se le pidió frenar
         
         try:
             while True:
-                msg_bytes = receive_message(client_socket)
+                channel, msg_bytes = receive_frame(client_socket)
                 if msg_bytes is None:
                     print(f"🔌 Surtidor {addr} desconectado.")
                     break
+                self.reaper.touch(client_socket)
                 
                 msg_obj = deserialize(msg_bytes)
                 
                 if isinstance(msg_obj, TransaccionReportMessage):
-                    
-                    # 1. Guardar en BD Local (SQLite) y obtener ID
-                    db_id = self._save_transaction(msg_obj) # <--- ¡CAMBIO!
-                    
-                    # 2. Log actualizado
-                    log_msg = (f"🧾 Reporte de Surtidor {msg_obj.surtidor_id} ({addr}): "
-                               f"{msg_obj.litros}L de {msg_obj.combustible} [Guardado en BD id={db_id}]")
-                    print(log_msg)
-
-                    # 3. Reenviar la transacción a la Matriz (si está conectada)
-                    self.forward_transaction_to_matriz(msg_obj, db_id) # <--- ¡CAMBIO!
+                    # Espera su turno en el carril del surtidor. Si el carril
+                    # está lleno, put() bloquea y dejamos de leer este socket.
+                    # El carril es de la conexión (o canal), no del ID que
+                    # declara el reporte: un surtidor no puede usar el de otro.
+                    self.surtidores.touch(msg_obj.surtidor_id)
+                    lane = (client_socket, channel)
+                    lanes.add(lane)
+                    pending = self.admission.put(lane, (msg_obj, addr))
+                    if pending >= UMBRAL_SLOW_DOWN:
+                        self._send_slow_down(client_socket, msg_obj.surtidor_id, pending, slowed_until)
                     
                 elif isinstance(msg_obj, HeartbeatMessage):
-                    print(f"❤️ Heartbeat de Surtidor {msg_obj.id} ({addr})")
+                    # Los heartbeats periódicos solo renuevan el reaper y el registro
+                    if msg_obj.estado == ESTADO_ALIVE:
+                        self.surtidores.touch(msg_obj.id)
+                    else:
+                        if channel is not None:
+                            print(f"🔀 Surtidor {msg_obj.id} conectado vía gateway {addr} (canal {channel})")
+                            channels[channel] = msg_obj.id
+                        else:
+                            print(f"❤️ Heartbeat de Surtidor {msg_obj.id} ({addr})")
+                        self._register_surtidor(client_socket, channel, msg_obj)
+                        if channel is None:
+                            self._negotiate_multicast(client_socket, msg_obj)
+
+                elif isinstance(msg_obj, NackMessage):
+                    self._repair_multicast(client_socket, msg_obj)
+
+                elif isinstance(msg_obj, PrecioAplicadoMessage):
+                    # Confirmación de un precio trazado: se reenvía a la Matriz
+                    msg_obj.distribuidor_id = self.id
+                    self.send_to_matriz(msg_obj, PRIORIDAD_CONTROL)
 
         except ConnectionError as e:
             print(f"Error de conexión con Surtidor {addr}: {e}")
         finally:
-            with self.lock_surtidores:
-                self.surtidores.remove(client_socket)
+            if channels:
+                print(f"🔌 Gateway {addr} desconectado con {len(channels)} surtidores.")
+            self.reaper.unregister(client_socket)
+            for lane in lanes:
+                self.admission.discard(lane)
+            # Puede haber sido removido ya por un broadcast fallido
+            self.surtidores.remove_connection(client_socket)
             client_socket.close()
 
+    def _register_surtidor(self, sock, channel, msg: HeartbeatMessage):
+        """Anota un surtidor que se anunció y le envía los precios (y hojas en espera) de su grupo."""
+        info = self.surtidores.register(msg.id, sock, channel, msg.combustibles, msg.grupo)
+        # Los surtidores de un gateway comparten su grupo: el gateway ya los recibió
+        if channel is not None or info.grupo is None:
+            return
+        with self.lock_prices:
+            prices = dict(self.group_prices.get(info.grupo, {}))
+            versions = {comb: self.price_versions.get((info.grupo, comb)) for comb in prices}
+            sheets = [sheet for sheet in self.staged_sheets if sheet["grupo"] == info.grupo]
+        if not prices and not sheets:
+            return
+        frames = [
+            frame_parts(serialize(PrecioLocalUpdateMessage(comb, precio, version=versions[comb])))
+            for comb, precio in prices.items()
+        ] + self._sheet_frames(sheets)
+        try:
+            send_frames(sock, frames)
+            print(f"Precios del grupo '{info.grupo}' enviados a {msg.id}.")
+        except Exception as e:
+            print(f"Error enviando precios de grupo a surtidor {msg.id}: {e}")
+
+    def _negotiate_multicast(self, sock, msg: HeartbeatMessage):
+        """
+        Da de alta en el multicast a una conexión que lo ofrece. Si deja de
+        ofrecerlo (ej: no le llegan los datagramas), vuelve a TCP y se le
+        reenvía el caché por si perdió precios.
+        """
+        if self.multicast is None or MULTICAST_CAPABILITY not in msg.capacidades:
+            if self.surtidores.set_multicast(sock, False):
+                print(f"📡 {msg.id} dejó el multicast: vuelve a recibir precios por TCP.")
+                self.send_current_prices_to_surtidor(sock)
+            return
+        # La secuencia se lee antes de marcar la conexión: un precio
+        # transmitido entre medio le llega por TCP y también por multicast
+        alta = MulticastAltaMessage(self.id, self.multicast.address, self.multicast.epoch, self.multicast.last_seq)
+        try:
+            send_frame(sock, frame_message(serialize(alta)))
+        except Exception as e:
+            print(f"Error dando de alta en multicast a {msg.id}: {e}")
+            return
+        self.surtidores.set_multicast(sock, True)
+        print(f"📡 {msg.id} recibe los precios por multicast ({self.multicast.address}).")
+
+    def _repair_multicast(self, sock, msg: NackMessage):
+        """Reenvía por TCP los precios multicast que el surtidor no recibió."""
+        if self.multicast is None:
+            return
+        messages, incomplete = self.multicast.repair(msg.desde, msg.hasta)
+        print(f"🩹 NACK de {msg.surtidor_id}: {msg.desde}..{msg.hasta}, reenviando {len(messages)} precios.")
+        try:
+            send_frames(sock, [frame_parts(msg_bytes) for msg_bytes in messages])
+        except Exception as e:
+            print(f"Error reparando multicast de {msg.surtidor_id}: {e}")
+            return
+        if incomplete:
+            # Ya no están en el historial: el caché tiene el precio vigente de cada combustible
+            self.send_current_prices_to_surtidor(sock)
+
+    def _process_transaction(self, lane, entry):
+        """Hilo de admisión: guarda un reporte ya admitido y lo reenvía a la Matriz."""
+        msg_obj, addr = entry
+        surtidor_id = msg_obj.surtidor_id
+
+        # 1. Guardar en BD Local (SQLite) y obtener ID
+        db_id = self._save_transaction(msg_obj)
+
+        # 2. Log actualizado
+        log_msg = (f"🧾 Reporte de Surtidor {surtidor_id} ({addr}): "
+                   f"{msg_obj.litros}L de {msg_obj.combustible} [Guardado en BD id={db_id}]")
+        print(log_msg)
+
+        # 3. Reenviar la transacción a la Matriz (si está conectada).
+        #    En modo pre-agregado viajará dentro del resumen de su intervalo.
+        if not self.aggregation_interval:
+            self.forward_transaction_to_matriz(msg_obj, db_id)
+
+    def _send_slow_down(self, sock, surtidor_id, pending, slowed_until):
+        """Pide a un surtidor que deje de reportar mientras se vacía su carril (un aviso por espera)."""
+        now = time.monotonic()
+        if now < slowed_until.get(surtidor_id, 0):
+            return
+        wait = self.admission.estimated_wait(pending)
+        slowed_until[surtidor_id] = now + wait
+        print(f"🐢 Surtidor {surtidor_id} con {pending} reportes en espera. Pidiendo pausa de {wait:.1f} s")
+        try:
+            send_frame(sock, frame_message(serialize(SlowDownMessage(surtidor_id, int(wait * 1000)))))
+        except Exception as e:
+            print(f"Error enviando SLOW_DOWN a surtidor {surtidor_id}: {e}")
+
     def send_current_prices_to_surtidor(self, sock):
-        """Envía el caché de precios actual a un surtidor recién conectado."""
+        """
+        Envía el caché de precios actual, y las hojas generales en espera, a
+        un surtidor recién conectado. Las hojas van aunque el caché esté
+        vacío: pueden traer los primeros precios (el caché se llena recién
+        a su hora de vigencia, sin transmitir).
+        """
+        snapshot = self.current_prices
         with self.lock_prices:
-            if not self.current_prices:
-                print(f"Aviso: Surtidor {sock.getpeername()} conectado, pero no hay precios en caché.")
+            sheets = [sheet for sheet in self.staged_sheets if not sheet["grupo"] and sheet["precios"]]
+        if not snapshot and not sheets:
+            print(f"Aviso: Surtidor {sock.getpeername()} conectado, pero no hay precios en caché.")
+            return
+
+        print(f"Enviando precios de caché a {sock.getpeername()}...")
+        while True:
+            with self.lock_prices:
+                versions = {comb: self.price_versions.get(('', comb)) for comb, _ in snapshot.items()}
+                sheets = [sheet for sheet in self.staged_sheets if not sheet["grupo"]]
+            # Todos los precios en un solo envío (sendmsg con un buffer por parte).
+            # Cada precio lleva su versión: en un reenvío (NACK, salida del
+            # multicast) no reemplaza a las hojas más nuevas que el surtidor
+            # ya tiene en espera, incluidas las de su grupo.
+            frames = [
+                frame_parts(serialize(PrecioLocalUpdateMessage(comb, precio, version=versions[comb])))
+                for comb, precio in snapshot.items()
+            ] + self._sheet_frames(sheets)
+            try:
+                send_frames(sock, frames)
+            except Exception as e:
+                print(f"Error enviando precio de caché a surtidor: {e}")
                 return
+            # Si llegó un precio mientras enviábamos, su broadcast pudo salir
+            # antes que nuestra copia vieja: se reenvía el snapshot nuevo.
+            if self.current_prices is snapshot:
+                break
+            snapshot = self.current_prices
+        print(f"Precios de caché enviados (v{snapshot.version}).")
 
-            print(f"Enviando precios de caché a {sock.getpeername()}...")
-            for comb, precio in self.current_prices.items():
-                msg_obj = PrecioLocalUpdateMessage(comb, precio)
-                msg_bytes = serialize(msg_obj)
-                framed_msg = frame_message(msg_bytes)
-                try:
-                    sock.sendall(framed_msg)
-                except Exception as e:
-                    print(f"Error enviando precio de caché a surtidor: {e}")
-                    break
-            print("Precios de caché enviados.")
+    def _sheet_frames(self, sheets) -> list:
+        return [
+            frame_parts(serialize(HojaPreciosLocalMessage(sheet["precios"], sheet["vigencia_ms"], sheet["version"])))
+            for sheet in sheets if sheet["precios"]
+        ]
 
-    def broadcast_price_to_surtidores(self, combustible, precio_final):
-        """Envía un nuevo precio local a TODOS los surtidores conectados."""
-        print(f"TRANSMITIENDO a {len(self.surtidores)} surtidores: {combustible} @ ${precio_final}")
-        
-        msg_obj = PrecioLocalUpdateMessage(combustible, precio_final)
-        msg_bytes = serialize(msg_obj)
-        framed_msg = frame_message(msg_bytes)
-        
-        disconnected = []
-        with self.lock_surtidores:
-            for sock in self.surtidores:
-                try:
-                    sock.sendall(framed_msg)
-                except Exception:
-                    disconnected.append(sock)
-            
-            for sock in disconnected:
-                self.surtidores.remove(sock)
+    def broadcast_price_sheet_to_surtidores(self, precios, vigencia_ms, grupo=None, version=None):
+        """
+        Envía una hoja de precios finales a los surtidores (o a los del
+        grupo 'grupo'), que la aplican a su hora. Siempre por TCP: también a
+        los que reciben los precios sueltos por multicast.
+        """
+        msg_bytes = serialize(HojaPreciosLocalMessage(precios, vigencia_ms, version))
+        sent = self._send_to_surtidores(frame_parts(msg_bytes), coalesce=True, grupo=grupo)
+        destino = f"grupo '{grupo}'" if grupo else f"{len(self.surtidores)} conexiones"
+        print(f"TRANSMITIENDO hoja de {len(precios)} precios a {sent} de {destino}")
+
+    def broadcast_price_to_surtidores(self, combustible, precio_final, traza=None, grupo=None, version=None):
+        """
+        Envía un nuevo precio local a los surtidores que venden ese
+        combustible (solo a los del grupo 'grupo', si se indica).
+        """
+        msg_obj = PrecioLocalUpdateMessage(
+            combustible, precio_final, add_hop(traza, SALTO_DISTRIBUIDOR_ENVIA), version=version
+        )
+        targets = None
+        if self.multicast and not grupo:
+            # Destinos TCP antes de tomar la secuencia (ver _negotiate_multicast)
+            targets = self.surtidores.targets(combustible, skip_multicast=True)
+            def serialize_with_seq(seq):
+                msg_obj.seq = seq
+                return serialize(msg_obj)
+            msg_bytes = self.multicast.send(serialize_with_seq)
+        else:
+            msg_bytes = serialize(msg_obj)
+        # Los precios que llegan seguidos de la Matriz salen juntos hacia cada surtidor
+        sent = self._send_to_surtidores(
+            frame_parts(msg_bytes), coalesce=True, combustible=combustible, grupo=grupo, targets=targets
+        )
+        destino = f"grupo '{grupo}'" if grupo else f"{len(self.surtidores)} conexiones"
+        print(f"TRANSMITIENDO a {sent} de {destino}: {combustible} @ ${precio_final}")
+
+    @timed_stage("distribuidor.broadcast")
+    def _send_to_surtidores(self, framed_msg, coalesce=False, combustible=None, grupo=None, targets=None) -> int:
+        """
+        Envía un mensaje ya enmarcado a las conexiones de surtidores: todas,
+        o solo las que venden 'combustible' y/o son del grupo 'grupo' (o a
+        'targets', si ya se calcularon). Con 'coalesce' se encola
+        (queue_frame): un surtidor caído se detecta en el próximo envío.
+        Retorna a cuántas conexiones se envió (o encoló) sin error.
+        """
+        send = queue_frame if coalesce else send_frame
+        if targets is None:
+            targets = self.surtidores.targets(combustible, grupo)
+
+        failed = 0
+        for sock in targets:
+            try:
+                send(sock, framed_msg)
+            except Exception:
+                self.surtidores.remove_connection(sock)
                 sock.close()
+                failed += 1
+        return len(targets) - failed
 
     # --- ROL DE CLIENTE (Conectando a Matriz Nivel 3) ---
 
     def run_client_for_matriz(self):
         """Mantiene una conexión persistente a la Matriz y se reconecta si cae."""
         while True: # Bucle de reconexión
+            sock = None
             try:
                 # 1. Intentar conectar
                 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 sock.connect((MATRIZ_HOST, MATRIZ_PORT))
+                sock.settimeout(READ_TIMEOUT) # Deadline de lectura
+                set_nodelay(sock)
                 
                 print(f"🔗 Conectado exitosamente a la Matriz en {MATRIZ_HOST}:{MATRIZ_PORT}")
+                self.reaper.register(sock, close_idle_socket)
                 
+                outbox = PriorityOutbox(sock, on_error=lambda: self._on_matriz_send_error(sock))
+                outbox.start()
                 with self.lock_matriz_socket:
                     self.socket_to_matriz = sock
+                    self.outbox_matriz = outbox
+                    self.matriz_compression = False # Se renegocia en cada conexión
                 self.is_connected_to_matriz.set() # Pone el flag en "conectado"
                 
-                # Identificarse ante la Matriz
-                self.send_to_matriz(HeartbeatMessage(self.id, "online"))
+                # Identificarse ante la Matriz (ofreciendo compresión) e informar
+                # la versión de precios que tenemos: responde con los que faltan
+                self.send_to_matriz(
+                    HeartbeatMessage(
+                        self.id, "online", capacidades=[COMPRESSION_CAPABILITY],
+                        version_precios=self.matriz_price_version
+                    ),
+                    PRIORIDAD_CONTROL
+                )
                 
                 # --- ¡CAMBIO AÑADIDO! ---
                 # 2. Iniciar la sincronización de pendientes
@@ -282,13 +881,18 @@ class DistribuidorServer:
             finally:
                 # 3. Lógica de limpieza y reintento
                 self.is_connected_to_matriz.clear() # Pone el flag en "desconectado"
+                self.reaper.unregister(sock)
                 with self.lock_matriz_socket:
+                    if self.outbox_matriz:
+                        self.outbox_matriz.close()
+                    self.outbox_matriz = None
                     if self.socket_to_matriz:
                         self.socket_to_matriz.close()
                     self.socket_to_matriz = None
                 
-                print(f"Desconectado de la Matriz. Reintentando en {RECONNECT_DELAY} segundos...")
-                time.sleep(RECONNECT_DELAY)
+                delay = self.reconnect_policy.next_delay()
+                print(f"Desconectado de la Matriz. Reintentando en {delay:.1f} segundos...")
+                time.sleep(delay)
 
     def listen_to_matriz(self, sock: socket.socket):
         """Bucle de recepción de mensajes desde la Matriz."""
@@ -298,56 +902,270 @@ class DistribuidorServer:
                 if msg_bytes is None:
                     print("Matriz cerró la conexión.")
                     break 
+                self.reaper.touch(sock)
+                # La Matriz respondió: recién ahí la conexión cuenta como exitosa
+                # (una que acepta y cierra de inmediato sigue con backoff)
+                self.reconnect_policy.reset()
                 
                 msg_obj = deserialize(msg_bytes)
                 
                 if isinstance(msg_obj, PrecioUpdateMessage):
+                    traza = add_hop(msg_obj.traza, SALTO_DISTRIBUIDOR_RECIBE)
                     print(f"💸 Precio base recibido de Matriz: {msg_obj.combustible} @ ${msg_obj.precio_base}")
-                    
-                    precio_final = int(msg_obj.precio_base * UTILIDAD_FACTOR)
-                    
-                    with self.lock_prices:
-                        self.current_prices[msg_obj.combustible] = precio_final
-                    print(f"💰 Precio final local calculado: {msg_obj.combustible} @ ${precio_final}")
-                    
-                    self.broadcast_price_to_surtidores(msg_obj.combustible, precio_final)
+                    self._apply_matriz_price(
+                        msg_obj.combustible, msg_obj.precio_base, msg_obj.grupo, msg_obj.version, traza
+                    )
+
+                elif isinstance(msg_obj, HojaPreciosMessage):
+                    print(f"🗓️ Hoja de precios recibida de Matriz: {msg_obj.precios}")
+                    self._apply_matriz_sheet(msg_obj.precios, msg_obj.vigencia_ms, msg_obj.grupo, msg_obj.version)
+
+                elif isinstance(msg_obj, CatalogoPreciosMessage):
+                    print(f"🗂️ Catálogo de precios de la Matriz: {len(msg_obj.entradas)} precios "
+                          f"desde v{self.matriz_price_version} (v{msg_obj.version})")
+                    if msg_obj.completo:
+                        self._reset_price_state()
+                    self._apply_matriz_catalog(msg_obj.entradas)
+                    self.matriz_price_version = max(self.matriz_price_version, msg_obj.version)
+
+                elif isinstance(msg_obj, HeartbeatMessage):
+                    if COMPRESSION_CAPABILITY in msg_obj.capacidades:
+                        print("🗜️ Matriz aceptó compresión de frames.")
+                        with self.lock_matriz_socket:
+                            self.matriz_compression = True
+
+                elif isinstance(msg_obj, ReportQueryMessage):
+                    # La consulta va a la BD: en otro hilo, para no frenar los precios
+                    threading.Thread(
+                        target=self._answer_report_query, args=(msg_obj,), daemon=True
+                    ).start()
+
+                elif isinstance(msg_obj, PerfilMessage):
+                    print(f"🔬 Matriz pidió perfilado: '{msg_obj.accion}'")
+                    # En otro hilo: un volcado escribe archivos y no debe frenar la escucha
+                    threading.Thread(
+                        target=self.profiling.handle, args=(msg_obj.accion,), daemon=True
+                    ).start()
+                    if msg_obj.incluir_surtidores:
+                        self._send_to_surtidores(frame_message(msg_bytes))
                 
         except ConnectionError as e:
             print(f"Error de conexión escuchando a Matriz: {e}")
 
+    def _apply_matriz_price(self, combustible, precio_base, grupo, version, traza=None):
+        """Calcula el precio final de un precio base de la Matriz, lo transmite y lo guarda."""
+        precio_final = int(precio_base * UTILIDAD_FACTOR)
+        with self.lock_prices:
+            stale = self._is_stale(combustible, grupo, version)
+            if not stale:
+                self._supersede_staged({combustible}, grupo, version)
+        if stale:
+            print(f"⏭️ Precio de {combustible} v{version} descartado: ya hay uno más nuevo.")
+            return
+        self._update_price_cache({combustible: precio_final}, grupo, version)
+        print(f"💰 Precio final local calculado: {combustible} @ ${precio_final}")
+
+        self.broadcast_price_to_surtidores(combustible, precio_final, traza, grupo, version)
+        # Se guarda después de transmitir: el commit no se suma a la propagación
+        self._save_prices({combustible: precio_final}, grupo, version or 0)
+        if version:
+            self.matriz_price_version = max(self.matriz_price_version, version)
+
+    def _reset_price_state(self):
+        """
+        La Matriz reinició su catálogo y manda todas sus entradas: se olvidan
+        los precios (generales y de grupo) y las hojas en espera del catálogo
+        anterior, en memoria y en la BD local.
+        """
+        with self.lock_prices:
+            for sheet in self.staged_sheets:
+                sheet["precios"].clear() # Su timer ya no aplica nada
+            self.staged_sheets = []
+            self.group_prices = {}
+            self.price_versions = {}
+            self.current_prices = PriceSnapshot(version=self.current_prices.version + 1)
+            self.matriz_price_version = 0
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("DELETE FROM precios")
+            conn.execute("DELETE FROM hojas_precios")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"Error borrando los precios del catálogo anterior de la BD local: {e}")
+        print("🗂️ Catálogo completo: se descartan los precios y hojas del catálogo anterior.")
+
+    def _apply_matriz_catalog(self, entradas):
+        """
+        Aplica las entradas del catálogo en orden de versión: queda igual que
+        si hubiéramos visto cada broadcast. Las de una misma hoja (misma
+        versión, con vigencia) se juntan y se aplican como hoja.
+        """
+        sheet = None # [version, grupo, vigencia_ms, {combustible: precio_base}]
+        for version, combustible, precio_base, grupo, vigencia_ms in entradas:
+            if sheet and sheet[:3] != [version, grupo, vigencia_ms]:
+                self._apply_matriz_sheet(sheet[3], sheet[2], sheet[1], sheet[0])
+                sheet = None
+            if not vigencia_ms:
+                self._apply_matriz_price(combustible, precio_base, grupo, version)
+                continue
+            if sheet is None:
+                sheet = [version, grupo, vigencia_ms, {}]
+            sheet[3][combustible] = precio_base
+        if sheet:
+            self._apply_matriz_sheet(sheet[3], sheet[2], sheet[1], sheet[0])
+
+    def _apply_matriz_sheet(self, precios_base, vigencia_ms, grupo, version):
+        """
+        Hoja de precios de la Matriz: se reenvía de inmediato a los
+        surtidores (la dejan en espera) y aquí se guarda hasta su hora, en
+        que se actualiza el caché de una vez.
+        """
+        precios = {comb: int(precio_base * UTILIDAD_FACTOR) for comb, precio_base in precios_base.items()}
+        sheet = {"id": None, "precios": precios, "vigencia_ms": vigencia_ms,
+                 "grupo": grupo or None, "version": version or 0}
+        with self.lock_prices:
+            if version and any(staged["version"] == version for staged in self.staged_sheets):
+                precios.clear() # Ya está en espera
+            for combustible in [comb for comb in precios if self._is_stale(comb, grupo, version)]:
+                del precios[combustible]
+            self._supersede_staged(set(precios), grupo, version)
+        if not precios:
+            print(f"⏭️ Hoja de precios v{version} descartada: ya hay precios más nuevos.")
+            return
+        self.broadcast_price_sheet_to_surtidores(precios, vigencia_ms, grupo, version)
+
+        if vigencia_ms > time.time() * 1000:
+            sheet["id"] = self._save_staged_sheet(sheet)
+            self._schedule_sheet(sheet)
+        else:
+            self._activate_sheet(sheet)
+        if version:
+            self.matriz_price_version = max(self.matriz_price_version, version)
+
+    def _schedule_sheet(self, sheet):
+        """Deja la hoja en espera y programa su aplicación."""
+        with self.lock_prices:
+            self.staged_sheets.append(sheet)
+        delay = max(0.0, sheet["vigencia_ms"] / 1000 - time.time())
+        timer = threading.Timer(delay, self._activate_sheet, args=(sheet,))
+        timer.daemon = True
+        timer.start()
+
+    def _activate_sheet(self, sheet):
+        """Hora de vigencia: todos los precios de la hoja entran al caché en una sola versión."""
+        with self.lock_prices:
+            if sheet in self.staged_sheets:
+                self.staged_sheets.remove(sheet)
+            precios = dict(sheet["precios"])
+        if precios:
+            self._update_price_cache(precios, sheet["grupo"], sheet["version"])
+            print(f"🗓️ Hoja de precios v{sheet['version']} vigente: {precios}")
+            self._save_prices(precios, sheet["grupo"], sheet["version"])
+        if sheet["id"] is not None:
+            self._delete_staged_sheet(sheet["id"])
+
+    def _is_stale(self, combustible, grupo, version) -> bool:
+        """
+        Función interna. Asume que el lock_prices ya está adquirido.
+        True si el caché ya tiene un precio de 'combustible' igual o más nuevo
+        que 'version': el del grupo, o uno general (que también vale para el
+        grupo). Pasa si un catálogo leído antes llega después de un broadcast.
+        """
+        if not version:
+            return False
+        keys = [('', combustible)] + ([(grupo, combustible)] if grupo else [])
+        return any((self.price_versions.get(key) or 0) >= version for key in keys)
+
+    def _supersede_staged(self, combustibles, grupo, version):
+        """
+        Función interna. Asume que el lock_prices ya está adquirido.
+        Un precio más nuevo que una hoja en espera la reemplaza para ese
+        combustible (un precio general, en todos los grupos). Sin versión,
+        cuenta como el más nuevo.
+        """
+        for sheet in self.staged_sheets:
+            if version and sheet["version"] >= version:
+                continue
+            if grupo and sheet["grupo"] != grupo:
+                continue
+            for combustible in combustibles:
+                sheet["precios"].pop(combustible, None)
+
+    def _update_price_cache(self, precios: dict, grupo=None, version=None):
+        """
+        Guarda precios generales en el caché (en una sola versión), o propios
+        del grupo 'grupo'. 'version' es la del catálogo de la Matriz.
+        """
+        with self.lock_prices:
+            for combustible in precios:
+                self.price_versions[(grupo or '', combustible)] = version
+            if grupo:
+                self.group_prices.setdefault(grupo, {}).update(precios)
+            else:
+                self.current_prices = self.current_prices.with_prices(precios)
+                # El precio general llega a todos: deja sin efecto los precios de grupo más viejos
+                for group, prices in self.group_prices.items():
+                    for combustible in precios:
+                        if version and (self.price_versions.get((group, combustible)) or 0) > version:
+                            continue
+                        if prices.pop(combustible, None) is not None:
+                            self.price_versions.pop((group, combustible), None)
+
+    def _answer_report_query(self, query: ReportQueryMessage):
+        """Responde una consulta de reportes de la Matriz con los totales locales."""
+        rows = self._fetch_local_totals()
+        print(f"📋 Consulta de reportes {query.query_id}: respondiendo {len(rows)} filas.")
+        # Carril en vivo: se adelanta a una sincronización de backlog en curso
+        self.send_to_matriz(ReportResultMessage(query.query_id, self.id, rows), PRIORIDAD_LIVE)
+
+    def run_heartbeats(self):
+        """Envía heartbeats periódicos a la Matriz y a todos los surtidores."""
+        heartbeat = HeartbeatMessage(self.id, ESTADO_ALIVE)
+        framed_msg = frame_message(serialize(heartbeat))
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self.send_to_matriz(heartbeat, PRIORIDAD_CONTROL)
+            self._send_to_surtidores(framed_msg)
+
     # --- Funciones de Comunicación (Nivel 2 -> 3) ---
 
-    def send_to_matriz(self, msg_obj) -> bool:
-        """Función helper para enviar un mensaje a la Matriz."""
+    def send_to_matriz(self, msg_obj, priority=PRIORIDAD_LIVE, on_sent=None) -> bool:
+        """
+        Función helper para enviar un mensaje a la Matriz. Lo encola en el
+        carril 'priority' de la cola de salida; 'on_sent' se llama cuando el
+        mensaje realmente salió por el socket. Retorna False si no hay conexión.
+        """
         if not self.is_connected_to_matriz.is_set():
             return False
             
         with self.lock_matriz_socket:
-            if self.socket_to_matriz:
-                try:
-                    msg_bytes = serialize(msg_obj)
-                    framed_msg = frame_message(msg_bytes)
-                    self.socket_to_matriz.sendall(framed_msg)
-                    return True
-                except Exception as e:
-                    print(f"Error al enviar a Matriz: {e}")
-                    # Si falla el envío, asumimos desconexión
-                    self.is_connected_to_matriz.clear() 
-                    return False
-        return False
+            outbox = self.outbox_matriz
+            compress = self.matriz_compression
+        if outbox is None:
+            return False
+
+        msg_bytes = serialize(msg_obj)
+        framed_msg = frame_parts(msg_bytes, compress=compress) # Header y mensaje sin concatenar
+        # Fuera del lock: un put() de backlog puede bloquear si la cola está llena
+        return outbox.put(framed_msg, priority, on_sent)
+
+    def _on_matriz_send_error(self, sock: socket.socket):
+        """Falló un envío a la Matriz: asumimos desconexión y despertamos al hilo de escucha."""
+        self.is_connected_to_matriz.clear()
+        close_idle_socket(sock)
 
+    @timed_stage("distribuidor.forward")
     def forward_transaction_to_matriz(self, msg_obj: TransaccionReportMessage, db_id: int | None):
         """Intenta enviar una transacción a la Matriz y actualiza su estado sync."""
         
         if not msg_obj.distribuidor_id:
              msg_obj.distribuidor_id = self.id 
         
-        if self.send_to_matriz(msg_obj):
-            # --- ¡ÉXITO! La Matriz está online ---
-            if db_id:
-                # Marcarla como sincronizada en la BD
-                self._update_transaction_sync_status(db_id)
-        else:
+        # Se marca como sincronizada en la BD cuando realmente sale por el socket
+        on_sent = (lambda: self._update_transaction_sync_status(db_id)) if db_id else None
+        
+        if not self.send_to_matriz(msg_obj, PRIORIDAD_LIVE, on_sent):
             # --- FALLO: La Matriz está offline ---
             print(f"AVISO: Matriz desconectada. Transacción (id={db_id}) "
                   "guardada en BD local para sincronización futura.")
@@ -356,6 +1174,10 @@ class DistribuidorServer:
 
     def _sync_pending_transactions(self):
         """Busca transacciones pendientes y las envía a la Matriz."""
+        if self.aggregation_interval:
+            self._sync_summaries()
+            return
+
         print("Buscando transacciones pendientes para sincronizar...")
         
         pending_txs = []
@@ -363,7 +1185,15 @@ class DistribuidorServer:
             conn = sqlite3.connect(self.db_path, check_same_thread=False)
             cursor = conn.cursor()
             # Buscar todas las no sincronizadas
-            sql = "SELECT id, surtidor_id, combustible, litros, cargas, distribuidor_id FROM transacciones WHERE sincronizado_matriz = 0"
+            sql = """
+            SELECT t.id, s.nombre, c.nombre, t.litros, t.cargas, d.nombre
+            FROM transacciones t
+            JOIN dim_surtidores s ON s.cod = t.surtidor_cod
+            JOIN dim_combustibles c ON c.cod = t.combustible_cod
+            JOIN dim_distribuidores d ON d.cod = t.distribuidor_cod
+            WHERE t.sincronizado_matriz = 0
+            ORDER BY t.id
+            """
             cursor.execute(sql)
             pending_txs = cursor.fetchall()
             conn.close()
@@ -374,9 +1204,25 @@ class DistribuidorServer:
         if not pending_txs:
             print("No hay transacciones pendientes. Sincronización completa.")
             return
-            
-        print(f"Se encontraron {len(pending_txs)} transacciones pendientes. Iniciando envío...")
+
+        # Escalonar el inicio según el tamaño del backlog para que una
+        # reconexión masiva no dispare todas las sincronizaciones a la vez.
+        delay = sync_start_delay(len(pending_txs))
+        print(f"Se encontraron {len(pending_txs)} transacciones pendientes. "
+              f"Sincronización en {delay:.1f} segundos...")
+        if delay > 0:
+            time.sleep(delay)
+            if not self.is_connected_to_matriz.is_set():
+                print("Se perdió la conexión a la Matriz antes de sincronizar. Abortando.")
+                return
+
+        with self.lock_matriz_socket:
+            outbox = self.outbox_matriz
         
+        # El backlog va por el carril de menor prioridad: las transacciones en
+        # vivo y los mensajes de control se adelantan. El hilo escritor anota
+        # aquí los IDs que ya salieron y se marcan en la BD por lotes.
+        synced_ids = []
         succeeded_count = 0
         for tx in pending_txs:
             # Recrear el objeto de mensaje
@@ -389,20 +1235,69 @@ class DistribuidorServer:
                 distribuidor_id=distribuidor_id
             )
             
-            # Intentar enviar
-            if self.send_to_matriz(msg_obj):
-                # Si es exitoso, marcar en la BD
-                self._update_transaction_sync_status(db_id)
+            # Intentar enviar (bloquea si el carril de backlog está lleno)
+            on_sent = lambda db_id=db_id: synced_ids.append(db_id)
+            if self.send_to_matriz(msg_obj, PRIORIDAD_BACKLOG, on_sent):
                 succeeded_count += 1
-                # Pequeña pausa para no saturar
-                time.sleep(0.05) 
+                if succeeded_count % SYNC_BATCH_SIZE == 0:
+                    self._flush_synced_ids(synced_ids)
             else:
                 # Si la Matriz se cae *durante* la sincronización
                 print("Se perdió la conexión a la Matriz durante la sincronización. Abortando.")
                 break # Salir del bucle y reintentar en la próxima reconexión
 
+        # Esperar a que el escritor termine de enviar lo encolado y marcar el resto
+        if outbox:
+            outbox.wait_idle()
+        self._flush_synced_ids(synced_ids)
+
         print(f"Sincronización finalizada. {succeeded_count} transacciones enviadas.")
 
+    def _flush_synced_ids(self, synced_ids: list):
+        """Marca en la BD los IDs ya enviados y los quita de la lista."""
+        count = len(synced_ids) # El hilo escritor solo agrega al final
+        self._update_transactions_sync_status(synced_ids[:count])
+        del synced_ids[:count]
+
+    def _sync_summaries(self):
+        """Modo pre-agregado: envía un resumen por cada intervalo cerrado pendiente."""
+        intervals = self._fetch_closed_intervals()
+        if not intervals:
+            return
+
+        # Mismo escalonamiento que las transacciones pendientes: tras un
+        # reinicio de la Matriz no envían todos los distribuidores a la vez.
+        delay = sync_start_delay(len(intervals))
+        print(f"Se encontraron {len(intervals)} intervalos pendientes. "
+              f"Envío de resúmenes en {delay:.1f} segundos...")
+        if delay > 0:
+            time.sleep(delay)
+            if not self.is_connected_to_matriz.is_set():
+                print("Se perdió la conexión a la Matriz antes de enviar los resúmenes. Abortando.")
+                return
+
+        succeeded_count = 0
+        for intervalo in intervals:
+            filas, max_id = self._summarize_interval(intervalo)
+            msg_obj = ResumenVentasMessage(self.id, intervalo, self.aggregation_interval, filas)
+            
+            on_sent = lambda intervalo=intervalo, max_id=max_id: self._update_interval_sync_status(intervalo, max_id)
+            if self.send_to_matriz(msg_obj, PRIORIDAD_BACKLOG, on_sent):
+                succeeded_count += 1
+            else:
+                print("Se perdió la conexión a la Matriz enviando resúmenes. Abortando.")
+                break
+
+        print(f"Resúmenes enviados: {succeeded_count} de {len(intervals)} intervalos.")
+
+    def run_aggregation(self):
+        """Modo pre-agregado: al cerrar cada intervalo envía su resumen a la Matriz."""
+        while True:
+            # Dormir hasta justo después del próximo cierre de intervalo
+            time.sleep(self.aggregation_interval - time.time() % self.aggregation_interval + 1)
+            if self.is_connected_to_matriz.is_set():
+                self._sync_summaries()
+
     def _start_sync_thread(self):
         """Inicia la sincronización en un hilo separado para no bloquear."""
         sync_thread = threading.Thread(
@@ -426,6 +1321,7 @@ if __name__ == "__main__":
         host='0.0.0.0', # Escuchar en todas las interfaces
         port=DIST_PORT
     )
+    install_signal_handlers(server.profiling)
     
     server.start()
     
@@ -0,0 +1,268 @@
+# modo multi-proceso de la Matriz: N workers (SO_REUSEPORT) + 1 proceso escritor
+import multiprocessing
+import queue
+import socket
+import threading
+import time
+import uuid
+import sys
+import os
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from matriz.server_matriz import MatrizServer, REPORT_TIMEOUT
+from common.profiling import ProfilingControl, install_signal_handlers
+# --- FIN: Hack para importar 'common' ---
+
+# Cada cuánto (segundos) un worker envía su lote al proceso escritor
+BATCH_INTERVAL = 0.05
+# Tamaño de lote que fuerza el envío inmediato
+BATCH_MAX_ROWS = 500
+# Lotes en vuelo hacia el escritor. Si se llena, los workers esperan (backpressure).
+INGEST_QUEUE_SIZE = 1000
+
+class MatrizWorker(MatrizServer):
+    """
+    MatrizServer dentro de un proceso worker. Acepta distribuidores en el
+    mismo puerto que los demás workers (SO_REUSEPORT, el kernel reparte las
+    conexiones), decodifica y valida los frames, y en vez de escribir en la
+    BD acumula las filas en lotes que envía al proceso escritor.
+    """
+    def __init__(self, worker_id, host, port, ingest_queue, control_queue, log_queue, report_queue, trace_queue):
+        self.worker_id = worker_id
+        self.ingest_queue = ingest_queue
+        self.control_queue = control_queue
+        self.report_queue = report_queue
+        self.trace_queue = trace_queue
+        self.pending_tx_rows = []
+        self.pending_summary_rows = []
+        self.lock_batch = threading.Lock()
+        super().__init__(host, port, log_queue.put)
+        self.profiling = ProfilingControl(f"matriz-w{worker_id}")
+
+    def log(self, message):
+        super().log(f"[W{self.worker_id}] {message}")
+
+    def _init_db(self):
+        pass # La BD la inicializa y escribe solo el proceso escritor
+
+    def _insert_rows(self, tx_rows, summary_rows):
+        with self.lock_batch:
+            self.pending_tx_rows.extend(tx_rows)
+            self.pending_summary_rows.extend(summary_rows)
+            full = len(self.pending_tx_rows) + len(self.pending_summary_rows) >= BATCH_MAX_ROWS
+        if full:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        """Envía el lote acumulado al proceso escritor."""
+        with self.lock_batch:
+            if not self.pending_tx_rows and not self.pending_summary_rows:
+                return
+            batch = (self.pending_tx_rows, self.pending_summary_rows)
+            self.pending_tx_rows = []
+            self.pending_summary_rows = []
+        self.ingest_queue.put(batch) # Bloquea si el escritor va atrasado
+
+    def _create_server_socket(self) -> socket.socket:
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen()
+        return server_socket
+
+    def start(self):
+        threading.Thread(target=self.run_batcher, daemon=True).start()
+        threading.Thread(target=self.run_control, daemon=True).start()
+        super().start()
+
+    def run_batcher(self):
+        """Envía los lotes parciales cada BATCH_INTERVAL segundos."""
+        while True:
+            time.sleep(BATCH_INTERVAL)
+            self._flush_batch()
+
+    def run_control(self):
+        """Ejecuta las órdenes del proceso principal (ej: transmitir un precio)."""
+        while True:
+            command = self.control_queue.get()
+            if command[0] == "PRECIO":
+                _, combustible, precio_base, traza, grupo, version = command
+                self.broadcast_price(combustible, precio_base, traza, grupo, version)
+            elif command[0] == "HOJA":
+                _, precios, vigencia_ms, grupo, version = command
+                self.broadcast_price_sheet(precios, vigencia_ms, grupo, version)
+            elif command[0] == "PERFIL":
+                _, accion, incluir_surtidores = command
+                self.request_profiling(accion, incluir_surtidores)
+            elif command[0] == "REPORTE":
+                _, request_id, timeout = command
+                threading.Thread(
+                    target=self.run_report_query, args=(request_id, timeout), daemon=True
+                ).start()
+
+    def run_report_query(self, request_id, timeout):
+        """Consulta a los distribuidores de este worker y devuelve el parcial al proceso principal."""
+        self.report_queue.put((request_id, self.query_distribuidores(timeout)))
+
+    def _on_price_applied(self, msg):
+        """Las trazas se juntan en el proceso principal (la misma traza llega a todos los workers)."""
+        self.trace_queue.put(msg)
+
+def run_worker(worker_id, host, port, ingest_queue, control_queue, log_queue, report_queue, trace_queue):
+    """Punto de entrada de un proceso worker."""
+    worker = MatrizWorker(worker_id, host, port, ingest_queue, control_queue, log_queue, report_queue, trace_queue)
+    install_signal_handlers(worker.profiling)
+    worker.start()
+
+class StorageWriter(MatrizServer):
+    """
+    MatrizServer del proceso escritor. No tiene réplica propia: cada lote
+    guardado se publica al proceso principal, que mantiene la de la GUI.
+    """
+    def __init__(self, host, port, log_queue, change_queue):
+        self.change_queue = change_queue
+        super().__init__(host, port, log_queue.put)
+
+    def _init_db(self):
+        self.storage.init()
+
+    def _publish_change(self, change):
+        self.change_queue.put(change)
+
+def run_storage_writer(host, port, ingest_queue, log_queue, change_queue):
+    """
+    Punto de entrada del proceso escritor: el único que escribe en la BD.
+    Junta todos los lotes disponibles y los inserta en una sola transacción.
+    """
+    storage = StorageWriter(host, port, log_queue, change_queue)
+    while True:
+        tx_rows, summary_rows = ingest_queue.get()
+        try:
+            while len(tx_rows) + len(summary_rows) < 10 * BATCH_MAX_ROWS:
+                more_tx, more_summary = ingest_queue.get_nowait()
+                tx_rows.extend(more_tx)
+                summary_rows.extend(more_summary)
+        except queue.Empty:
+            pass
+        storage._insert_rows(tx_rows, summary_rows)
+
+class MatrizCluster(MatrizServer):
+    """
+    Matriz multi-proceso con la misma interfaz que MatrizServer para la GUI.
+    El proceso principal no atiende distribuidores: lanza los workers y el
+    escritor, reparte las órdenes (precios) a todos los workers y mantiene
+    la réplica de reportes con los cambios que publica el escritor.
+    """
+    def __init__(self, host, port, log_callback, num_workers):
+        super().__init__(host, port, log_callback) # Crea las tablas antes de lanzar procesos
+        self.num_workers = num_workers
+        # 'spawn' evita heredar el estado de Tkinter y de los hilos del proceso principal
+        self.mp_context = multiprocessing.get_context("spawn")
+        self.ingest_queue = self.mp_context.Queue(INGEST_QUEUE_SIZE)
+        self.log_queue = self.mp_context.Queue()
+        self.report_queue = self.mp_context.Queue() # Parciales de las consultas de reportes
+        self.change_queue = self.mp_context.Queue() # Lotes guardados por el escritor, para la réplica
+        self.trace_queue = self.mp_context.Queue() # Confirmaciones de precios trazados
+        self.lock_reports = threading.Lock() # Una consulta federada a la vez
+        self.control_queues = []
+        self.processes = []
+
+    def start(self):
+        writer = self.mp_context.Process(
+            target=run_storage_writer,
+            args=(self.host, self.port, self.ingest_queue, self.log_queue, self.change_queue),
+            daemon=True
+        )
+        self.processes.append(writer)
+
+        for worker_id in range(self.num_workers):
+            control_queue = self.mp_context.Queue()
+            self.control_queues.append(control_queue)
+            worker = self.mp_context.Process(
+                target=run_worker,
+                args=(worker_id, self.host, self.port, self.ingest_queue, control_queue,
+                      self.log_queue, self.report_queue, self.trace_queue),
+                daemon=True
+            )
+            self.processes.append(worker)
+
+        for process in self.processes:
+            process.start()
+
+        self.log(f"🏠 Matriz multi-proceso: {self.num_workers} workers en {self.host}:{self.port}")
+        threading.Thread(target=self.run_change_pump, daemon=True).start()
+        threading.Thread(target=self.run_trace_pump, daemon=True).start()
+        self.run_log_pump()
+
+    def run_change_pump(self):
+        """Pasa a la réplica los cambios que guardó el escritor (la réplica se cargó antes de lanzarlo)."""
+        while True:
+            self.replica.publish(self.change_queue.get())
+
+    def run_trace_pump(self):
+        """Registra las confirmaciones de precios que reciben los workers."""
+        while True:
+            self.price_traces.record(self.trace_queue.get())
+
+    def run_log_pump(self):
+        """Reenvía a la GUI los logs de los workers y del escritor (ya traen hora)."""
+        while True:
+            message = self.log_queue.get()
+            if self.log_callback:
+                self.log_callback(message)
+            else:
+                print(message)
+
+    def broadcast_price(self, combustible, precio_base, traza=None, grupo=None, version=None):
+        """
+        Cada worker transmite el precio a los distribuidores conectados a él.
+        El catálogo lo escribe solo este proceso; los workers lo leen.
+        """
+        self.log(f"📣 Transmitiendo nuevo precio a {self.num_workers} workers: {combustible} a ${precio_base}")
+        if version is None:
+            version = self.price_catalog.add(combustible, precio_base, grupo)
+        if traza is None:
+            traza = self.price_traces.start(combustible, precio_base) # Una sola traza para todos los workers
+        for control_queue in self.control_queues:
+            control_queue.put(("PRECIO", combustible, precio_base, traza, grupo, version))
+
+    def broadcast_price_sheet(self, precios, vigencia_ms, grupo=None, version=None):
+        """Como broadcast_price: cada worker transmite la hoja a sus distribuidores."""
+        self.log(f"📣 Transmitiendo hoja de precios a {self.num_workers} workers: {len(precios)} precios")
+        if version is None:
+            version = self.price_catalog.add_sheet(precios, grupo, vigencia_ms)
+        for control_queue in self.control_queues:
+            control_queue.put(("HOJA", precios, vigencia_ms, grupo, version))
+
+    def request_profiling(self, accion, incluir_surtidores=False):
+        """Cada worker se perfila y reenvía la acción a sus distribuidores."""
+        self.profiling.handle(accion)
+        for control_queue in self.control_queues:
+            control_queue.put(("PERFIL", accion, incluir_surtidores))
+
+    def query_distribuidores(self, timeout=REPORT_TIMEOUT) -> dict:
+        """Cada worker consulta a sus distribuidores; aquí se juntan los parciales."""
+        with self.lock_reports:
+            request_id = uuid.uuid4().hex[:12]
+            for control_queue in self.control_queues:
+                control_queue.put(("REPORTE", request_id, timeout))
+
+            merged = {"resultados": {}, "rezagados": []}
+            received = 0
+            deadline = time.monotonic() + timeout + 1.0 # Margen para las colas entre procesos
+            while received < self.num_workers:
+                try:
+                    response_id, partial = self.report_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    self.log(f"⏳ {self.num_workers - received} workers no respondieron la consulta.")
+                    break
+                if response_id != request_id:
+                    continue # Parcial atrasado de una consulta anterior
+                merged["resultados"].update(partial["resultados"])
+                merged["rezagados"].extend(partial["rezagados"])
+                received += 1
+            return merged
@@ -0,0 +1,33 @@
+# totales en vivo para la GUI de la Matriz: cambios acumulados desde la última lectura
+import threading
+
+class LiveTotals:
+    """
+    Acumula lo que cambió en los reportes (litros y cargas por combustible y
+    por distribuidor). Lo alimenta la réplica de reportes a medida que aplica
+    los cambios guardados (un resumen reenviado llega como la diferencia con
+    el anterior). La GUI lo vacía cada cierto tiempo con drain() y suma los
+    incrementos a sus filas, sin consultar nada más.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_fuel = {} # combustible -> [litros, cargas] desde el último drain
+        self.by_distribuidor = {}
+
+    def add(self, distribuidor, combustible, litros, cargas):
+        with self.lock:
+            for index, key in ((self.by_fuel, combustible), (self.by_distribuidor, distribuidor)):
+                totals = index.get(key)
+                if totals is None:
+                    index[key] = [litros, cargas]
+                else:
+                    totals[0] += litros
+                    totals[1] += cargas
+
+    def drain(self) -> tuple:
+        """Retorna ({combustible: [litros, cargas]}, {distribuidor: [...]}) y los reinicia."""
+        with self.lock:
+            deltas = (self.by_fuel, self.by_distribuidor)
+            self.by_fuel = {}
+            self.by_distribuidor = {}
+        return deltas
@@ -0,0 +1,111 @@
+# catálogo de precios de la Matriz: último precio base de cada combustible (y grupo), versionado
+import sqlite3
+import threading
+import time
+
+CATALOGO_PATH = "matriz/catalogo_precios.sqlite"
+
+class PriceCatalog:
+    """
+    Precios base transmitidos por la Matriz, guardados en su propia BD
+    (independiente del motor de almacenamiento de las ventas). Cada precio
+    nuevo recibe la versión siguiente del catálogo, que solo crece; se
+    guarda una fila por (grupo, combustible) con la versión en que cambió.
+
+    Un distribuidor que (re)conecta informa la última versión que aplicó y
+    recibe solo las entradas posteriores (since()). Las entradas se aplican
+    en orden de versión, así que el resultado es el mismo que haber visto
+    cada broadcast.
+
+    Los precios de una hoja (add_sheet()) comparten versión y guardan su
+    hora de vigencia, para que un distribuidor que reconecta antes de esa
+    hora también los deje en espera.
+
+    Solo un proceso escribe (el principal); los workers de la Matriz
+    multi-proceso leen since() de la misma BD.
+    """
+    def __init__(self, db_path=CATALOGO_PATH, log=print):
+        self.db_path = db_path
+        self.log = log
+        self.lock = threading.Lock() # Serializa a los que agregan precios en este proceso
+        self._init_db()
+
+    def _init_db(self):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS catalogo (
+                grupo TEXT NOT NULL DEFAULT '',
+                combustible TEXT NOT NULL,
+                precio_base INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                actualizado_ms INTEGER NOT NULL,
+                vigencia_ms INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (grupo, combustible)
+            )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(catalogo)")]
+            if "vigencia_ms" not in columns:
+                # Catálogo creado antes de las hojas de precios
+                conn.execute("ALTER TABLE catalogo ADD COLUMN vigencia_ms INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_catalogo_version ON catalogo (version)")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            self.log(f"Error inicializando el catálogo de precios: {e}")
+
+    def add(self, combustible, precio_base, grupo=None) -> int | None:
+        """Guarda un precio con la versión siguiente y la retorna (None si falló)."""
+        return self.add_sheet({combustible: precio_base}, grupo)
+
+    def add_sheet(self, precios: dict, grupo=None, vigencia_ms=0) -> int | None:
+        """
+        Guarda varios precios ({combustible: precio_base}) en una sola
+        transacción y con una sola versión, que retorna (None si falló).
+        """
+        with self.lock:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                with conn:
+                    version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM catalogo").fetchone()[0] + 1
+                    now_ms = int(time.time() * 1000)
+                    for combustible, precio_base in precios.items():
+                        if not grupo:
+                            # El precio general reemplaza a los de grupo del mismo combustible
+                            conn.execute("DELETE FROM catalogo WHERE combustible = ? AND grupo != ''", (combustible,))
+                        conn.execute("""
+                        INSERT INTO catalogo (grupo, combustible, precio_base, version, actualizado_ms, vigencia_ms)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (grupo, combustible) DO UPDATE SET
+                            precio_base = excluded.precio_base,
+                            version = excluded.version,
+                            actualizado_ms = excluded.actualizado_ms,
+                            vigencia_ms = excluded.vigencia_ms
+                        """, (grupo or '', combustible, precio_base, version, now_ms, vigencia_ms))
+                conn.close()
+                return version
+            except Exception as e:
+                self.log(f"Error guardando {', '.join(precios)} en el catálogo de precios: {e}")
+                return None
+
+    def since(self, version) -> tuple:
+        """
+        Retorna (versión actual, [[version, combustible, precio_base, grupo, vigencia_ms], ...])
+        con las entradas posteriores a 'version', en orden. vigencia_ms es 0
+        salvo en los precios de una hoja.
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM catalogo").fetchone()[0]
+            rows = conn.execute(
+                "SELECT version, combustible, precio_base, grupo, vigencia_ms FROM catalogo "
+                "WHERE version > ? ORDER BY version",
+                (version,)
+            ).fetchall()
+            conn.close()
+        except Exception as e:
+            self.log(f"Error leyendo el catálogo de precios: {e}")
+            return 0, []
+        return current, [
+            [v, comb, precio, grupo or None, vigencia_ms] for v, comb, precio, grupo, vigencia_ms in rows
+        ]
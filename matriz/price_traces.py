@@ -0,0 +1,97 @@
+# latencia de propagación de precios: Matriz -> Distribuidor -> Surtidor, desglosada por salto
+import collections
+import threading
+
+from common.profiling import LatencyHistogram
+from common.tracing import (
+    new_trace, hop_times,
+    SALTO_MATRIZ_ENVIA, SALTO_DISTRIBUIDOR_RECIBE, SALTO_DISTRIBUIDOR_ENVIA,
+    SALTO_SURTIDOR_RECIBE, SALTO_SURTIDOR_APLICA
+)
+
+# Trazas recientes que se recuerdan para el resumen por precio
+MAX_TRAZAS = 20
+
+class PriceTraces:
+    """
+    Junta las confirmaciones (PrecioAplicadoMessage) de los precios trazados
+    y desglosa el tiempo de cada uno hasta aplicarse en el surtidor:
+      - red: Matriz -> Distribuidor y Distribuidor -> Surtidor
+      - cola: dentro del Distribuidor (cálculo y envío) y dentro del surtidor
+        (sin contar lo retenido)
+      - retenido: el precio esperó a que terminara una venta
+      - total: desde broadcast_price hasta aplicado
+    Las marcas vienen de relojes de hosts distintos: un desfase negativo se
+    toma como 0.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {
+            name: LatencyHistogram(name) for name in ("red", "cola", "retenido", "total")
+        }
+        self.recent = collections.OrderedDict() # id de traza -> {"combustible", "confirmados", "max_total"}
+
+    def start(self, combustible, precio_base):
+        """Traza nueva para un broadcast de precio (None si el trazado está apagado)."""
+        if not self.enabled:
+            return None
+        traza = new_trace()
+        with self.lock:
+            self.recent[traza["id"]] = {"combustible": combustible, "confirmados": 0, "max_total": 0.0}
+            while len(self.recent) > MAX_TRAZAS:
+                self.recent.popitem(last=False)
+        return traza
+
+    def record(self, msg) -> dict | None:
+        """
+        Registra una confirmación. Retorna el desglose en segundos, o None si
+        la traza viene mal formada (llega de la red: se descarta sin lanzar).
+        """
+        times = _valid_times(msg.traza)
+        if times is None or SALTO_MATRIZ_ENVIA not in times or not _is_number(msg.retenido):
+            return None
+        t0 = times[SALTO_MATRIZ_ENVIA]
+        t1 = times.get(SALTO_DISTRIBUIDOR_RECIBE, t0)
+        t2 = times.get(SALTO_DISTRIBUIDOR_ENVIA, t1)
+        t3 = times.get(SALTO_SURTIDOR_RECIBE, t2)
+        t4 = times.get(SALTO_SURTIDOR_APLICA, t3)
+        breakdown = {
+            "red": max(0.0, t1 - t0) + max(0.0, t3 - t2),
+            "cola": max(0.0, t2 - t1) + max(0.0, t4 - t3 - msg.retenido),
+            "retenido": max(0.0, msg.retenido),
+            "total": max(0.0, t4 - t0),
+        }
+        with self.lock:
+            for name, seconds in breakdown.items():
+                self.histograms[name].record(seconds)
+            trace = self.recent.get(msg.traza["id"])
+            if trace is not None:
+                trace["confirmados"] += 1
+                trace["max_total"] = max(trace["max_total"], breakdown["total"])
+        return breakdown
+
+    def summary(self) -> list:
+        """Líneas de texto para el log de la GUI."""
+        with self.lock:
+            lines = [histogram.summary() for histogram in self.histograms.values()]
+            for trace_id, trace in self.recent.items():
+                lines.append(f"{trace_id} {trace['combustible']}: {trace['confirmados']} surtidores, "
+                             f"último a los {trace['max_total'] * 1000:.1f}ms")
+        return lines
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _valid_times(traza) -> dict | None:
+    """{salto: epoch} de una traza recibida, o None si no tiene la forma esperada."""
+    if not isinstance(traza, dict) or not isinstance(traza.get("id"), str):
+        return None
+    saltos = traza.get("saltos")
+    if not isinstance(saltos, list):
+        return None
+    for salto in saltos:
+        if not (isinstance(salto, list) and len(salto) == 2
+                and isinstance(salto[0], str) and _is_number(salto[1])):
+            return None
+    return hop_times(traza)
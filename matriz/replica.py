@@ -0,0 +1,146 @@
+# réplica de lectura de la Matriz: totales en memoria alimentados por los cambios de la ingesta
+import collections
+import threading
+import time
+
+# Cambios publicados que la réplica guarda tal cual sin aplicar. Pasado ese
+# número, publish() no espera (la ingesta nunca se frena por los reportes):
+# suma el cambio a un delta acumulado por (distribuidor, combustible).
+MAX_PENDING = 1000
+
+class ReportReplica:
+    """
+    Copia de los reportes (totales por combustible y por distribuidor) que
+    se lee sin tocar el almacenamiento. Se carga una vez con el reporte del
+    almacenamiento y después aplica, en su propio hilo, los cambios que
+    publica quien escribe: cada lote guardado es un cambio
+    (guardado_en, transacciones, resúmenes, resúmenes reemplazados).
+
+    Al aplicar un cambio también lo suma a 'live' (LiveTotals), así la vista
+    en vivo de la GUI y el reporte salen del mismo flujo.
+    """
+    def __init__(self, live=None):
+        self.live = live
+        self.lock = threading.Lock() # Protege los totales
+        self.by_fuel = {} # combustible -> [litros, cargas]
+        self.by_distribuidor = {}
+        self.pending = collections.deque() # Cambios publicados sin aplicar
+        # Cambios que llegaron con 'pending' lleno, ya sumados:
+        # (distribuidor, combustible) -> [litros, cargas]
+        self.merged = {}
+        self.merged_since = None # Cuándo se guardó el más antiguo de 'merged'
+        self.condition = threading.Condition()
+        self.applied_at = None # Cuándo se guardó el último cambio aplicado (time.time)
+
+    def load(self, reports):
+        """Carga los totales iniciales desde un fetch_reports() del almacenamiento."""
+        report_comb, report_dist = reports
+        with self.lock:
+            self.by_fuel = {comb: [litros, cargas] for comb, litros, cargas in report_comb}
+            self.by_distribuidor = {dist: [litros, cargas] for dist, litros, cargas in report_dist}
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def publish(self, change):
+        """
+        Encola un cambio ya guardado. Nunca bloquea a quien escribe: con
+        MAX_PENDING cambios sin aplicar (ej: un reporte lento tiene tomado el
+        lock de los totales) el cambio se suma al delta acumulado, que se
+        aplica de una vez. Los totales son sumas: el resultado es el mismo.
+        """
+        with self.condition:
+            if len(self.pending) < MAX_PENDING:
+                self.pending.append(change)
+            else:
+                self._merge(change)
+            self.condition.notify_all()
+
+    def _merge(self, change):
+        """Función interna. Asume que la condición ya está adquirida."""
+        saved_at, tx_rows, summary_rows, replaced = change
+        deltas = [(dist, comb, litros, cargas) for _, dist, _, comb, litros, cargas in tx_rows]
+        deltas += [(dist, comb, litros, cargas) for dist, _, _, _, comb, litros, cargas in summary_rows]
+        deltas += [(dist, comb, -litros, -cargas) for dist, comb, litros, cargas in replaced]
+        if deltas and self.merged_since is None:
+            self.merged_since = saved_at
+        for dist, comb, litros, cargas in deltas:
+            totals = self.merged.get((dist, comb))
+            if totals is None:
+                self.merged[(dist, comb)] = [litros, cargas]
+            else:
+                totals[0] += litros
+                totals[1] += cargas
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.merged:
+                    self.condition.wait()
+                if not self.pending:
+                    # El delta acumulado pasa a ser un cambio más, con una
+                    # fila por (distribuidor, combustible)
+                    rows = [(None, dist, None, comb, litros, cargas)
+                            for (dist, comb), (litros, cargas) in self.merged.items()]
+                    self.pending.append((self.merged_since, rows, [], []))
+                    self.merged = {}
+                    self.merged_since = None
+                change = self.pending[0] # Sigue contando para lag() hasta aplicarse
+            self._apply(change)
+            with self.condition:
+                self.pending.popleft()
+                self.applied_at = change[0]
+                self.condition.notify_all()
+
+    def _apply(self, change):
+        _, tx_rows, summary_rows, replaced = change
+        with self.lock:
+            for _, dist, _, comb, litros, cargas in tx_rows:
+                self._add(dist, comb, litros, cargas)
+            for dist, _, _, _, comb, litros, cargas in summary_rows:
+                self._add(dist, comb, litros, cargas)
+            for dist, comb, litros, cargas in replaced:
+                self._add(dist, comb, -litros, -cargas)
+
+    def _add(self, dist, comb, litros, cargas):
+        """Función interna. Asume que el lock ya está adquirido."""
+        for index, key in ((self.by_fuel, comb), (self.by_distribuidor, dist)):
+            totals = index.get(key)
+            if totals is None:
+                index[key] = [litros, cargas]
+            else:
+                totals[0] += litros
+                totals[1] += cargas
+        if self.live is not None:
+            self.live.add(dist, comb, litros, cargas)
+
+    def lag(self) -> float:
+        """Segundos desde que se guardó el cambio más antiguo que la réplica aún no aplica (0 = al día)."""
+        with self.condition:
+            oldest = [self.pending[0][0]] if self.pending else []
+            if self.merged_since is not None:
+                oldest.append(self.merged_since)
+            if not oldest:
+                return 0.0
+            return max(0.0, time.time() - min(oldest))
+
+    def wait_applied(self, timeout=None) -> bool:
+        """Espera a que se apliquen todos los cambios publicados hasta ahora."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.merged, timeout)
+
+    def fetch_reports(self, reset_live=False):
+        """
+        Igual que MatrizStorage.fetch_reports, pero desde memoria. Con
+        'reset_live' descarta a la vez los cambios en vivo pendientes: ya
+        están incluidos en este reporte.
+        """
+        with self.lock:
+            report_comb = [(comb, litros, cargas) for comb, (litros, cargas) in self.by_fuel.items()]
+            report_dist = [(dist, litros, cargas) for dist, (litros, cargas) in self.by_distribuidor.items()]
+            if reset_live and self.live is not None:
+                self.live.drain()
+        report_comb.sort(key=lambda row: row[1], reverse=True)
+        report_dist.sort(key=lambda row: row[0])
+        return report_comb, report_dist
@@ -3,16 +3,27 @@ import socket
 import threading
 import sys
 import os
+import time
+import uuid
 
 # --- INICIO: Hack para importar 'common' ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 sys.path.append(project_root)
 
-from common.framer import frame_message, receive_message
+from common.framer import (
+    frame_message, receive_message, send_frame, queue_frame, set_nodelay, COMPRESSION_CAPABILITY
+)
+from common.heartbeat import (
+    IdleReaper, close_idle_socket,
+    HEARTBEAT_INTERVAL, READ_TIMEOUT, ESTADO_ALIVE
+)
+from common.profiling import ProfilingControl, install_signal_handlers, timed_stage
 from common.messages import (
     serialize, deserialize, PrecioUpdateMessage, 
-    TransaccionReportMessage, HeartbeatMessage
+    TransaccionReportMessage, ResumenVentasMessage, HeartbeatMessage, PerfilMessage,
+    ReportQueryMessage, ReportResultMessage, PrecioAplicadoMessage, CatalogoPreciosMessage,
+    HojaPreciosMessage
 )
 # --- FIN: Hack para importar 'common' ---
 
@@ -23,14 +34,30 @@ from datetime import datetime
 # --- FIN: Importaciones para la GUI ---
 
 # --- INICIO: Importaciones para la BD ---
-import sqlite3
+from matriz.storage import create_storage
+from matriz.live_totals import LiveTotals
+from matriz.replica import ReportReplica
+from matriz.price_traces import PriceTraces
+from matriz.price_catalog import PriceCatalog
 # --- FIN: Importaciones para la BD ---
 
 
 # Constantes
 HOST = '0.0.0.0'  # Escuchar en todas las interfaces
 PORT = 65432        # Puerto para la Matriz
+MATRIZ_ID = "MATRIZ" # ID usado en los heartbeats hacia los distribuidores
+# Procesos worker que atienden distribuidores. 1 = modo clásico (un solo proceso);
+# > 1 = modo multi-proceso con SO_REUSEPORT (ver matriz/cluster.py, solo Linux/BSD)
+MATRIZ_WORKERS = int(os.environ.get('MATRIZ_WORKERS', '1'))
+# Motor de almacenamiento: "sqlite" (por defecto) o "log" (segmentos de solo-anexado)
+MATRIZ_STORAGE = os.environ.get('MATRIZ_STORAGE', 'sqlite')
 COMBUSTIBLES = ["93", "95", "97", "Diesel", "Kerosene"] # Tipos válidos
+# Segundos que la Matriz espera las respuestas de una consulta de reportes
+REPORT_TIMEOUT = 2.0
+# Cada cuántos milisegundos la GUI aplica los cambios de los totales en vivo
+LIVE_REFRESH_MS = 1000
+# Trazar cada precio transmitido hasta que se aplica en los surtidores (0 = apagado)
+TRAZAR_PRECIOS = os.environ.get('TRAZAR_PRECIOS', '1') != '0'
 
 class MatrizServer:
     def __init__(self, host, port, log_callback):
@@ -39,10 +66,27 @@ class MatrizServer:
         self.log_callback = log_callback # Función para enviar logs a la GUI
         self.server_socket = None
         self.distribuidores = []
+        self.distribuidor_ids = {} # socket -> ID anunciado en sus heartbeats
+        self.pending_queries = {} # query_id -> consulta de reportes en curso
         self.lock = threading.Lock()
+        # Cierra distribuidores que dejan de enviar heartbeats (conexiones medio abiertas)
+        self.reaper = IdleReaper(name="matriz")
+        # Perfilado bajo demanda (SIGUSR1/SIGUSR2 en POSIX)
+        self.profiling = ProfilingControl("matriz")
+        # Cambios en los totales desde la última lectura (vista en vivo de la GUI)
+        self.live_totals = LiveTotals()
+        # Latencia de propagación de los precios (confirmaciones de los surtidores)
+        self.price_traces = PriceTraces(TRAZAR_PRECIOS)
+        # Últimos precios transmitidos, versionados: un distribuidor que
+        # reconecta recibe los que se perdió (ver _send_price_catalog)
+        self.price_catalog = PriceCatalog(log=self.log)
         
         # --- Base de Datos Central ---
-        self.db_path = "matriz/db_matriz.sqlite" 
+        # SQLite (por defecto) o el log de solo-anexado, según MATRIZ_STORAGE
+        self.storage = create_storage(MATRIZ_STORAGE, self.log)
+        # Los reportes (y la vista en vivo) se leen de esta réplica en memoria,
+        # nunca del almacenamiento: una consulta pesada no frena la ingesta
+        self.replica = ReportReplica(self.live_totals)
         self._init_db() 
 
     def log(self, message):
@@ -56,103 +100,66 @@ class MatrizServer:
 
     # --- INICIO: Funciones de Base de Datos ---
     def _init_db(self):
-        """Inicializa la BD central y crea la tabla si no existe."""
-        try:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transacciones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME NOT NULL,
-                distribuidor_id TEXT NOT NULL,
-                surtidor_id TEXT NOT NULL,
-                combustible TEXT NOT NULL,
-                litros REAL NOT NULL,
-                cargas INTEGER NOT NULL
-            )
-            """)
-            conn.commit()
-            conn.close()
-            self.log(f"Base de datos central inicializada en: {self.db_path}")
-        except Exception as e:
-            self.log(f"Error inicializando la base de datos: {e}")
+        """Inicializa el almacenamiento central (ver matriz/storage.py) y carga la réplica."""
+        self.storage.init()
+        self.replica.load(self.storage.fetch_reports())
+        self.replica.start()
 
+    @timed_stage("matriz._save_transaction")
     def _save_transaction(self, msg: TransaccionReportMessage):
         """Guarda un reporte de transacción en la base de datos central."""
-        try:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            cursor = conn.cursor()
-            
-            sql = """
-            INSERT INTO transacciones 
-                (timestamp, distribuidor_id, surtidor_id, combustible, litros, cargas) 
-            VALUES (?, ?, ?, ?, ?, ?)
-            """
-            params = (datetime.now(), msg.distribuidor_id, msg.surtidor_id, msg.combustible, msg.litros, msg.cargas)
-            cursor.execute(sql, params)
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            self.log(f"Error guardando transacción en BD central: {e}")
-    
+        params = (int(time.time() * 1000), msg.distribuidor_id, msg.surtidor_id, msg.combustible, msg.litros, msg.cargas)
+        self._insert_rows([params], [])
+
+    def _save_summary(self, msg: ResumenVentasMessage):
+        """Guarda (o reemplaza) los totales de un intervalo enviados por un distribuidor."""
+        params = [
+            (msg.distribuidor_id, msg.intervalo, msg.duracion, surtidor_id, combustible, litros, cargas)
+            for surtidor_id, combustible, litros, cargas in msg.filas
+        ]
+        self._insert_rows([], params)
+
+    def _insert_rows(self, tx_rows: list, summary_rows: list):
+        """Guarda transacciones y resúmenes (filas con nombres) y publica el cambio a la réplica."""
+        replaced = self.storage.insert_rows(tx_rows, summary_rows)
+        if replaced is not None:
+            self._publish_change((time.time(), tx_rows, summary_rows, replaced))
+
+    def _publish_change(self, change):
+        self.replica.publish(change)
+
     def fetch_reports(self):
-        """Consulta la BD y retorna los datos para los reportes."""
-        try:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            cursor = conn.cursor()
-            
-            # Reporte 1: Litros por combustible
-            sql_comb = """
-            SELECT 
-                combustible, 
-                SUM(litros) as total_litros,
-                SUM(cargas) as total_cargas
-            FROM transacciones
-            GROUP BY combustible
-            ORDER BY total_litros DESC
-            """
-            cursor.execute(sql_comb)
-            report_comb = cursor.fetchall()
-            
-            # Reporte 2: Actividad por distribuidor
-            sql_dist = """
-            SELECT
-                distribuidor_id,
-                SUM(litros) as total_litros,
-                SUM(cargas) as total_cargas
-            FROM transacciones
-            GROUP BY distribuidor_id
-            ORDER BY distribuidor_id ASC
-            """
-            cursor.execute(sql_dist)
-            report_dist = cursor.fetchall()
-            
-            conn.close()
-            return report_comb, report_dist
-            
-        except Exception as e:
-            self.log(f"Error generando reportes: {e}")
-            return [], []
-            
+        """Retorna los datos para los reportes (desde la réplica, puede ir hasta replica.lag() atrasada)."""
+        return self.replica.fetch_reports()
+
     # --- FIN: Funciones de Base de Datos ---
 
+    def _create_server_socket(self) -> socket.socket:
+        """Crea el socket de escucha (los workers lo redefinen para usar SO_REUSEPORT)."""
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen()
+        return server_socket
+
     def start(self):
         """Inicia el servidor y escucha conexiones."""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen()
+        self.server_socket = self._create_server_socket()
         self.log(f"🏠 Servidor Matriz escuchando en {self.host}:{self.port}")
 
+        self.reaper.start()
+        heartbeat_thread = threading.Thread(target=self.run_heartbeats, daemon=True)
+        heartbeat_thread.start()
+
         try:
             while True:
                 client_socket, addr = self.server_socket.accept()
                 self.log(f"📦 Nueva conexión de Distribuidor desde {addr}")
+                client_socket.settimeout(READ_TIMEOUT) # Deadline de lectura
+                set_nodelay(client_socket)
 
                 with self.lock:
                     self.distribuidores.append(client_socket)
+                self.reaper.register(client_socket, close_idle_socket)
 
                 client_thread = threading.Thread(
                     target=self.handle_distribuidor, 
@@ -174,19 +181,44 @@ class MatrizServer:
                 if msg_bytes is None:
                     self.log(f"🔌 Distribuidor {addr} desconectado.")
                     break
+                self.reaper.touch(client_socket)
                 
                 msg_obj = deserialize(msg_bytes)
 
-                if isinstance(msg_obj, TransaccionReportMessage):
+                if isinstance(msg_obj, TransaccionReportMessage) and not msg_obj.distribuidor_id:
+                    self.log(f"⚠️ Transacción sin distribuidor_id descartada ({addr}): {msg_obj}")
+
+                elif isinstance(msg_obj, TransaccionReportMessage):
                     log_msg = (f"📈 Reporte de '{msg_obj.distribuidor_id}' ({addr}): "
                                f"Surtidor {msg_obj.surtidor_id}, "
                                f"{msg_obj.combustible}, {msg_obj.litros:.2f}L, {msg_obj.cargas} cargas")
                     self.log(log_msg)
                     
                     self._save_transaction(msg_obj) 
+
+                elif isinstance(msg_obj, ResumenVentasMessage):
+                    self.log(f"📊 Resumen de '{msg_obj.distribuidor_id}' ({addr}): "
+                             f"intervalo {msg_obj.intervalo}, {len(msg_obj.filas)} filas")
+                    
+                    self._save_summary(msg_obj)
                           
                 elif isinstance(msg_obj, HeartbeatMessage):
-                    self.log(f"❤️ Heartbeat de {msg_obj.id} ({addr}): {msg_obj.estado}")
+                    # Los heartbeats periódicos solo renuevan el reaper; no se loguean
+                    if msg_obj.estado != ESTADO_ALIVE:
+                        self.log(f"❤️ Heartbeat de {msg_obj.id} ({addr}): {msg_obj.estado}")
+                        with self.lock:
+                            self.distribuidor_ids[client_socket] = msg_obj.id
+                        if msg_obj.version_precios is not None:
+                            self._send_price_catalog(client_socket, msg_obj)
+
+                    if COMPRESSION_CAPABILITY in msg_obj.capacidades:
+                        self._accept_compression(client_socket)
+
+                elif isinstance(msg_obj, ReportResultMessage):
+                    self._on_report_result(client_socket, msg_obj)
+
+                elif isinstance(msg_obj, PrecioAplicadoMessage):
+                    self._on_price_applied(msg_obj)
                     
                 else:
                     self.log(f"🤔 Mensaje desconocido de {addr}: {msg_obj}")
@@ -194,32 +226,201 @@ class MatrizServer:
         except ConnectionError as e:
             self.log(f"❌ Error de conexión con {addr}: {e}")
         finally:
+            self.reaper.unregister(client_socket)
             with self.lock:
-                self.distribuidores.remove(client_socket)
+                self.distribuidor_ids.pop(client_socket, None)
+                # Puede haber sido removido ya por un broadcast fallido
+                if client_socket in self.distribuidores:
+                    self.distribuidores.remove(client_socket)
             client_socket.close()
 
-    def broadcast_price(self, combustible, precio_base):
-        """Envía una actualización de precio a TODOS los distribuidores."""
-        self.log(f"📣 Transmitiendo nuevo precio: {combustible} a ${precio_base}")
+    def _accept_compression(self, client_socket):
+        """Confirma al distribuidor que la Matriz acepta frames comprimidos."""
+        reply = HeartbeatMessage(MATRIZ_ID, "online", capacidades=[COMPRESSION_CAPABILITY])
+        framed_msg = frame_message(serialize(reply))
+        try:
+            send_frame(client_socket, framed_msg) # send_frame no se intercala con un broadcast
+        except Exception as e:
+            self.log(f"Error confirmando compresión: {e}")
+
+    def _send_price_catalog(self, client_socket, msg: HeartbeatMessage):
+        """Envía, en un solo frame, los precios del catálogo que el distribuidor no tiene."""
+        current, entries = self.price_catalog.since(msg.version_precios)
+        complete = msg.version_precios > current
+        if complete:
+            # El distribuidor viene de un catálogo anterior (ej: se borró la BD): todo de nuevo
+            current, entries = self.price_catalog.since(0)
+        if not entries:
+            return
+        reply = CatalogoPreciosMessage(current, entries, complete)
+        try:
+            send_frame(client_socket, frame_message(serialize(reply)))
+        except Exception as e:
+            self.log(f"Error enviando el catálogo de precios a {msg.id}: {e}")
+            return
+        self.log(f"🗂️ {msg.id} estaba en v{msg.version_precios}: enviados {len(entries)} precios (v{current}).")
+
+    def run_heartbeats(self):
+        """Envía un heartbeat periódico a todos los distribuidores."""
+        msg_bytes = serialize(HeartbeatMessage(MATRIZ_ID, ESTADO_ALIVE))
+        framed_msg = frame_message(msg_bytes)
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self._send_to_all(framed_msg)
+
+    @timed_stage("matriz.broadcast")
+    def _send_to_all(self, framed_msg, coalesce=False) -> int:
+        """
+        Envía un mensaje ya enmarcado a todos los distribuidores. Retorna a
+        cuántos se envió (o encoló) sin error, de los que estaban conectados
+        al empezar. Con 'coalesce' el frame se encola (queue_frame) y sale
+        junto con los que se envíen enseguida; un error de envío se detecta
+        en el próximo (y ese distribuidor todavía cuenta en este).
+        """
+        send = queue_frame if coalesce else send_frame
+        # Se envía sobre una copia de la lista, sin el lock: un distribuidor
+        # lento no frena a los que se conectan o desconectan mientras tanto.
+        with self.lock:
+            targets = list(self.distribuidores)
+
+        disconnected_clients = []
+        for sock in targets:
+            try:
+                send(sock, framed_msg)
+            except Exception as e:
+                self.log(f"Error enviando a un distribuidor: {e}")
+                disconnected_clients.append(sock)
+
+        with self.lock:
+            for sock in disconnected_clients:
+                # Puede haber sido removido ya por su propio hilo
+                if sock in self.distribuidores:
+                    self.distribuidores.remove(sock)
+                sock.close()
+        return len(targets) - len(disconnected_clients)
+
+    def broadcast_price(self, combustible, precio_base, traza=None, grupo=None, version=None):
+        """
+        Envía una actualización de precio a TODOS los distribuidores. Con
+        'grupo' el precio es solo para los surtidores de ese grupo de estación.
+        Si no se pasa 'version' se guarda antes en el catálogo, y si no se
+        pasa 'traza' (y el trazado está activo) se crea una nueva.
+        """
+        destino = f" (grupo '{grupo}')" if grupo else ""
+        self.log(f"📣 Transmitiendo nuevo precio{destino}: {combustible} a ${precio_base}")
         
-        msg_obj = PrecioUpdateMessage(combustible, precio_base)
+        if version is None:
+            version = self.price_catalog.add(combustible, precio_base, grupo)
+        if traza is None:
+            traza = self.price_traces.start(combustible, precio_base)
+        msg_obj = PrecioUpdateMessage(combustible, precio_base, traza, grupo, version)
         msg_bytes = serialize(msg_obj)
         framed_msg = frame_message(msg_bytes)
         
-        disconnected_clients = []
+        # Varios precios seguidos (ej: una planilla) viajan en un solo envío por distribuidor
+        sent_count = self._send_to_all(framed_msg, coalesce=True)
+        
+        self.log(f"✅ Precio enviado a {sent_count} distribuidores.")
+
+    def broadcast_price_sheet(self, precios: dict, vigencia_ms, grupo=None, version=None):
+        """
+        Envía varios precios base ({combustible: precio}) en un solo mensaje.
+        Distribuidores y surtidores los dejan en espera y los aplican todos
+        juntos a la hora 'vigencia_ms' (epoch ms).
+        """
+        destino = f" (grupo '{grupo}')" if grupo else ""
+        hora = datetime.fromtimestamp(vigencia_ms / 1000).strftime("%H:%M:%S")
+        self.log(f"📣 Transmitiendo hoja de precios{destino}, vigente a las {hora}: "
+                 + ", ".join(f"{comb} a ${precio}" for comb, precio in precios.items()))
+
+        if version is None:
+            version = self.price_catalog.add_sheet(precios, grupo, vigencia_ms)
+        msg_bytes = serialize(HojaPreciosMessage(precios, vigencia_ms, grupo, version))
+        sent_count = self._send_to_all(frame_message(msg_bytes), coalesce=True)
+
+        self.log(f"✅ Hoja de precios enviada a {sent_count} distribuidores.")
+
+    def _on_price_applied(self, msg: PrecioAplicadoMessage):
+        """Un surtidor confirmó un precio trazado."""
+        self.price_traces.record(msg)
+
+    def request_profiling(self, accion, incluir_surtidores=False):
+        """Aplica una acción de perfilado aquí y en todos los distribuidores (y opcionalmente sus surtidores)."""
+        self.log(f"🔬 Perfilado remoto: '{accion}' a todos los distribuidores")
+        self.profiling.handle(accion)
+        msg_bytes = serialize(PerfilMessage(accion, incluir_surtidores))
+        self._send_to_all(frame_message(msg_bytes))
+
+    # --- Consultas de reportes federadas ---
+
+    def query_distribuidores(self, timeout=REPORT_TIMEOUT) -> dict:
+        """
+        Envía un REPORT_QUERY a todos los distribuidores conectados y espera
+        sus respuestas hasta 'timeout' segundos. Cada distribuidor calcula sus
+        totales en paralelo con su propia BD. Retorna
+        {"resultados": {distribuidor_id: filas}, "rezagados": [distribuidor_id]}.
+        """
+        query_id = uuid.uuid4().hex[:12]
+        pending = {"esperados": {}, "resultados": {}, "listo": threading.Event()}
         with self.lock:
             for sock in self.distribuidores:
-                try:
-                    sock.sendall(framed_msg)
-                except Exception as e:
-                    self.log(f"Error enviando a {sock.getpeername()}: {e}")
-                    disconnected_clients.append(sock)
+                pending["esperados"][sock] = self.distribuidor_ids.get(sock, "desconocido")
+            self.pending_queries[query_id] = pending
+        if not pending["esperados"]:
+            pending["listo"].set()
 
-            for sock in disconnected_clients:
-                self.distribuidores.remove(sock)
-                sock.close()
-        
-        self.log(f"✅ Precio enviado a {len(self.distribuidores)} distribuidores.")
+        self._send_to_all(frame_message(serialize(ReportQueryMessage(query_id))))
+        pending["listo"].wait(timeout)
+
+        with self.lock:
+            del self.pending_queries[query_id]
+            resultados = {msg.distribuidor_id: msg.filas for msg in pending["resultados"].values()}
+            rezagados = [
+                dist_id for sock, dist_id in pending["esperados"].items()
+                if sock not in pending["resultados"]
+            ]
+        return {"resultados": resultados, "rezagados": rezagados}
+
+    def _on_report_result(self, client_socket, msg: ReportResultMessage):
+        with self.lock:
+            pending = self.pending_queries.get(msg.query_id)
+            if pending is None or client_socket not in pending["esperados"]:
+                return # Llegó después del plazo
+            pending["resultados"][client_socket] = msg
+            if len(pending["resultados"]) == len(pending["esperados"]):
+                pending["listo"].set()
+
+    def federated_report(self, timeout=REPORT_TIMEOUT):
+        """
+        Igual que fetch_reports, pero calculado por los distribuidores con sus
+        BDs locales (historial completo, aunque no hayan sincronizado).
+        Retorna (report_comb, report_dist, rezagados).
+        """
+        start = time.perf_counter()
+        partial = self.query_distribuidores(timeout)
+        by_comb = {}
+        by_dist = {}
+        for dist_id, filas in partial["resultados"].items():
+            dist_totals = by_dist.setdefault(dist_id, [0.0, 0])
+            for combustible, litros, cargas in filas:
+                comb_totals = by_comb.setdefault(combustible, [0.0, 0])
+                comb_totals[0] += litros
+                comb_totals[1] += cargas
+                dist_totals[0] += litros
+                dist_totals[1] += cargas
+
+        report_comb = sorted(
+            ((comb, litros, cargas) for comb, (litros, cargas) in by_comb.items()),
+            key=lambda row: row[1], reverse=True
+        )
+        report_dist = sorted((dist, litros, cargas) for dist, (litros, cargas) in by_dist.items())
+        rezagados = sorted(partial["rezagados"])
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.log(f"📋 Consulta federada: {len(partial['resultados'])} respuestas en {elapsed_ms:.0f} ms.")
+        if rezagados:
+            self.log(f"⏳ Sin respuesta dentro del plazo: {', '.join(rezagados)}")
+        return report_comb, report_dist, rezagados
 
 # --- INICIO: Clase para la GUI (AdminApp) ---
 
@@ -252,6 +453,12 @@ class AdminApp:
         self.server = None
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        # Totales mostrados en las tablas (nombre -> [litros, cargas]). En modo
+        # en vivo se les suman los cambios que publica el servidor.
+        self.shown_fuel = {}
+        self.shown_distribuidor = {}
+        self.live_mode = True
+
     def setup_control_tab(self):
         """Pone todos los widgets en la pestaña de Control."""
         # --- Frame de Controles (Arriba) ---
@@ -271,10 +478,24 @@ class AdminApp:
         self.precio_entry = ttk.Entry(controls_frame)
         self.precio_entry.grid(row=1, column=1, padx=5, pady=5, sticky=tk.EW)
 
+        ttk.Label(controls_frame, text="Grupo (opcional):").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+        self.grupo_entry = ttk.Entry(controls_frame)
+        self.grupo_entry.grid(row=2, column=1, padx=5, pady=5, sticky=tk.EW)
+
         self.send_button = ttk.Button(
             controls_frame, text="Transmitir Precio", command=self.on_send_price
         )
-        self.send_button.grid(row=0, column=2, rowspan=2, padx=10, pady=5, sticky="NS")
+        self.send_button.grid(row=0, column=2, rowspan=3, padx=10, pady=5, sticky="NS")
+
+        self.traces_button = ttk.Button(
+            controls_frame, text="Latencias de Precio", command=self.on_show_price_traces
+        )
+        self.traces_button.grid(row=0, column=3, rowspan=3, padx=(0, 10), pady=5, sticky="NS")
+
+        self.sheet_button = ttk.Button(
+            controls_frame, text="Hoja de Precios", command=self.on_open_price_sheet
+        )
+        self.sheet_button.grid(row=0, column=4, rowspan=3, padx=(0, 10), pady=5, sticky="NS")
 
         # --- Frame de Logs (Abajo) ---
         logs_frame = ttk.Labelframe(self.control_tab, text="Logs del Servidor", padding="10")
@@ -292,7 +513,16 @@ class AdminApp:
         self.refresh_button = ttk.Button(
             self.reports_tab, text="Actualizar Reportes", command=self.on_refresh_reports
         )
-        self.refresh_button.pack(pady=10)
+        self.refresh_button.pack(pady=(10, 0))
+
+        # Consulta federada: cada distribuidor calcula sus totales con su BD local
+        self.federated_button = ttk.Button(
+            self.reports_tab, text="Consultar a Distribuidores", command=self.on_federated_report
+        )
+        self.federated_button.pack(pady=10)
+
+        self.report_mode_label = ttk.Label(self.reports_tab, text="")
+        self.report_mode_label.pack()
         
         # --- Frame para las dos tablas ---
         tables_frame = ttk.Frame(self.reports_tab)
@@ -329,6 +559,8 @@ class AdminApp:
             self.root.destroy()
             if self.server and self.server.server_socket:
                 self.server.server_socket.close()
+            if self.server:
+                self.server.storage.close() # El log guarda un checkpoint al cerrar
             print("Cerrando GUI y servidor...")
 
     def on_send_price(self):
@@ -348,10 +580,77 @@ class AdminApp:
             return
 
         if self.server:
-            self.server.broadcast_price(comb, precio_int)
+            # Sin grupo, el precio es para todos los surtidores
+            grupo = self.grupo_entry.get().strip() or None
+            self.server.broadcast_price(comb, precio_int, grupo=grupo)
             self.precio_entry.delete(0, tk.END)
         else:
             messagebox.showerror("Error", "El servidor no está conectado.")
+
+    def on_open_price_sheet(self):
+        """Callback del botón 'Hoja de Precios': varios precios con una sola hora de vigencia."""
+        window = tk.Toplevel(self.root)
+        window.title("Hoja de Precios")
+        frame = ttk.Frame(window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        entries = {}
+        for row, comb in enumerate(COMBUSTIBLES):
+            ttk.Label(frame, text=f"{comb}:").grid(row=row, column=0, padx=5, pady=2, sticky=tk.W)
+            entries[comb] = ttk.Entry(frame)
+            entries[comb].grid(row=row, column=1, padx=5, pady=2, sticky=tk.EW)
+
+        row = len(COMBUSTIBLES)
+        ttk.Label(frame, text="Vigente en (segundos):").grid(row=row, column=0, padx=5, pady=2, sticky=tk.W)
+        delay_entry = ttk.Entry(frame)
+        delay_entry.insert(0, "60")
+        delay_entry.grid(row=row, column=1, padx=5, pady=2, sticky=tk.EW)
+
+        ttk.Label(frame, text="Grupo (opcional):").grid(row=row + 1, column=0, padx=5, pady=2, sticky=tk.W)
+        grupo_entry = ttk.Entry(frame)
+        grupo_entry.grid(row=row + 1, column=1, padx=5, pady=2, sticky=tk.EW)
+
+        ttk.Button(
+            frame, text="Transmitir Hoja",
+            command=lambda: self.on_send_price_sheet(window, entries, delay_entry, grupo_entry)
+        ).grid(row=row + 2, column=0, columnspan=2, pady=(10, 0))
+
+    def on_send_price_sheet(self, window, entries, delay_entry, grupo_entry):
+        """Valida la hoja (los combustibles en blanco no cambian) y la transmite."""
+        precios = {}
+        try:
+            for comb, entry in entries.items():
+                if entry.get().strip():
+                    precios[comb] = int(entry.get())
+                    if precios[comb] <= 0: raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Los precios deben ser números enteros positivos.", parent=window)
+            return
+        if not precios:
+            messagebox.showerror("Error", "Debe ingresar al menos un precio.", parent=window)
+            return
+        try:
+            delay = float(delay_entry.get())
+            if delay < 0: raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "La vigencia debe ser un número de segundos.", parent=window)
+            return
+
+        if self.server:
+            vigencia_ms = int((time.time() + delay) * 1000)
+            self.server.broadcast_price_sheet(precios, vigencia_ms, grupo=grupo_entry.get().strip() or None)
+            window.destroy()
+        else:
+            messagebox.showerror("Error", "El servidor no está conectado.", parent=window)
+
+    def on_show_price_traces(self):
+        """Callback del botón 'Latencias de Precio': muestra el desglose en el log."""
+        if not self.server:
+            messagebox.showerror("Error", "El servidor no está conectado.")
+            return
+        self.server.log("⏱️ Propagación de precios (hasta aplicarse en el surtidor):")
+        for line in self.server.price_traces.summary():
+            self.server.log(f"   {line}")
             
     def on_refresh_reports(self):
         """Callback del botón 'Actualizar Reportes'."""
@@ -359,27 +658,98 @@ class AdminApp:
             messagebox.showerror("Error", "El servidor no está conectado.")
             return
         
-        # 1. Pedir los datos al servidor
-        report_comb, report_dist = self.server.fetch_reports()
-        
+        # 1. Pedir los datos a la réplica. Los cambios en vivo pendientes ya
+        #    están en el reporte, así que se descartan a la vez.
+        report_comb, report_dist = self.server.replica.fetch_reports(reset_live=True)
+        self._fill_report_tables(report_comb, report_dist)
+        self._set_live_mode(True)
+        self.log_to_widget(f"Reportes actualizados desde la réplica "
+                           f"(retraso {self.server.replica.lag() * 1000:.0f} ms).")
+
+    def start_live_view(self):
+        """Carga los reportes una vez y desde ahí aplica los cambios cada LIVE_REFRESH_MS."""
+        self.on_refresh_reports()
+        self.root.after(LIVE_REFRESH_MS, self._live_tick)
+
+    def _live_tick(self):
+        """Se ejecuta en el hilo de la GUI. El costo depende solo de las filas que cambiaron."""
+        by_fuel, by_distribuidor = self.server.live_totals.drain()
+        if self.live_mode:
+            self._apply_changes(self.report_comb_tree, "comb", self.shown_fuel, by_fuel)
+            self._apply_changes(self.report_dist_tree, "dist", self.shown_distribuidor, by_distribuidor)
+            self._set_live_mode(True) # Actualiza el retraso de la réplica
+        self.root.after(LIVE_REFRESH_MS, self._live_tick)
+
+    def _apply_changes(self, tree, prefix, shown, changes):
+        """Suma los cambios a las filas existentes (IDs estables) o agrega las nuevas."""
+        for name, (litros, cargas) in changes.items():
+            iid = f"{prefix}:{name}"
+            totals = shown.get(name)
+            if totals is None:
+                shown[name] = [litros, cargas]
+                tree.insert("", tk.END, iid=iid, values=(name, f"{litros:.2f}", cargas))
+                continue
+            totals[0] += litros
+            totals[1] += cargas
+            tree.set(iid, "litros", f"{totals[0]:.2f}")
+            tree.set(iid, "cargas", totals[1])
+
+    def _set_live_mode(self, live):
+        self.live_mode = live
+        if live:
+            self.report_mode_label.config(
+                text=f"En vivo (cada {LIVE_REFRESH_MS / 1000:g} s) · "
+                     f"retraso de la réplica: {self.server.replica.lag() * 1000:.0f} ms"
+            )
+        else:
+            self.report_mode_label.config(
+                text="Consulta federada: en vivo pausado ('Actualizar Reportes' para volver)"
+            )
+
+    def on_federated_report(self):
+        """Callback del botón 'Consultar a Distribuidores'."""
+        if not self.server:
+            messagebox.showerror("Error", "El servidor no está conectado.")
+            return
+
+        # La consulta espera hasta REPORT_TIMEOUT: en otro hilo, para no congelar la GUI
+        self.federated_button.config(state='disabled')
+        def run_query():
+            result = self.server.federated_report()
+            self.root.after(0, self._show_federated_report, result)
+        threading.Thread(target=run_query, daemon=True).start()
+
+    def _show_federated_report(self, result):
+        """Se ejecuta en el hilo de la GUI."""
+        report_comb, report_dist, rezagados = result
+        # Los distribuidores que no respondieron quedan marcados en la tabla
+        report_dist = report_dist + [(dist_id, None, "sin respuesta") for dist_id in rezagados]
+        self._fill_report_tables(report_comb, report_dist)
+        self._set_live_mode(False) # Los cambios en vivo se suman a los totales de la Matriz
+        self.federated_button.config(state='normal')
+
+    def _fill_report_tables(self, report_comb, report_dist):
         # 2. Limpiar tablas (Treeviews)
         for item in self.report_comb_tree.get_children():
             self.report_comb_tree.delete(item)
         for item in self.report_dist_tree.get_children():
             self.report_dist_tree.delete(item)
+        self.shown_fuel = {}
+        self.shown_distribuidor = {}
             
-        # 3. Insertar datos en tabla de combustibles
+        # 3. Insertar datos en tabla de combustibles (ID de fila estable: lo usa la vista en vivo)
         for row in report_comb:
             # Formatear los litros a 2 decimales
             formatted_row = (row[0], f"{row[1]:.2f}", row[2])
-            self.report_comb_tree.insert("", tk.END, values=formatted_row)
+            self.report_comb_tree.insert("", tk.END, iid=f"comb:{row[0]}", values=formatted_row)
+            self.shown_fuel[row[0]] = [row[1], row[2]]
             
         # 4. Insertar datos en tabla de distribuidores
         for row in report_dist:
-            formatted_row = (row[0], f"{row[1]:.2f}", row[2])
-            self.report_dist_tree.insert("", tk.END, values=formatted_row)
-            
-        self.log_to_widget("Reportes actualizados desde la base de datos.")
+            litros = "-" if row[1] is None else f"{row[1]:.2f}"
+            formatted_row = (row[0], litros, row[2])
+            self.report_dist_tree.insert("", tk.END, iid=f"dist:{row[0]}", values=formatted_row)
+            self.shown_distribuidor[row[0]] = [row[1], row[2]]
 
     def log_to_widget(self, message):
         """Función thread-safe para añadir logs al widget de texto."""
@@ -407,11 +777,19 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = AdminApp(root)
     
-    server = MatrizServer(HOST, PORT, app.log_to_widget)
+    if MATRIZ_WORKERS > 1 and hasattr(socket, "SO_REUSEPORT"):
+        from matriz.cluster import MatrizCluster
+        server = MatrizCluster(HOST, PORT, app.log_to_widget, MATRIZ_WORKERS)
+    else:
+        if MATRIZ_WORKERS > 1:
+            print("Aviso: SO_REUSEPORT no disponible en esta plataforma. Usando un solo proceso.")
+        server = MatrizServer(HOST, PORT, app.log_to_widget)
     app.server = server
+    install_signal_handlers(server.profiling)
 
     server_thread = threading.Thread(target=server.start, daemon=True)
     server_thread.start()
+    app.start_live_view()
 
     root.mainloop()
 
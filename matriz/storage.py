@@ -0,0 +1,652 @@
+# almacenamiento de la Matriz: interfaz común, SQLite y log estructurado de solo-anexado
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+from common.dimensions import (
+    DimensionCache, create_dimension_tables, fill_dimensions, SQL_DATETIME_A_MS,
+    DIMENSIONES, DIM_DISTRIBUIDORES, DIM_SURTIDORES, DIM_COMBUSTIBLES
+)
+
+SQLITE_PATH = "matriz/db_matriz.sqlite"
+LOG_DIR = "matriz/log_matriz"
+
+class MatrizStorage:
+    """
+    Operaciones de la Matriz sobre su almacenamiento. Las filas llegan con
+    nombres, como las arma MatrizServer:
+      transacciones: (timestamp_ms, distribuidor, surtidor, combustible, litros, cargas)
+      resúmenes: (distribuidor, intervalo, duracion, surtidor, combustible, litros, cargas)
+    Reenviar un resumen con la misma clave lo reemplaza.
+    """
+    def init(self):
+        raise NotImplementedError
+
+    def insert_rows(self, tx_rows: list, summary_rows: list) -> list | None:
+        """
+        Guarda las filas. Retorna los resúmenes que se reemplazaron, como
+        (distribuidor, combustible, litros, cargas) con los valores anteriores
+        (lo usa la réplica de reportes), o None si no se pudo guardar.
+        """
+        raise NotImplementedError
+
+    def fetch_reports(self) -> tuple:
+        """Retorna (por combustible, por distribuidor): filas (nombre, litros, cargas)."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SQLiteStorage(MatrizStorage):
+    """Tablas de hechos y dimensiones en SQLite. Es el almacenamiento por defecto."""
+    def __init__(self, db_path=SQLITE_PATH, log=print):
+        self.db_path = db_path
+        self.log = log
+        self.dimensions = DimensionCache(self.db_path) # Nombre -> código de cada dimensión
+
+    def init(self):
+        """Inicializa la BD central y crea las tablas si no existen."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            if "timestamp" in self._table_columns(cursor, "transacciones"):
+                self._migrate_v1(conn)
+            else:
+                self._create_tables(cursor)
+                conn.commit()
+            conn.close()
+            self.log(f"Base de datos central inicializada en: {self.db_path}")
+        except Exception as e:
+            self.log(f"Error inicializando la base de datos: {e}")
+
+    @staticmethod
+    def _table_columns(cursor, table) -> list:
+        return [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+
+    def _create_tables(self, cursor):
+        # IDs y combustibles se guardan como códigos de las tablas de
+        # dimensiones; la hora, como epoch en milisegundos.
+        create_dimension_tables(cursor)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transacciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp_ms INTEGER NOT NULL,
+            distribuidor_cod INTEGER NOT NULL,
+            surtidor_cod INTEGER NOT NULL,
+            combustible_cod INTEGER NOT NULL,
+            litros REAL NOT NULL,
+            cargas INTEGER NOT NULL
+        )
+        """)
+
+        # Resúmenes por intervalo de los distribuidores en modo pre-agregado.
+        # La clave primaria hace que reenviar un resumen lo reemplace (idempotente).
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumenes (
+            distribuidor_cod INTEGER NOT NULL,
+            intervalo INTEGER NOT NULL,
+            duracion INTEGER NOT NULL,
+            surtidor_cod INTEGER NOT NULL,
+            combustible_cod INTEGER NOT NULL,
+            litros REAL NOT NULL,
+            cargas INTEGER NOT NULL,
+            PRIMARY KEY (distribuidor_cod, intervalo, surtidor_cod, combustible_cod)
+        )
+        """)
+
+    def _migrate_v1(self, conn):
+        """
+        Convierte una BD con el esquema anterior (IDs y combustibles como
+        texto en cada fila, hora como DATETIME) al esquema con dimensiones.
+        Todo en una transacción: si algo falla, la BD queda como estaba.
+        """
+        self.log("🔧 Migrando la BD central al esquema con tablas de dimensiones...")
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute("ALTER TABLE transacciones RENAME TO transacciones_v1")
+            # Las BDs anteriores al modo pre-agregado no tienen resúmenes
+            has_summaries = bool(self._table_columns(cursor, "resumenes"))
+            if has_summaries:
+                cursor.execute("ALTER TABLE resumenes RENAME TO resumenes_v1")
+            self._create_tables(cursor)
+
+            sources = {
+                DIM_DISTRIBUIDORES: ["SELECT distribuidor_id FROM transacciones_v1"],
+                DIM_SURTIDORES: ["SELECT surtidor_id FROM transacciones_v1"],
+                DIM_COMBUSTIBLES: ["SELECT combustible FROM transacciones_v1"],
+            }
+            if has_summaries:
+                sources[DIM_DISTRIBUIDORES].append("SELECT distribuidor_id FROM resumenes_v1")
+                sources[DIM_SURTIDORES].append("SELECT surtidor_id FROM resumenes_v1")
+                sources[DIM_COMBUSTIBLES].append("SELECT combustible FROM resumenes_v1")
+            fill_dimensions(cursor, {table: " UNION ".join(sql) for table, sql in sources.items()})
+
+            cursor.execute(f"""
+            INSERT INTO transacciones
+                (id, timestamp_ms, distribuidor_cod, surtidor_cod, combustible_cod, litros, cargas)
+            SELECT t.id, {SQL_DATETIME_A_MS.format(columna="t.timestamp")}, d.cod, s.cod, c.cod, t.litros, t.cargas
+            FROM transacciones_v1 t
+            JOIN dim_distribuidores d ON d.nombre = t.distribuidor_id
+            JOIN dim_surtidores s ON s.nombre = t.surtidor_id
+            JOIN dim_combustibles c ON c.nombre = t.combustible
+            """)
+            cursor.execute("DROP TABLE transacciones_v1")
+            if has_summaries:
+                cursor.execute("""
+                INSERT INTO resumenes
+                    (distribuidor_cod, intervalo, duracion, surtidor_cod, combustible_cod, litros, cargas)
+                SELECT d.cod, r.intervalo, r.duracion, s.cod, c.cod, r.litros, r.cargas
+                FROM resumenes_v1 r
+                JOIN dim_distribuidores d ON d.nombre = r.distribuidor_id
+                JOIN dim_surtidores s ON s.nombre = r.surtidor_id
+                JOIN dim_combustibles c ON c.nombre = r.combustible
+                """)
+                cursor.execute("DROP TABLE resumenes_v1")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.log("🔧 Migración completada.")
+
+    def insert_rows(self, tx_rows: list, summary_rows: list) -> list | None:
+        """
+        Inserta transacciones y resúmenes en una sola transacción de la BD.
+        Las filas traen los nombres; aquí se traducen a códigos de dimensión.
+        """
+        conn = None
+        replaced = []
+        try:
+            # Antes de abrir la transacción: un nombre nuevo se inserta en su dimensión
+            encode = self.dimensions.encode
+            tx_rows = [
+                (timestamp_ms, encode(DIM_DISTRIBUIDORES, dist), encode(DIM_SURTIDORES, surt),
+                 encode(DIM_COMBUSTIBLES, comb), litros, cargas)
+                for timestamp_ms, dist, surt, comb, litros, cargas in tx_rows
+            ]
+            names = [(dist, comb) for dist, _, _, _, comb, _, _ in summary_rows]
+            summary_rows = [
+                (encode(DIM_DISTRIBUIDORES, dist), intervalo, duracion, encode(DIM_SURTIDORES, surt),
+                 encode(DIM_COMBUSTIBLES, comb), litros, cargas)
+                for dist, intervalo, duracion, surt, comb, litros, cargas in summary_rows
+            ]
+
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            
+            if tx_rows:
+                sql = """
+                INSERT INTO transacciones 
+                    (timestamp_ms, distribuidor_cod, surtidor_cod, combustible_cod, litros, cargas) 
+                VALUES (?, ?, ?, ?, ?, ?)
+                """
+                cursor.executemany(sql, tx_rows)
+
+            if summary_rows:
+                # Fila a fila: se lee el valor que cada resumen reemplaza (los
+                # resúmenes son pocos comparados con las transacciones)
+                sql_previous = """
+                SELECT litros, cargas FROM resumenes
+                WHERE distribuidor_cod = ? AND intervalo = ? AND surtidor_cod = ? AND combustible_cod = ?
+                """
+                sql = """
+                INSERT OR REPLACE INTO resumenes 
+                    (distribuidor_cod, intervalo, duracion, surtidor_cod, combustible_cod, litros, cargas) 
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """
+                for (dist_name, comb_name), row in zip(names, summary_rows):
+                    dist, intervalo, _, surt, comb, _, _ = row
+                    previous = cursor.execute(sql_previous, (dist, intervalo, surt, comb)).fetchone()
+                    if previous is not None:
+                        replaced.append((dist_name, comb_name, *previous))
+                    cursor.execute(sql, row)
+            
+            conn.commit()
+            return replaced
+            
+        except Exception as e:
+            self.log(f"Error guardando datos en BD central: {e}")
+            return None
+        finally:
+            # Cerrar siempre: una conexión con la transacción abierta deja
+            # la BD bloqueada para los demás hilos ("database is locked")
+            if conn:
+                conn.close()
+    
+    def fetch_reports(self):
+        """Consulta la BD y retorna los datos para los reportes."""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            
+            # Las ventas llegan como transacciones individuales o como
+            # resúmenes por intervalo (modo pre-agregado); se suman ambas.
+            # Se agrupa por código y solo se buscan los nombres de los grupos.
+            
+            # Reporte 1: Litros por combustible
+            sql_comb = """
+            SELECT c.nombre, g.total_litros, g.total_cargas
+            FROM (
+                SELECT
+                    combustible_cod,
+                    SUM(litros) as total_litros,
+                    SUM(cargas) as total_cargas
+                FROM (
+                    SELECT combustible_cod, litros, cargas FROM transacciones
+                    UNION ALL
+                    SELECT combustible_cod, litros, cargas FROM resumenes
+                )
+                GROUP BY combustible_cod
+            ) g
+            JOIN dim_combustibles c ON c.cod = g.combustible_cod
+            ORDER BY g.total_litros DESC
+            """
+            cursor.execute(sql_comb)
+            report_comb = cursor.fetchall()
+            
+            # Reporte 2: Actividad por distribuidor
+            sql_dist = """
+            SELECT d.nombre, g.total_litros, g.total_cargas
+            FROM (
+                SELECT
+                    distribuidor_cod,
+                    SUM(litros) as total_litros,
+                    SUM(cargas) as total_cargas
+                FROM (
+                    SELECT distribuidor_cod, litros, cargas FROM transacciones
+                    UNION ALL
+                    SELECT distribuidor_cod, litros, cargas FROM resumenes
+                )
+                GROUP BY distribuidor_cod
+            ) g
+            JOIN dim_distribuidores d ON d.cod = g.distribuidor_cod
+            ORDER BY d.nombre ASC
+            """
+            cursor.execute(sql_dist)
+            report_dist = cursor.fetchall()
+            
+            conn.close()
+            return report_comb, report_dist
+            
+        except Exception as e:
+            self.log(f"Error generando reportes: {e}")
+            return [], []
+
+# --- Log estructurado ---
+
+# Tamaño de cada segmento (se reserva completo al crearlo)
+SEGMENT_SIZE = int(os.environ.get('MATRIZ_LOG_SEGMENT_MB', '64')) * 1024 * 1024
+# Cada cuántos segundos se bajan a disco las páginas escritas (msync)
+SYNC_INTERVAL = 1.0
+# Cada cuántos segundos se guarda un checkpoint de los índices
+CHECKPOINT_INTERVAL = 30.0
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Registro: [largo del payload][tipo][payload][CRC32 de todo lo anterior].
+# Un registro con tipo 0 marca el fin de los datos (el segmento nace en ceros).
+_HEADER = struct.Struct("<IB")
+_CRC = struct.Struct("<I")
+REC_DIMENSION = 1 # (dimensión, código) + nombre en UTF-8
+REC_TRANSACCION = 2
+REC_RESUMEN = 3
+_DIMENSION = struct.Struct("<BI")
+_TRANSACCION = struct.Struct("<qIIIdi") # timestamp_ms, dist, surt, comb, litros, cargas
+_RESUMEN = struct.Struct("<IqiIIdi") # dist, intervalo, duracion, surt, comb, litros, cargas
+_ZERO_BLOCK = bytes(1024 * 1024)
+
+class _Batch:
+    """Registros de un insert_rows todavía sin escribir y los cambios a los índices que traen."""
+    def __init__(self):
+        self.records = bytearray()
+        self.codes = {dim: {} for dim in DIMENSIONES} # Códigos nuevos sin escribir: nombre -> código
+        self.changes = [] # Se aplican a los índices recién después de escribir 'records'
+        self.replaced = [] # (dist, comb, litros, cargas) de los resúmenes reemplazados
+
+class LogStorage(MatrizStorage):
+    """
+    Ingesta en segmentos de solo-anexado mapeados en memoria. Guardar es
+    copiar registros al mapa (sin SQL ni commits); los reportes salen de
+    índices en memoria con los totales por combustible y por distribuidor.
+
+    Al iniciar se carga el último checkpoint de los índices y se reproducen
+    los registros posteriores. El primer registro incompleto o con CRC
+    inválido es la cola de una escritura cortada por una caída: se borra
+    desde ahí hasta el final del segmento.
+
+    Un solo proceso escribe. Otra instancia sobre el mismo directorio (el
+    proceso principal del modo multi-proceso) solo lee: antes de cada reporte
+    reproduce lo que el escritor anexó desde la última vez.
+    """
+    def __init__(self, log_dir=LOG_DIR, log=print, segment_size=SEGMENT_SIZE):
+        self.log_dir = log_dir
+        self.log = log
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.mm = None
+        self.written = False # Esta instancia anexó registros (es el escritor)
+        self.dirty = False # Hay escrituras sin msync
+        self._reset_indexes()
+
+    def _reset_indexes(self):
+        self.codes = {dim: {} for dim in DIMENSIONES} # nombre -> código
+        self.names = {dim: {} for dim in DIMENSIONES} # código -> nombre
+        self.by_fuel = {} # código de combustible -> [litros, cargas]
+        self.by_distribuidor = {} # código de distribuidor -> [litros, cargas]
+        self.summaries = {} # (dist, intervalo, surt, comb) -> (litros, cargas)
+        self.segment = 1
+        self.offset = 0 # Fin de los datos válidos en el segmento actual
+        self.checkpoint_offset = None # (segmento, offset) del último checkpoint
+
+    # --- Inicio y recuperación ---
+
+    def init(self):
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            start = time.perf_counter()
+            loaded = self._load_checkpoint()
+            self.mm = self._open_segment(self.segment)
+            self._replay(recover=True)
+            self.log(f"Log de ingesta inicializado en: {self.log_dir} "
+                     f"(segmento {self.segment}, {'con' if loaded else 'sin'} checkpoint, "
+                     f"{(time.perf_counter() - start) * 1000:.0f} ms)")
+            threading.Thread(target=self.run_maintenance, daemon=True).start()
+        except Exception as e:
+            self.log(f"Error inicializando el log de ingesta: {e}")
+
+    def _segment_path(self, number) -> str:
+        return os.path.join(self.log_dir, f"segmento-{number:06d}.log")
+
+    def _open_segment(self, number) -> mmap.mmap:
+        path = self._segment_path(number)
+        if not os.path.exists(path):
+            # Se reserva el espacio al crearlo: escribir en un mapa sobre un
+            # archivo disperso con el disco lleno mata el proceso (SIGBUS).
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.truncate(self.segment_size)
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(f.fileno(), 0, self.segment_size)
+            os.replace(tmp_path, path) # Los lectores nunca ven un segmento a medio crear
+        with open(path, "r+b") as f:
+            return mmap.mmap(f.fileno(), 0)
+
+    def _replay(self, recover=False):
+        """Aplica a los índices los registros desde (segmento, offset) hasta el final."""
+        while True:
+            self.offset = self._apply_records(self.offset)
+            if not os.path.exists(self._segment_path(self.segment + 1)):
+                break
+            # El escritor ya pasó al siguiente: este segmento quedó cerrado.
+            # Se relee por si anexó algo entre la lectura anterior y el cambio.
+            self.offset = self._apply_records(self.offset)
+            self.mm.close()
+            self.segment += 1
+            self.offset = 0
+            self.mm = self._open_segment(self.segment)
+        if recover and not self._is_zero_from(self.offset):
+            self.log(f"⚠️ Log de ingesta: cola incompleta en el segmento {self.segment} "
+                     f"(offset {self.offset}), se descarta.")
+            self.mm[self.offset:] = bytes(len(self.mm) - self.offset)
+            self.mm.flush()
+
+    def _is_zero_from(self, offset) -> bool:
+        """True si el segmento está en ceros desde 'offset' (se compara por bloques de 1 MB)."""
+        for start in range(offset, len(self.mm), len(_ZERO_BLOCK)):
+            block = self.mm[start:start + len(_ZERO_BLOCK)]
+            if block != _ZERO_BLOCK[:len(block)]:
+                return False
+        return True
+
+    def _apply_records(self, offset) -> int:
+        """Aplica registros válidos desde 'offset'; retorna dónde se detuvo."""
+        mm = self.mm
+        size = len(mm)
+        while offset + _HEADER.size <= size:
+            length, record_type = _HEADER.unpack_from(mm, offset)
+            if record_type == 0:
+                break # Fin de los datos
+            end = offset + _HEADER.size + length
+            if end + _CRC.size > size:
+                break
+            if zlib.crc32(mm[offset:end]) != _CRC.unpack_from(mm, end)[0]:
+                break # Registro cortado (o todavía escribiéndose)
+            self._apply(record_type, mm, offset + _HEADER.size, length)
+            offset = end + _CRC.size
+        return offset
+
+    def _apply(self, record_type, buf, start, length):
+        if record_type == REC_TRANSACCION:
+            _, dist, _, comb, litros, cargas = _TRANSACCION.unpack_from(buf, start)
+            self._add(dist, comb, litros, cargas)
+        elif record_type == REC_RESUMEN:
+            dist, intervalo, _, surt, comb, litros, cargas = _RESUMEN.unpack_from(buf, start)
+            self._replace_summary((dist, intervalo, surt, comb), litros, cargas)
+        elif record_type == REC_DIMENSION:
+            dim_index, code = _DIMENSION.unpack_from(buf, start)
+            name = bytes(buf[start + _DIMENSION.size:start + length]).decode("utf-8")
+            self._register(DIMENSIONES[dim_index], name, code)
+
+    # --- Índices en memoria ---
+
+    def _register(self, dim, name, code):
+        self.codes[dim][name] = code
+        self.names[dim][code] = name
+
+    def _add(self, dist, comb, litros, cargas):
+        for index, key in ((self.by_fuel, comb), (self.by_distribuidor, dist)):
+            totals = index.get(key)
+            if totals is None:
+                index[key] = [litros, cargas]
+            else:
+                totals[0] += litros
+                totals[1] += cargas
+
+    def _replace_summary(self, key, litros, cargas):
+        """Retorna el valor (litros, cargas) que se reemplazó, o None."""
+        dist, _, _, comb = key
+        previous = self.summaries.get(key)
+        if previous is not None:
+            self._add(dist, comb, -previous[0], -previous[1])
+        self.summaries[key] = (litros, cargas)
+        self._add(dist, comb, litros, cargas)
+        return previous
+
+    # --- Escritura ---
+
+    def insert_rows(self, tx_rows: list, summary_rows: list) -> list | None:
+        try:
+            with self.lock:
+                batch = _Batch()
+                for timestamp_ms, dist, surt, comb, litros, cargas in tx_rows:
+                    dist = self._encode(DIM_DISTRIBUIDORES, dist, batch)
+                    surt = self._encode(DIM_SURTIDORES, surt, batch)
+                    comb = self._encode(DIM_COMBUSTIBLES, comb, batch)
+                    self._append(batch, REC_TRANSACCION,
+                                 _TRANSACCION.pack(timestamp_ms, dist, surt, comb, litros, cargas))
+                    batch.changes.append((REC_TRANSACCION, dist, comb, litros, cargas))
+                for dist_name, intervalo, duracion, surt, comb_name, litros, cargas in summary_rows:
+                    dist = self._encode(DIM_DISTRIBUIDORES, dist_name, batch)
+                    surt = self._encode(DIM_SURTIDORES, surt, batch)
+                    comb = self._encode(DIM_COMBUSTIBLES, comb_name, batch)
+                    self._append(batch, REC_RESUMEN,
+                                 _RESUMEN.pack(dist, intervalo, duracion, surt, comb, litros, cargas))
+                    batch.changes.append((REC_RESUMEN, (dist, intervalo, surt, comb), litros, cargas,
+                                          dist_name, comb_name))
+                self._write_batch(batch)
+            return batch.replaced
+        except Exception as e:
+            self.log(f"Error guardando datos en el log de ingesta: {e}")
+            return None
+
+    def _encode(self, dim, name, batch) -> int:
+        code = self.codes[dim].get(name) or batch.codes[dim].get(name)
+        if code is None:
+            code = len(self.codes[dim]) + len(batch.codes[dim]) + 1
+            payload = _DIMENSION.pack(DIMENSIONES.index(dim), code) + name.encode("utf-8")
+            self._append(batch, REC_DIMENSION, payload)
+            batch.codes[dim][name] = code
+            batch.changes.append((REC_DIMENSION, dim, name, code))
+        return code
+
+    def _append(self, batch, record_type, payload):
+        """Agrega un registro al lote; si el lote ya no cabe en el segmento, escribe lo que hay."""
+        record = _HEADER.pack(len(payload), record_type) + payload
+        record += _CRC.pack(zlib.crc32(record))
+        if self.offset + len(batch.records) + len(record) > self.segment_size:
+            self._write_batch(batch)
+            self._roll()
+        batch.records += record
+
+    def _write_batch(self, batch):
+        """
+        Escribe los registros del lote y recién después aplica sus cambios a
+        los índices: si la escritura falla, la memoria queda igual que el disco
+        y reintentar el lote no cuenta nada dos veces.
+        """
+        self._write(batch.records)
+        for change in batch.changes:
+            if change[0] == REC_DIMENSION:
+                self._register(*change[1:])
+            elif change[0] == REC_TRANSACCION:
+                self._add(*change[1:])
+            else:
+                key, litros, cargas, dist_name, comb_name = change[1:]
+                previous = self._replace_summary(key, litros, cargas)
+                if previous is not None:
+                    batch.replaced.append((dist_name, comb_name, *previous))
+        batch.records.clear()
+        batch.changes.clear()
+        for codes in batch.codes.values():
+            codes.clear()
+
+    def _write(self, records):
+        if not records:
+            return
+        self.mm[self.offset:self.offset + len(records)] = records
+        self.offset += len(records)
+        self.written = True
+        self.dirty = True
+
+    def _roll(self):
+        """Cierra el segmento actual (a disco antes de escribir en el siguiente) y abre uno nuevo."""
+        self.mm.flush()
+        self.mm.close()
+        self.segment += 1
+        self.offset = 0
+        self.mm = self._open_segment(self.segment)
+
+    # --- Durabilidad y checkpoints ---
+
+    def run_maintenance(self):
+        """Baja las escrituras a disco cada SYNC_INTERVAL y guarda checkpoints."""
+        last_checkpoint = time.monotonic()
+        while not self.stop_event.wait(SYNC_INTERVAL):
+            try:
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self.checkpoint()
+                    last_checkpoint = time.monotonic()
+                else:
+                    self.sync()
+            except Exception as e:
+                self.log(f"Error en el mantenimiento del log de ingesta: {e}")
+
+    def sync(self):
+        with self.lock:
+            if self.dirty:
+                self.mm.flush()
+                self.dirty = False
+
+    def checkpoint(self):
+        """
+        Guarda los índices y la posición del log hasta donde los cubren. Solo
+        lo hace quien escribió algo desde el último checkpoint (el escritor).
+        """
+        with self.lock:
+            if not self.written or (self.segment, self.offset) == self.checkpoint_offset:
+                return
+            self.mm.flush() # El checkpoint nunca apunta a datos que no están en disco
+            self.dirty = False
+            state = {
+                "segmento": self.segment,
+                "offset": self.offset,
+                "dimensiones": {dim: dict(codes) for dim, codes in self.codes.items()},
+                "por_combustible": [(code, list(totals)) for code, totals in self.by_fuel.items()],
+                "por_distribuidor": [(code, list(totals)) for code, totals in self.by_distribuidor.items()],
+                "resumenes": [[*key, *value] for key, value in self.summaries.items()],
+            }
+            self.checkpoint_offset = (self.segment, self.offset)
+        path = os.path.join(self.log_dir, CHECKPOINT_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load_checkpoint(self) -> bool:
+        path = os.path.join(self.log_dir, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            for dim, codes in state["dimensiones"].items():
+                for name, code in codes.items():
+                    self._register(dim, name, code)
+            self.by_fuel = {code: totals for code, totals in state["por_combustible"]}
+            self.by_distribuidor = {code: totals for code, totals in state["por_distribuidor"]}
+            self.summaries = {
+                (dist, intervalo, surt, comb): (litros, cargas)
+                for dist, intervalo, surt, comb, litros, cargas in state["resumenes"]
+            }
+            self.segment = state["segmento"]
+            self.offset = state["offset"]
+            self.checkpoint_offset = (self.segment, self.offset)
+            return True
+        except Exception as e:
+            # Se reconstruye todo desde el primer segmento
+            self.log(f"⚠️ Checkpoint del log de ingesta inválido ({e}), se reproduce el log completo.")
+            self._reset_indexes()
+            return False
+
+    # --- Lectura ---
+
+    def fetch_reports(self):
+        try:
+            with self.lock:
+                self.offset = self._apply_records(self.offset)
+                if os.path.exists(self._segment_path(self.segment + 1)):
+                    self._replay()
+                names_fuel = self.names[DIM_COMBUSTIBLES]
+                names_dist = self.names[DIM_DISTRIBUIDORES]
+                report_comb = [(names_fuel[code], litros, cargas) for code, (litros, cargas) in self.by_fuel.items()]
+                report_dist = [(names_dist[code], litros, cargas) for code, (litros, cargas) in self.by_distribuidor.items()]
+            report_comb.sort(key=lambda row: row[1], reverse=True)
+            report_dist.sort(key=lambda row: row[0])
+            return report_comb, report_dist
+        except Exception as e:
+            self.log(f"Error generando reportes: {e}")
+            return [], []
+
+    def close(self):
+        self.stop_event.set()
+        self.checkpoint()
+        with self.lock:
+            if self.mm is not None:
+                self.mm.flush()
+                self.mm.close()
+                self.mm = None
+
+def create_storage(kind: str, log=print) -> MatrizStorage:
+    """Crea el almacenamiento de la Matriz: "sqlite" o "log"."""
+    if kind == "sqlite":
+        return SQLiteStorage(SQLITE_PATH, log)
+    if kind == "log":
+        return LogStorage(LOG_DIR, log)
+    raise ValueError(f"Almacenamiento desconocido: {kind} (usar 'sqlite' o 'log')")
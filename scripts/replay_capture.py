@@ -0,0 +1,167 @@
+# reproduce una captura de tráfico (CAPTURA_TRAFICO) contra una Matriz o un Distribuidor
+#
+# Uso:
+#   python scripts/replay_capture.py <captura> <host> <puerto> [--velocidad N] [--direccion recibidos|enviados] [--peer TEXTO] [--json]
+#
+#   --velocidad 1   tiempo real (por defecto); 10 = 10x más rápido; 0 = lo más rápido posible
+#   --direccion     qué frames de la captura se reenvían. 'recibidos' (por defecto) si la
+#                   captura se tomó en el mismo tipo de servidor que se quiere probar;
+#                   'enviados' si se tomó en el cliente (ej: un distribuidor grabando lo
+#                   que mandó a la Matriz).
+#   --peer          solo reproduce los peers cuyo ID contiene este texto
+#   --json          imprime el resumen como JSON (para guardarlo como línea base)
+#
+# Qué mide:
+#   envio       cuánto tardó cada sendall del cliente (crece si el servidor deja
+#               de leer y se llena el buffer del socket)
+#   retraso     cuánto se atrasó cada envío respecto a su hora en la captura
+#   vaciado     por conexión, desde el último frame enviado hasta que el
+#               servidor cierra: el tiempo que le tomó procesar lo que tenía
+#               pendiente de esa conexión. Los servidores procesan cada frame
+#               en el hilo lector antes de leer el siguiente, salvo lo que
+#               encolan para otro hilo (ej: los reportes que pasan por la cola
+#               de admisión del Distribuidor), que no entra en esta medida.
+# No hay un ack por frame, así que no se mide la latencia de cada uno.
+# Los frames enviados se graban al escribirse en el socket (no al encolarse):
+# los que salieron agrupados en un solo sendmsg se reproducen juntos.
+import argparse
+import json
+import socket
+import sys
+import os
+import threading
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.framer import read_capture, DIRECCION_RECIBIDO, DIRECCION_ENVIADO
+# --- FIN: Hack para importar 'common' ---
+
+def load_sessions(path, direction, peer_filter):
+    """Agrupa los frames de la captura por peer: {peer_id: [(timestamp, frame), ...]}."""
+    sessions = {}
+    for rec_direction, timestamp, peer_id, frame_bytes in read_capture(path):
+        if rec_direction != direction or peer_filter not in peer_id:
+            continue
+        sessions.setdefault(peer_id, []).append((timestamp, frame_bytes))
+    return sessions
+
+def _drain(sock, closed_at):
+    """
+    Descarta lo que responda el servidor (precios, heartbeats) para no
+    bloquearlo, y anota en 'closed_at' cuándo cerró la conexión.
+    """
+    try:
+        while sock.recv(65536):
+            pass
+        closed_at.append(time.perf_counter())
+    except OSError:
+        pass
+
+def replay_session(host, port, frames, start_time, t0, speed, stats):
+    """Reenvía los frames de un peer por su propia conexión, respetando los tiempos."""
+    sock = socket.create_connection((host, port))
+    closed_at = []
+    drain_thread = threading.Thread(target=_drain, args=(sock, closed_at), daemon=True)
+    drain_thread.start()
+    lags = []
+    send_times = []
+    sent_bytes = 0
+    for timestamp, frame_bytes in frames:
+        if speed > 0:
+            scheduled = start_time + (timestamp - t0) / speed
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            lags.append(time.perf_counter() - scheduled)
+        before = time.perf_counter()
+        sock.sendall(frame_bytes)
+        send_times.append(time.perf_counter() - before)
+        sent_bytes += len(frame_bytes)
+    # Cerrar solo la escritura y esperar a que el servidor cierre: si se cierra
+    # con respuestas sin leer, el kernel envía RST y el servidor puede perder
+    # frames que aún no procesaba.
+    last_sent = time.perf_counter()
+    sock.shutdown(socket.SHUT_WR)
+    drain_thread.join(timeout=10)
+    sock.close()
+    with stats["lock"]:
+        if closed_at:
+            stats["drain_times"].append(closed_at[0] - last_sent)
+        stats["lags"].extend(lags)
+        stats["send_times"].extend(send_times)
+        stats["bytes"] += sent_bytes
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce una captura de tráfico.")
+    parser.add_argument("captura")
+    parser.add_argument("host")
+    parser.add_argument("puerto", type=int)
+    parser.add_argument("--velocidad", type=float, default=1.0)
+    parser.add_argument("--direccion", choices=["recibidos", "enviados"], default="recibidos")
+    parser.add_argument("--peer", default="")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    direction = DIRECCION_RECIBIDO if args.direccion == "recibidos" else DIRECCION_ENVIADO
+    sessions = load_sessions(args.captura, direction, args.peer)
+    total_frames = sum(len(frames) for frames in sessions.values())
+    if not total_frames:
+        print("La captura no tiene frames para reproducir con esos filtros.")
+        sys.exit(1)
+    t0 = min(frames[0][0] for frames in sessions.values())
+    t_end = max(frames[-1][0] for frames in sessions.values())
+
+    if not args.json:
+        print(f"Reproduciendo {total_frames} frames de {len(sessions)} peers "
+              f"({t_end - t0:.1f}s capturados) a velocidad {args.velocidad or 'máxima'}...")
+
+    stats = {"lock": threading.Lock(), "lags": [], "send_times": [], "drain_times": [], "bytes": 0}
+    wall_start = time.perf_counter()
+    start_time = wall_start + 0.1 # Margen para abrir todas las conexiones
+    threads = [
+        threading.Thread(
+            target=replay_session,
+            args=(args.host, args.puerto, frames, start_time, t0, args.velocidad, stats)
+        )
+        for frames in sessions.values()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - wall_start
+
+    summary = {
+        "frames": total_frames,
+        "peers": len(sessions),
+        "segundos": round(elapsed, 3),
+        "frames_por_segundo": round(total_frames / elapsed, 1),
+        "bytes_por_segundo": round(stats["bytes"] / elapsed, 1),
+        "envio_p50_ms": round(_percentile(stats["send_times"], 50) * 1000, 3),
+        "envio_p99_ms": round(_percentile(stats["send_times"], 99) * 1000, 3),
+        "retraso_p50_ms": round(_percentile(stats["lags"], 50) * 1000, 3),
+        "retraso_p99_ms": round(_percentile(stats["lags"], 99) * 1000, 3),
+        "retraso_max_ms": round(max(stats["lags"], default=0) * 1000, 3),
+        "vaciado_p50_ms": round(_percentile(stats["drain_times"], 50) * 1000, 3),
+        "vaciado_max_ms": round(max(stats["drain_times"], default=0) * 1000, 3),
+    }
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        # Si el "retraso" o el "vaciado" crecen con la velocidad, el servidor
+        # no da abasto a ese ritmo.
+        for key, value in summary.items():
+            print(f"  {key}: {value}")
+
+if __name__ == "__main__":
+    main()
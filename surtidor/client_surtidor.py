@@ -10,20 +10,47 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 sys.path.append(project_root)
 
-from common.framer import frame_message, receive_message
+from common.framer import frame_message, receive_message, send_frame, set_nodelay
+from common.reconnect import ReconnectPolicy
+from common.heartbeat import HEARTBEAT_INTERVAL, READ_TIMEOUT, ESTADO_ALIVE
+from common.prices import PriceSnapshot
+from common.price_board import PriceBoard
+from common.profiling import ProfilingControl, install_signal_handlers
+from common.tracing import add_hop, hop_times, SALTO_SURTIDOR_RECIBE, SALTO_SURTIDOR_APLICA
+from common.multicast import MulticastReceiver, MULTICAST_CAPABILITY, LATIDO
 from common.messages import (
     serialize, deserialize, 
-    PrecioLocalUpdateMessage, TransaccionReportMessage, HeartbeatMessage
+    PrecioLocalUpdateMessage, TransaccionReportMessage, HeartbeatMessage, PerfilMessage,
+    SlowDownMessage, PrecioAplicadoMessage, MulticastAltaMessage, NackMessage,
+    HojaPreciosLocalMessage
 )
 # --- FIN: Hack para importar 'common' ---
 
 # --- Configuración del Surtidor ---
 DISTRIBUIDOR_HOST = os.environ.get('DISTRIBUIDOR_HOST', '127.0.0.1')
-RECONNECT_DELAY = 3
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
 COMBUSTIBLES = ["93", "95", "97", "Diesel", "Kerosene"]
+# Combustibles que despacha este surtidor, separados por coma (por defecto todos).
+# El Distribuidor solo le envía los precios de estos.
+SURTIDOR_COMBUSTIBLES = [
+    comb.strip() for comb in os.environ.get('SURTIDOR_COMBUSTIBLES', ','.join(COMBUSTIBLES)).split(',')
+    if comb.strip()
+]
+# Grupo de estación del surtidor (para precios por grupo). Los de un gateway usan el ID del gateway.
+SURTIDOR_GRUPO = os.environ.get('SURTIDOR_GRUPO', '') or None
+# Rango (segundos) de la duración simulada de una carga
+DURACION_CARGA = (3, 8)
+# Nombre del tablero de precios en memoria compartida (ver surtidor/price_board_updater.py).
+# Si se define, los precios se leen del tablero en vez de los mensajes del Distribuidor.
+TABLERO_PRECIOS = os.environ.get('TABLERO_PRECIOS', '')
+# '1' = ofrecer recibir los precios generales por multicast (si el Distribuidor lo tiene)
+RECIBIR_MULTICAST = os.environ.get('RECIBIR_MULTICAST', '0') == '1'
+# Segundos sin datagramas (ni latidos) tras los cuales se vuelve a recibir por TCP
+SILENCIO_MULTICAST = 5 * LATIDO
 
 class SurtidorClient:
-    def __init__(self, id, distrib_port):
+    def __init__(self, id, distrib_port, price_board: PriceBoard | None = None):
         self.id = id
         self.distrib_host = DISTRIBUIDOR_HOST
         self.distrib_port = distrib_port
@@ -32,12 +59,32 @@ class SurtidorClient:
         self.socket_to_distrib = None
         self.lock_socket = threading.Lock() # Lock para el socket
         self.is_connected = threading.Event() # Flag para saber el estado
+        self.reconnect_policy = ReconnectPolicy(RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY)
+        self.profiling = ProfilingControl(f"surtidor-{self.id}")
         
         # --- Estado Operacional del Surtidor ---
-        self.local_prices = {} # Caché local de precios. Ej: {'95': 1650}
+        self.combustibles = SURTIDOR_COMBUSTIBLES
+        self.grupo = SURTIDOR_GRUPO
+        self.local_prices = PriceSnapshot() # Caché local de precios (inmutable). Ej: {'95': 1650}
+        # Tablero compartido con otros surtidores del host (lo escribe un solo proceso)
+        self.price_board = price_board
         self.is_operating = False # Flag para el bloqueo 
         self.pending_price_update = {} # Precios encolados 
-        self.lock_state = threading.Lock() # Lock para 'local_prices', 'is_operating' y 'pending'
+        self.staged_sheets = [] # Hojas de precios esperando su hora de vigencia
+        # Lock para 'is_operating', 'pending' y para reemplazar 'local_prices'.
+        # Nunca se envía nada por la red con este lock tomado.
+        self.lock_state = threading.Lock()
+        # Hasta cuándo (time.monotonic) el Distribuidor pidió no enviar reportes (SLOW_DOWN)
+        self.paused_until = 0.0
+        # --- Multicast de precios ---
+        # Con tablero compartido los precios no se leen de la conexión
+        self.offers_multicast = RECIBIR_MULTICAST and price_board is None
+        self.multicast_receiver = None
+        # Un mismo precio puede llegar por multicast y por TCP (reparación,
+        # o durante el alta): se aplica solo si su secuencia es más nueva
+        self.lock_seqs = threading.Lock()
+        self.price_seqs = {} # combustible -> secuencia del último precio aplicado
+        self.max_price_seq = 0
         
     def start(self):
         """Inicia los hilos de conexión y simulación."""
@@ -55,6 +102,13 @@ class SurtidorClient:
             daemon=True
         )
         simulation_thread.start()
+
+        # Hilo 3: Heartbeats periódicos para que el Distribuidor sepa que seguimos vivos
+        heartbeat_thread = threading.Thread(
+            target=self.run_heartbeats,
+            daemon=True
+        )
+        heartbeat_thread.start()
         
         print(f"⛽ Surtidor '{self.id}' iniciado. Intentando conectar a {self.distrib_host}:{self.distrib_port}...")
 
@@ -64,15 +118,19 @@ class SurtidorClient:
             try:
                 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 sock.connect((self.distrib_host, self.distrib_port))
+                sock.settimeout(READ_TIMEOUT) # Deadline de lectura
+                set_nodelay(sock)
                 
                 print(f"🔗 Conectado exitosamente al Distribuidor.")
                 
                 with self.lock_socket:
                     self.socket_to_distrib = sock
+                # Las secuencias son de la conexión anterior (el Distribuidor pudo reiniciar)
+                self._reset_price_seqs()
                 self.is_connected.set() # Pone el flag en "conectado"
                 
                 # Identificarse ante el Distribuidor
-                self.send_to_distrib(HeartbeatMessage(self.id, "online"))
+                self.send_to_distrib(self.online_heartbeat())
                 
                 # Iniciar bucle de escucha
                 self.listen_to_distrib(sock)
@@ -89,8 +147,9 @@ class SurtidorClient:
                         self.socket_to_distrib.close()
                     self.socket_to_distrib = None
                 
-                print(f"Desconectado del Distribuidor. Reintentando en {RECONNECT_DELAY} seg...")
-                time.sleep(RECONNECT_DELAY)
+                delay = self.reconnect_policy.next_delay()
+                print(f"Desconectado del Distribuidor. Reintentando en {delay:.1f} seg...")
+                time.sleep(delay)
 
     def listen_to_distrib(self, sock: socket.socket):
         """Bucle de recepción de mensajes desde el Distribuidor."""
@@ -100,25 +159,145 @@ class SurtidorClient:
                 if msg_bytes is None:
                     print("Distribuidor cerró la conexión.")
                     break # Rompe el bucle de escucha, lo que activará la reconexión
+                # Recién con un mensaje del Distribuidor la conexión cuenta como exitosa
+                self.reconnect_policy.reset()
                 
                 msg_obj = deserialize(msg_bytes)
                 
                 if isinstance(msg_obj, PrecioLocalUpdateMessage):
                     # --- Lógica de Actualización de Precio ---
-                    self.handle_price_update(msg_obj)
+                    # Con tablero compartido, los precios ya llegan por el tablero
+                    if self.price_board is None:
+                        self.on_price_message(msg_obj)
+
+                elif isinstance(msg_obj, HojaPreciosLocalMessage):
+                    if self.price_board is None:
+                        self.on_price_sheet(msg_obj)
+
+                elif isinstance(msg_obj, MulticastAltaMessage):
+                    self.handle_multicast_alta(msg_obj)
+
+                elif isinstance(msg_obj, SlowDownMessage):
+                    self.handle_slow_down(msg_obj)
+
+                elif isinstance(msg_obj, PerfilMessage):
+                    threading.Thread(
+                        target=self.profiling.handle, args=(msg_obj.accion,), daemon=True
+                    ).start()
                 
         except ConnectionError as e:
             print(f"Error de conexión escuchando a Distribuidor: {e}")
 
+    def online_heartbeat(self) -> HeartbeatMessage:
+        """Heartbeat con el que el surtidor se anuncia: qué precios necesita y su grupo."""
+        # Con tablero compartido los precios llegan por el tablero: no pide ninguno
+        combustibles = [] if self.price_board else self.combustibles
+        return HeartbeatMessage(
+            self.id, "online", capacidades=self.capabilities(), combustibles=combustibles, grupo=self.grupo
+        )
+
+    def capabilities(self) -> list:
+        return [MULTICAST_CAPABILITY] if self.offers_multicast else []
+
+    def run_heartbeats(self):
+        """Envía un heartbeat periódico mientras haya conexión."""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self.send_to_distrib(HeartbeatMessage(self.id, ESTADO_ALIVE))
+            self.check_multicast()
+
+    # --- Multicast de precios ---
+
+    def on_price_message(self, msg: PrecioLocalUpdateMessage):
+        """Precio del Distribuidor (por TCP o multicast): se aplica si no es repetido."""
+        if self._is_new_price(msg):
+            self.handle_price_update(msg)
+
+    def _is_new_price(self, msg: PrecioLocalUpdateMessage) -> bool:
+        with self.lock_seqs:
+            if msg.seq is None:
+                # Sin secuencia (caché, precio de grupo): es el vigente. Los
+                # multicast anteriores a él que lleguen tarde se descartan.
+                self.price_seqs[msg.combustible] = self.max_price_seq
+                return True
+            if msg.seq <= self.price_seqs.get(msg.combustible, 0):
+                return False
+            self.price_seqs[msg.combustible] = msg.seq
+            self.max_price_seq = max(self.max_price_seq, msg.seq)
+            return True
+
+    def on_price_sheet(self, msg: HojaPreciosLocalMessage):
+        """Hoja de precios del Distribuidor: es más nueva que los precios multicast ya recibidos."""
+        with self.lock_seqs:
+            for combustible in msg.precios:
+                self.price_seqs[combustible] = self.max_price_seq
+        self.handle_price_sheet(msg)
+
+    def _reset_price_seqs(self):
+        with self.lock_seqs:
+            self.price_seqs = {}
+            self.max_price_seq = 0
+
+    def handle_multicast_alta(self, msg: MulticastAltaMessage):
+        """El Distribuidor nos pasó a multicast: unirse al grupo desde su última secuencia."""
+        receiver = self.multicast_receiver
+        if receiver is None or receiver.address != msg.direccion:
+            if receiver:
+                receiver.close()
+            try:
+                receiver = MulticastReceiver(msg.direccion, self._on_multicast_datagram, self._on_multicast_gap)
+            except OSError as e:
+                print(f"No se pudo unir al multicast {msg.direccion}: {e}. Se siguen recibiendo precios por TCP.")
+                self._leave_multicast()
+                return
+            receiver.start()
+            self.multicast_receiver = receiver
+        receiver.accept(msg.emisor, msg.epoch, msg.ultimo_seq)
+        print(f"📡 Recibiendo precios por multicast ({msg.direccion}) desde la secuencia {msg.ultimo_seq + 1}.")
+
+    def _on_multicast_datagram(self, msg_bytes: bytes):
+        msg_obj = deserialize(msg_bytes)
+        if isinstance(msg_obj, PrecioLocalUpdateMessage):
+            self.on_price_message(msg_obj)
+
+    def _on_multicast_gap(self, desde, hasta):
+        """Se perdieron datagramas: se piden por TCP."""
+        print(f"🩹 Faltan precios multicast {desde}..{hasta}, pidiendo reenvío.")
+        self.send_to_distrib(NackMessage(self.id, desde, hasta))
+
+    def check_multicast(self):
+        """Si el multicast dejó de llegar (ni siquiera latidos), volver a TCP."""
+        receiver = self.multicast_receiver
+        if receiver and self.is_connected.is_set() and receiver.silent_for() > SILENCIO_MULTICAST:
+            print(f"📡 Sin multicast hace {receiver.silent_for():.0f} s. Volviendo a recibir precios por TCP.")
+            self._leave_multicast()
+
+    def _leave_multicast(self):
+        """Deja el multicast y se vuelve a anunciar sin la capacidad (el Distribuidor reenvía el caché)."""
+        self.offers_multicast = False
+        if self.multicast_receiver:
+            self.multicast_receiver.close()
+            self.multicast_receiver = None
+        self.send_to_distrib(self.online_heartbeat())
+
     def handle_price_update(self, msg: PrecioLocalUpdateMessage):
         """
         Aplica o encola una actualización de precio, respetando el 
         requisito de bloqueo operacional. [cite: 81, 58]
         """
         print(f"💸 Precio recibido: {msg.combustible} @ ${msg.precio_final}")
+        if msg.traza is not None:
+            # Copia propia: en un gateway el mismo mensaje llega a todos los surtidores
+            msg = PrecioLocalUpdateMessage(
+                msg.combustible, msg.precio_final, add_hop(msg.traza, SALTO_SURTIDOR_RECIBE), msg.seq, msg.version
+            )
         
+        confirmation = None
         with self.lock_state:
             combustible = msg.combustible
+            # Reemplaza su precio en las hojas en espera más viejas (un
+            # reenvío del caché no pisa una hoja más nueva)
+            self._supersede_staged({combustible}, msg.version)
             
             if self.is_operating:
                 # --- SURTIDOR OCUPADO: Encolar la actualización ---
@@ -126,33 +305,112 @@ class SurtidorClient:
                 self.pending_price_update[combustible] = msg
             else:
                 # --- SURTIDOR LIBRE: Aplicar inmediatamente ---
-                self._apply_price_update(msg)
+                confirmation = self._apply_price_update(msg)
+
+        if confirmation:
+            self.send_to_distrib(confirmation)
                 
-    def _apply_price_update(self, msg: PrecioLocalUpdateMessage):
-        """Función interna. Asume que el lock_state ya está adquirido."""
-        self.local_prices[msg.combustible] = msg.precio_final
+    def handle_price_sheet(self, msg: HojaPreciosLocalMessage):
+        """Deja la hoja en espera y la aplica completa a su hora de vigencia."""
+        delay = max(0.0, msg.vigencia_ms / 1000 - time.time())
+        print(f"🗓️ Hoja de precios recibida: {msg.precios}, vigente en {delay:.1f} s")
+        with self.lock_state:
+            if msg.version and any(sheet.version == msg.version for sheet in self.staged_sheets):
+                return # Reenvío de una hoja que ya está en espera
+            self._supersede_staged(set(msg.precios), msg.version)
+            self.staged_sheets.append(msg)
+        timer = threading.Timer(delay, self.apply_price_sheet, args=(msg,))
+        timer.daemon = True
+        timer.start()
+
+    def apply_price_sheet(self, msg: HojaPreciosLocalMessage):
+        """
+        Hora de vigencia: todos los precios de la hoja cambian a la vez. Si
+        hay una venta en curso se encolan y se aplican juntos al terminarla
+        (con el mismo lock_state tomado), así ninguna venta ve la hoja a medias.
+        """
+        with self.lock_state:
+            if msg in self.staged_sheets:
+                self.staged_sheets.remove(msg)
+            if not msg.precios:
+                return # Precios sueltos posteriores ya la reemplazaron
+            if self.is_operating:
+                print(f"   -> Surtidor ocupado. Encolando hoja de precios ({len(msg.precios)} precios).")
+                for combustible, precio in msg.precios.items():
+                    self.pending_price_update[combustible] = PrecioLocalUpdateMessage(combustible, precio, version=msg.version)
+                return
+            self.local_prices = self.local_prices.with_prices(msg.precios)
+            for combustible in msg.precios:
+                self.pending_price_update.pop(combustible, None)
+        print(f"   -> ¡HOJA DE PRECIOS APLICADA! {msg.precios}")
+
+    def _supersede_staged(self, combustibles, version=None):
+        """
+        Función interna. Asume que el lock_state ya está adquirido.
+        Quita 'combustibles' de las hojas en espera anteriores a 'version'
+        (sin versión, cuenta como la más nueva).
+        """
+        for sheet in self.staged_sheets:
+            if version and (sheet.version or 0) >= version:
+                continue
+            for combustible in combustibles:
+                sheet.precios.pop(combustible, None)
+
+    def handle_slow_down(self, msg: SlowDownMessage):
+        """El Distribuidor está atrasado con nuestros reportes: pausamos los envíos."""
+        print(f"🐢 Distribuidor pide pausa de {msg.espera_ms} ms antes del próximo reporte.")
+        self.paused_until = max(self.paused_until, time.monotonic() + msg.espera_ms / 1000)
+
+    def wait_if_paused(self):
+        """Espera a que termine la pausa pedida con SLOW_DOWN (si hay una)."""
+        wait = self.paused_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _apply_price_update(self, msg: PrecioLocalUpdateMessage, held=False):
+        """
+        Función interna. Asume que el lock_state ya está adquirido.
+        Si el precio traía traza, retorna la confirmación para la Matriz (se
+        envía después de soltar el lock). 'held' = esperó a que terminara una venta.
+        """
+        self.local_prices = self.local_prices.with_price(msg.combustible, msg.precio_final)
         print(f"   -> ¡PRECIO ACTUALIZADO! {msg.combustible} = ${msg.precio_final}")
         # Si estaba pendiente, lo quitamos de la cola
         if msg.combustible in self.pending_price_update:
             del self.pending_price_update[msg.combustible]
+        return self._price_confirmation(msg, held)
 
-    def send_to_distrib(self, msg_obj) -> bool:
-        """Función helper para enviar un mensaje al Distribuidor."""
+    def _price_confirmation(self, msg: PrecioLocalUpdateMessage, held=False):
+        if msg.traza is None:
+            return None
+        traza = add_hop(msg.traza, SALTO_SURTIDOR_APLICA)
+        times = hop_times(traza)
+        retenido = times[SALTO_SURTIDOR_APLICA] - times.get(SALTO_SURTIDOR_RECIBE, 0) if held else 0.0
+        return PrecioAplicadoMessage(self.id, msg.combustible, traza, retenido)
+
+    def send_to_distrib(self, msg_obj, channel=None) -> bool:
+        """
+        Función helper para enviar un mensaje al Distribuidor. 'channel' lo
+        usa el gateway de estación para indicar de qué surtidor es el mensaje.
+        """
         if not self.is_connected.is_set():
             # print("No conectado, no se puede enviar mensaje.")
             return False
             
         with self.lock_socket:
-            if self.socket_to_distrib:
-                try:
-                    msg_bytes = serialize(msg_obj)
-                    framed_msg = frame_message(msg_bytes)
-                    self.socket_to_distrib.sendall(framed_msg)
-                    return True
-                except Exception as e:
-                    print(f"Error al enviar a Distribuidor: {e}")
-                    return False
-        return False
+            sock = self.socket_to_distrib
+        if sock is None:
+            return False
+
+        # Fuera del lock: un uplink lento no bloquea a quien reemplaza el socket
+        try:
+            msg_bytes = serialize(msg_obj)
+            framed_msg = frame_message(msg_bytes, channel=channel)
+            send_frame(sock, framed_msg)
+            return True
+        except Exception as e:
+            print(f"Error al enviar a Distribuidor: {e}")
+            return False
 
     # --- Hilo de Simulación de Venta ---
 
@@ -172,14 +430,17 @@ class SurtidorClient:
         """
         
         # 1. Elegir un combustible al azar y ver si tenemos precio
-        combustible = random.choice(COMBUSTIBLES)
+        combustible = random.choice(self.combustibles)
         
         with self.lock_state:
-            if combustible not in self.local_prices:
+            # Con tablero, el precio se toma al iniciar la venta: si cambia
+            # durante la carga, se aplica recién en la venta siguiente.
+            prices = self.price_board.snapshot() if self.price_board else self.local_prices
+            if combustible not in prices:
                 print(f"Simulación: No hay precio para {combustible}. Venta cancelada.")
                 return
             
-            precio_actual = self.local_prices[combustible]
+            precio_actual = prices[combustible]
             
             # --- 2. INICIAR OPERACIÓN: Bloquear el surtidor ---
             print(f"--- VENTA INICIADA ({combustible}) ---")
@@ -192,36 +453,42 @@ class SurtidorClient:
             litros = round(random.uniform(5.0, 60.0), 2)
             total_clp = int(litros * precio_actual)
             print(f"   -> Cargando {litros}L de {combustible} por ${total_clp}...")
-            time.sleep(random.randint(3, 8)) # Simula el tiempo de carga
+            time.sleep(random.randint(*DURACION_CARGA)) # Simula el tiempo de carga
             
         except Exception as e:
             print(f"Error durante la simulación de venta: {e}")
 
         finally:
             # --- 4. FINALIZAR OPERACIÓN: Desbloquear el surtidor ---
+            confirmations = []
             with self.lock_state:
                 print(f"   -> [Surtidor '{self.id}' DESBLOQUEADO]")
                 self.is_operating = False
-                
-                # 5. Reportar la transacción al Distribuidor
-                report = TransaccionReportMessage(
-                    surtidor=self.id,
-                    tipo_combustible=combustible,
-                    litros=litros,
-                    cargas=1 # 1 venta = 1 carga [cite: 80]
-                )
-                self.send_to_distrib(report)
-                print(f"   -> Reporte de transacción enviado.")
-
-                # 6. Aplicar cualquier precio pendiente 
+
+                # 5. Aplicar cualquier precio pendiente 
                 if self.pending_price_update:
                     print(f"   -> Aplicando {len(self.pending_price_update)} actualizaciones pendientes...")
                     # Aplicamos todas las que estaban en cola
                     for comb in list(self.pending_price_update.keys()):
                         msg = self.pending_price_update[comb]
-                        self._apply_price_update(msg)
-                
-                print("--- VENTA FINALIZADA ---")
+                        confirmations.append(self._apply_price_update(msg, held=True))
+
+            for confirmation in confirmations:
+                if confirmation:
+                    self.send_to_distrib(confirmation)
+
+            # 6. Reportar la transacción al Distribuidor (fuera del lock: si el
+            #    uplink está lento, los precios que lleguen se siguen aplicando)
+            report = TransaccionReportMessage(
+                surtidor=self.id,
+                tipo_combustible=combustible,
+                litros=litros,
+                cargas=1 # 1 venta = 1 carga [cite: 80]
+            )
+            self.wait_if_paused()
+            self.send_to_distrib(report)
+            print(f"   -> Reporte de transacción enviado.")
+            print("--- VENTA FINALIZADA ---")
 
 # --- Punto de entrada del script ---
 if __name__ == "__main__":
@@ -233,7 +500,9 @@ if __name__ == "__main__":
     SURTIDOR_ID = sys.argv[1]
     DIST_PORT = int(sys.argv[2])
 
-    client = SurtidorClient(id=SURTIDOR_ID, distrib_port=DIST_PORT)
+    board = PriceBoard.attach(TABLERO_PRECIOS) if TABLERO_PRECIOS else None
+    client = SurtidorClient(id=SURTIDOR_ID, distrib_port=DIST_PORT, price_board=board)
+    install_signal_handlers(client.profiling)
     client.start()
     
     # Mantiene el hilo principal vivo
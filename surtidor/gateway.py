@@ -0,0 +1,113 @@
+# gateway de estación: varios surtidores sobre una sola conexión al distribuidor
+import threading
+import sys
+import os
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.profiling import install_signal_handlers
+from common.messages import HeartbeatMessage, PrecioLocalUpdateMessage, SlowDownMessage, HojaPreciosLocalMessage
+from surtidor.client_surtidor import SurtidorClient
+# --- FIN: Hack para importar 'common' ---
+
+class ChannelSurtidor(SurtidorClient):
+    """
+    Surtidor alojado en un gateway. No tiene conexión propia: sus mensajes
+    salen por la conexión del gateway marcados con su canal, y los precios
+    se los entrega el gateway.
+    """
+    def __init__(self, id, gateway, channel):
+        super().__init__(id, gateway.distrib_port)
+        self.gateway = gateway
+        self.channel = channel
+        self.is_connected = gateway.is_connected # Comparte el estado de la conexión
+        self.grupo = gateway.grupo # Los surtidores de la estación forman su grupo
+        self.offers_multicast = False # El multicast lo recibe el gateway
+
+    def start(self):
+        """Solo simula ventas; la conexión y los heartbeats son del gateway."""
+        threading.Thread(target=self.run_simulation, daemon=True).start()
+
+    def send_to_distrib(self, msg_obj, channel=None) -> bool:
+        return self.gateway.send_to_distrib(msg_obj, self.channel)
+
+class StationGateway(SurtidorClient):
+    """
+    Conecta todos los surtidores de una estación al distribuidor por un solo
+    socket. El distribuidor atiende una conexión (y un hilo) por estación en
+    vez de una por surtidor, y cada precio viaja una vez por estación: el
+    gateway lo reparte a sus surtidores localmente.
+    """
+    def __init__(self, id, distrib_port, surtidor_ids):
+        super().__init__(id, distrib_port)
+        self.grupo = self.grupo or id
+        # Canal 1..N para cada surtidor (los frames sin canal son del gateway)
+        self.pumps = [
+            ChannelSurtidor(surtidor_id, self, channel)
+            for channel, surtidor_id in enumerate(surtidor_ids, start=1)
+        ]
+
+    def start(self):
+        threading.Thread(target=self.run_client_connection, daemon=True).start()
+        threading.Thread(target=self.run_heartbeats, daemon=True).start()
+        for pump in self.pumps:
+            pump.start()
+        print(f"🏪 Gateway '{self.id}' iniciado con {len(self.pumps)} surtidores. "
+              f"Intentando conectar a {self.distrib_host}:{self.distrib_port}...")
+
+    def online_heartbeat(self) -> HeartbeatMessage:
+        """El gateway no despacha: sus precios los piden los surtidores de cada canal."""
+        return HeartbeatMessage(
+            self.id, "online", capacidades=self.capabilities(), combustibles=[], grupo=self.grupo
+        )
+
+    def listen_to_distrib(self, sock):
+        # Anunciar cada surtidor en su canal antes de empezar a escuchar
+        for pump in self.pumps:
+            self.send_to_distrib(pump.online_heartbeat(), pump.channel)
+        super().listen_to_distrib(sock)
+
+    def handle_price_update(self, msg: PrecioLocalUpdateMessage):
+        """Reparte el precio a los surtidores de la estación que venden ese combustible."""
+        for pump in self.pumps:
+            if msg.combustible in pump.combustibles:
+                pump.handle_price_update(msg)
+
+    def handle_price_sheet(self, msg: HojaPreciosLocalMessage):
+        """Cada surtidor recibe su copia de la hoja, solo con los combustibles que vende."""
+        for pump in self.pumps:
+            precios = {comb: precio for comb, precio in msg.precios.items() if comb in pump.combustibles}
+            if precios:
+                pump.handle_price_sheet(HojaPreciosLocalMessage(precios, msg.vigencia_ms, msg.version))
+
+    def handle_slow_down(self, msg: SlowDownMessage):
+        """La pausa es solo para el surtidor que la provocó."""
+        for pump in self.pumps:
+            if pump.id == msg.surtidor_id:
+                pump.handle_slow_down(msg)
+
+# --- Punto de entrada del script ---
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Uso: python gateway.py <ID_GATEWAY> <PUERTO_DISTRIBUIDOR> <ID_SURTIDOR> [<ID_SURTIDOR> ...]")
+        print("Ejemplo: python gateway.py Estacion-1 65433 S-1.1 S-1.2 S-1.3")
+        sys.exit(1)
+
+    GATEWAY_ID = sys.argv[1]
+    DIST_PORT = int(sys.argv[2])
+    SURTIDOR_IDS = sys.argv[3:]
+
+    gateway = StationGateway(GATEWAY_ID, DIST_PORT, SURTIDOR_IDS)
+    install_signal_handlers(gateway.profiling)
+    gateway.start()
+
+    # Mantiene el hilo principal vivo
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"Cerrando gateway {GATEWAY_ID}...")
@@ -0,0 +1,82 @@
+# proceso que mantiene el tablero de precios compartido de una estación
+#
+# Uso:
+#   python surtidor/price_board_updater.py <ID> <PUERTO_DISTRIBUIDOR> [NOMBRE_TABLERO]
+#
+# Luego, en el mismo host, cada surtidor lee los precios del tablero:
+#   TABLERO_PRECIOS=<NOMBRE_TABLERO> python surtidor/client_surtidor.py S-1.1 65433
+import threading
+import sys
+import os
+import time
+
+# --- INICIO: Hack para importar 'common' ---
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+sys.path.append(project_root)
+
+from common.price_board import PriceBoard, NOMBRE_TABLERO
+from common.messages import PrecioLocalUpdateMessage
+from common.tracing import add_hop, SALTO_SURTIDOR_RECIBE
+from surtidor.client_surtidor import SurtidorClient
+# --- FIN: Hack para importar 'common' ---
+
+class PriceBoardUpdater(SurtidorClient):
+    """
+    Se conecta al Distribuidor como un surtidor más, pero no vende: cada
+    precio que recibe lo publica en el tablero compartido. Es el único
+    proceso que escribe el tablero.
+    """
+    def __init__(self, id, distrib_port, board: PriceBoard):
+        super().__init__(id, distrib_port)
+        self.board = board
+
+    def start(self):
+        threading.Thread(target=self.run_client_connection, daemon=True).start()
+        threading.Thread(target=self.run_heartbeats, daemon=True).start()
+        print(f"📋 Actualizador de tablero '{self.id}' iniciado. "
+              f"Intentando conectar a {self.distrib_host}:{self.distrib_port}...")
+
+    def handle_price_update(self, msg: PrecioLocalUpdateMessage):
+        traza = add_hop(msg.traza, SALTO_SURTIDOR_RECIBE)
+        with self.lock_state:
+            self._supersede_staged({msg.combustible}, msg.version)
+        self.board.publish({msg.combustible: msg.precio_final})
+        print(f"📋 Tablero actualizado: {msg.combustible} = ${msg.precio_final}")
+        # Publicado en el tablero = aplicado (cada surtidor lo toma en su próxima venta)
+        confirmation = self._price_confirmation(PrecioLocalUpdateMessage(msg.combustible, msg.precio_final, traza))
+        if confirmation:
+            self.send_to_distrib(confirmation)
+
+    def apply_price_sheet(self, msg):
+        """Toda la hoja se publica en el tablero de una vez: los surtidores la ven completa o nada."""
+        with self.lock_state:
+            if msg in self.staged_sheets:
+                self.staged_sheets.remove(msg)
+            precios = dict(msg.precios)
+        if precios:
+            self.board.publish(precios)
+            print(f"📋 Tablero actualizado con hoja de precios: {precios}")
+
+# --- Punto de entrada del script ---
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("Uso: python price_board_updater.py <ID> <PUERTO_DISTRIBUIDOR> [NOMBRE_TABLERO]")
+        print("Ejemplo: python price_board_updater.py Tablero-1 65433 tablero_estacion_1")
+        sys.exit(1)
+
+    UPDATER_ID = sys.argv[1]
+    DIST_PORT = int(sys.argv[2])
+    BOARD_NAME = sys.argv[3] if len(sys.argv) == 4 else NOMBRE_TABLERO
+
+    board = PriceBoard.create(BOARD_NAME)
+    updater = PriceBoardUpdater(UPDATER_ID, DIST_PORT, board)
+    updater.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"Cerrando tablero {BOARD_NAME}...")
+    finally:
+        board.close()
@@ -0,0 +1,50 @@
+# IdleReaper: expiración de conexiones inactivas y reagendado en la rueda
+import threading
+import time
+import unittest
+
+from common.heartbeat import IdleReaper
+
+class IdleReaperTest(unittest.TestCase):
+    def setUp(self):
+        self.reaper = IdleReaper(timeout=0.3, tick=0.05, name="test")
+        self.expired = {} # key -> time.monotonic() al expirar
+        self.event = threading.Event()
+        self.reaper.start()
+
+    def on_expire(self, key):
+        self.expired[key] = time.monotonic()
+        self.event.set()
+
+    def test_conexion_inactiva_expira(self):
+        start = time.monotonic()
+        self.reaper.register("a", self.on_expire)
+        self.assertTrue(self.event.wait(2.0))
+        self.assertGreaterEqual(self.expired["a"] - start, 0.3)
+        self.assertEqual(len(self.reaper), 0)
+
+    def test_touch_reagenda_y_expira_al_dejar_de_tocar(self):
+        self.reaper.register("activa", self.on_expire)
+        self.reaper.register("inactiva", self.on_expire)
+        deadline = time.monotonic() + 0.8
+        while time.monotonic() < deadline:
+            last_touch = time.monotonic()
+            self.reaper.touch("activa")
+            time.sleep(0.05)
+        self.assertIn("inactiva", self.expired)
+        self.assertNotIn("activa", self.expired)
+
+        deadline = last_touch + 2.0
+        while "activa" not in self.expired and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertIn("activa", self.expired)
+        self.assertGreaterEqual(self.expired["activa"] - last_touch, 0.3)
+
+    def test_unregister_no_llama_al_callback(self):
+        self.reaper.register("a", self.on_expire)
+        self.reaper.unregister("a")
+        self.assertFalse(self.event.wait(0.6))
+        self.assertEqual(self.expired, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# multicast: detección de huecos en el receptor y reparación (NACK) desde el historial del emisor
+import socket
+import unittest
+from unittest import mock
+
+from common.multicast import MulticastSender, MulticastReceiver
+
+GRUPO = "239.255.10.9"
+
+def free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+class CapturingSocket:
+    """Reemplaza al socket UDP del emisor: guarda los datagramas en vez de enviarlos."""
+    def __init__(self):
+        self.datagrams = []
+
+    def sendto(self, datagram, address):
+        self.datagrams.append(datagram)
+
+class MulticastRepairTest(unittest.TestCase):
+    def setUp(self):
+        address = f"{GRUPO}:{free_udp_port()}"
+        self.sender = MulticastSender(address, "Dist-1")
+        self.sender.sock.close()
+        self.sender.sock = CapturingSocket()
+        self.delivered = []
+        self.gaps = []
+        # El hilo del receptor no se inicia: los datagramas se le entregan a mano
+        self.receiver = MulticastReceiver(address, self.delivered.append, lambda *gap: self.gaps.append(gap))
+        self.receiver.accept("Dist-1", self.sender.epoch, self.sender.last_seq)
+
+    def tearDown(self):
+        self.receiver.close()
+
+    def send(self, count):
+        for _ in range(count):
+            self.sender.send(lambda seq: f"precio {seq}".encode())
+        return self.sender.sock.datagrams[-count:]
+
+    def test_hueco_se_repara_con_el_historial(self):
+        datagrams = self.send(5)
+        for index in (0, 1, 3, 4): # Se pierde la secuencia 3
+            self.receiver._handle(datagrams[index])
+        self.assertEqual(self.gaps, [(3, 3)])
+        self.assertEqual(self.delivered, [b"precio 1", b"precio 2", b"precio 4", b"precio 5"])
+
+        messages, incomplete = self.sender.repair(*self.gaps[0])
+        self.assertEqual(messages, [b"precio 3"])
+        self.assertFalse(incomplete)
+
+    def test_duplicados_y_atrasados_se_descartan(self):
+        datagrams = self.send(3)
+        for index in (0, 2, 1, 2):
+            self.receiver._handle(datagrams[index])
+        self.assertEqual(self.delivered, [b"precio 1", b"precio 3"])
+        self.assertEqual(self.gaps, [(2, 2)]) # El 2 llega por la reparación TCP, no por multicast
+
+    def test_latido_revela_la_perdida_del_ultimo(self):
+        datagrams = self.send(2)
+        self.receiver._handle(datagrams[0])
+        self.sender.send_heartbeat()
+        self.receiver._handle(self.sender.sock.datagrams[-1])
+        self.assertEqual(self.gaps, [(2, 2)])
+        self.assertEqual(self.sender.repair(2, 2), ([b"precio 2"], False))
+
+    def test_otro_emisor_se_ignora(self):
+        other = MulticastSender(self.sender.address, "Dist-2")
+        other.sock.close()
+        other.sock = CapturingSocket()
+        other.send(lambda seq: b"ajeno")
+        self.receiver._handle(other.sock.datagrams[0])
+        self.assertEqual((self.delivered, self.gaps), ([], []))
+
+    def test_reparacion_fuera_del_historial_es_incompleta(self):
+        with mock.patch("common.multicast.HISTORIAL", 4):
+            self.send(10)
+        messages, incomplete = self.sender.repair(1, 10)
+        self.assertEqual(messages, [f"precio {seq}".encode() for seq in range(7, 11)])
+        self.assertTrue(incomplete) # El distribuidor reenvía entonces todo su caché
+        self.assertEqual(self.sender.repair(11, 20), ([], False))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# PriceBoard: los lectores nunca ven una escritura a medias (seqlock)
+import multiprocessing
+import os
+import time
+import unittest
+
+from common.price_board import PriceBoard, COMBUSTIBLES, SIN_PRECIO
+
+# Segundos que cada lector lee mientras el proceso principal escribe
+DURACION = 1.0
+
+def read_board(name, results):
+    """Lee el tablero (en otro proceso) y cuenta las lecturas inconsistentes."""
+    board = PriceBoard.attach(name, child_of_creator=True)
+    torn = 0
+    versions = set()
+    deadline = time.monotonic() + DURACION
+    while time.monotonic() < deadline:
+        version, values = board.read()
+        # Cada publish escribe el mismo precio en todos los combustibles, igual a su versión
+        expected = SIN_PRECIO if version == 0 else version
+        if any(value != expected for value in values):
+            torn += 1
+        versions.add(version)
+    board.close()
+    results.put((torn, len(versions)))
+
+class PriceBoardTest(unittest.TestCase):
+    def setUp(self):
+        self.name = f"tablero_test_{os.getpid()}"
+        self.board = PriceBoard.create(self.name)
+
+    def tearDown(self):
+        self.board.close()
+
+    def test_snapshot(self):
+        self.board.publish({"95": 1000, "Diesel": 800})
+        self.board.publish({"95": 1100, "GLP": 1})  # GLP no está en el tablero: se ignora
+        snapshot = self.board.snapshot()
+        self.assertEqual(snapshot.version, 2)
+        self.assertEqual(dict(snapshot.items()), {"95": 1100, "Diesel": 800})
+
+    def test_sin_lecturas_a_medias(self):
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        readers = [context.Process(target=read_board, args=(self.name, results)) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        version = 0
+        while any(reader.is_alive() for reader in readers):
+            version += 1
+            self.board.publish({combustible: version for combustible in COMBUSTIBLES})
+        for reader in readers:
+            reader.join()
+            torn, versions_seen = results.get(timeout=5)
+            self.assertEqual(torn, 0)
+            self.assertGreater(versions_seen, 1) # Leyó mientras se escribía
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# catálogo de precios: reanudar desde una versión y catálogo completo en el distribuidor
+import os
+import tempfile
+import time
+import unittest
+
+from matriz.price_catalog import PriceCatalog
+from distribuidor.server_distrib import DistribuidorServer, UTILIDAD_FACTOR
+
+class TempDirTest(unittest.TestCase):
+    """Corre cada prueba en un directorio temporal (las BDs usan rutas relativas)."""
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.makedirs("matriz")
+        os.makedirs("distribuidor")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+class PriceCatalogTest(TempDirTest):
+    def test_since_retorna_solo_lo_posterior_en_orden(self):
+        catalog = PriceCatalog("matriz/catalogo.sqlite", log=self.fail)
+        self.assertEqual(catalog.add("95", 1000), 1)
+        self.assertEqual(catalog.add("93", 900), 2)
+        self.assertEqual(catalog.add_sheet({"97": 1100, "Diesel": 700}, vigencia_ms=123), 3)
+        current, entries = catalog.since(1)
+        self.assertEqual(current, 3)
+        self.assertEqual(entries[0], [2, "93", 900, None, 0])
+        # Los precios de una hoja comparten versión: entre ellos no hay orden
+        self.assertCountEqual(entries[1:], [[3, "97", 1100, None, 123], [3, "Diesel", 700, None, 123]])
+        self.assertEqual(catalog.since(3), (3, []))
+
+    def test_precio_general_reemplaza_los_de_grupo(self):
+        catalog = PriceCatalog("matriz/catalogo.sqlite", log=self.fail)
+        catalog.add("95", 1000, grupo="G")
+        catalog.add("95", 1200)
+        self.assertEqual(catalog.since(0), (2, [[2, "95", 1200, None, 0]]))
+
+class CatalogoCompletoTest(TempDirTest):
+    def setUp(self):
+        super().setUp()
+        self.server = DistribuidorServer("Dist-T", "127.0.0.1", 0)
+
+    def final(self, precio_base):
+        return int(precio_base * UTILIDAD_FACTOR)
+
+    def test_reanudar_aplica_solo_lo_nuevo(self):
+        self.server._apply_matriz_catalog([[1, "95", 1000, None, 0], [2, "93", 900, "G", 0]])
+        self.server._apply_matriz_catalog([[3, "95", 1200, None, 0]])
+        self.assertEqual(dict(self.server.current_prices.items()), {"95": self.final(1200)})
+        self.assertEqual(self.server.group_prices, {"G": {"93": self.final(900)}})
+        self.assertEqual(self.server.matriz_price_version, 3)
+
+    def test_catalogo_completo_descarta_los_precios_anteriores(self):
+        self.server._apply_matriz_catalog([[1, "95", 1000, None, 0], [2, "93", 900, "G", 0]])
+        self.server._apply_matriz_sheet({"Diesel": 700}, int((time.time() + 60) * 1000), None, 3)
+        self.assertEqual(len(self.server.staged_sheets), 1)
+
+        # La Matriz empezó un catálogo nuevo: llega entero, con versiones más bajas
+        self.server._reset_price_state()
+        self.server._apply_matriz_catalog([[1, "97", 1100, None, 0]])
+
+        self.assertEqual(dict(self.server.current_prices.items()), {"97": self.final(1100)})
+        self.assertEqual(self.server.group_prices, {})
+        self.assertEqual(self.server.staged_sheets, [])
+        self.assertEqual(self.server.matriz_price_version, 1)
+        # Al reiniciar (carga la BD local), tampoco vuelven los del catálogo anterior
+        restarted = DistribuidorServer("Dist-T", "127.0.0.1", 0)
+        self.assertEqual(dict(restarted.current_prices.items()), {"97": self.final(1100)})
+        self.assertEqual(restarted.group_prices, {})
+        self.assertEqual(restarted.staged_sheets, [])
+
+    def test_catalogo_atrasado_no_pisa_un_precio_mas_nuevo(self):
+        self.server._apply_matriz_price("95", 1200, None, 8)
+        self.server._apply_matriz_catalog([[7, "95", 1000, None, 0], [7, "93", 900, None, 0]])
+        self.assertEqual(dict(self.server.current_prices.items()), {"95": self.final(1200), "93": self.final(900)})
+        self.assertEqual(self.server.matriz_price_version, 8)
+
+if __name__ == "__main__":
+    unittest.main()
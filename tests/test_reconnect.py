@@ -0,0 +1,56 @@
+# ReconnectPolicy y sync_start_delay: cotas del backoff y del jitter
+import random
+import unittest
+
+from common.reconnect import ReconnectPolicy, sync_start_delay
+
+class ReconnectPolicyTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+
+    def test_primer_intento_inmediato_y_despues_backoff_con_tope(self):
+        policy = ReconnectPolicy(base_delay=0.5, max_delay=4.0)
+        self.assertEqual(policy.next_delay(), 0.0)
+        for attempt in range(10):
+            ceiling = min(4.0, 0.5 * 2 ** attempt)
+            delay = policy.next_delay()
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, ceiling)
+
+    def test_sin_intento_inmediato(self):
+        policy = ReconnectPolicy(base_delay=1.0, max_delay=30.0, immediate_first=False)
+        self.assertLessEqual(policy.next_delay(), 1.0)
+        self.assertLessEqual(policy.next_delay(), 2.0)
+
+    def test_reset_vuelve_al_intento_inmediato(self):
+        policy = ReconnectPolicy()
+        for _ in range(5):
+            policy.next_delay()
+        policy.reset()
+        self.assertEqual(policy.next_delay(), 0.0)
+
+    def test_jitter_reparte_los_clientes_en_toda_la_ventana(self):
+        """Clientes en el mismo intento no esperan lo mismo: cubren [0, tope]."""
+        delays = []
+        for _ in range(1000):
+            policy = ReconnectPolicy(base_delay=0.5, max_delay=30.0)
+            for _ in range(4):
+                delay = policy.next_delay()
+            delays.append(delay) # Cuarto intento: tope 0.5 * 2^2 = 2 s
+        self.assertLessEqual(max(delays), 2.0)
+        self.assertGreater(max(delays), 1.8)
+        self.assertLess(min(delays), 0.2)
+        self.assertGreater(len(set(delays)), 990)
+
+class SyncStartDelayTest(unittest.TestCase):
+    def test_sin_backlog_no_espera(self):
+        self.assertEqual(sync_start_delay(0), 0.0)
+
+    def test_ventana_crece_con_el_backlog_y_tiene_tope(self):
+        random.seed(2)
+        for _ in range(200):
+            self.assertLessEqual(sync_start_delay(100, per_item=0.01), 1.0)
+            self.assertLessEqual(sync_start_delay(10**6, per_item=0.01, max_delay=5.0), 5.0)
+
+if __name__ == "__main__":
+    unittest.main()
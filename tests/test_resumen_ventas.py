@@ -0,0 +1,83 @@
+# RESUMEN_VENTAS: reenviar un resumen (ej: tras reconectar) no suma dos veces
+import os
+import tempfile
+import time
+import unittest
+
+from matriz.replica import ReportReplica
+from matriz.storage import SQLiteStorage, LogStorage
+
+INTERVALO = 1_700_000_000_000
+DURACION = 60_000
+
+def summary(surtidor, combustible, litros, cargas, intervalo=INTERVALO):
+    return ("Dist-1", intervalo, DURACION, surtidor, combustible, litros, cargas)
+
+class ResumenVentasTest:
+    """Pruebas comunes a los dos almacenamientos (las subclases crean 'storage')."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.messages = [] # Lo que loguea el almacenamiento
+        self.storage = self.create_storage()
+        self.storage.init()
+        self.replica = ReportReplica()
+        self.replica.load(self.storage.fetch_reports())
+        self.replica.start()
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+        self.assertEqual([msg for msg in self.messages if "Error" in msg], [])
+
+    def insert(self, tx_rows, summary_rows):
+        """Como MatrizServer._insert_rows: guarda y publica el cambio a la réplica."""
+        replaced = self.storage.insert_rows(tx_rows, summary_rows)
+        self.assertIsNotNone(replaced)
+        self.replica.publish((time.time(), tx_rows, summary_rows, replaced))
+        return replaced
+
+    def assertReports(self, by_fuel, by_dist):
+        for reports in (self.storage.fetch_reports(), self.replica.fetch_reports()):
+            report_comb, report_dist = reports
+            self.assertEqual({comb: (litros, cargas) for comb, litros, cargas in report_comb}, by_fuel)
+            self.assertEqual({dist: (litros, cargas) for dist, litros, cargas in report_dist}, by_dist)
+
+    def test_reenviar_el_mismo_resumen_no_duplica(self):
+        rows = [summary("S-1", "95", 10.0, 2), summary("S-1", "93", 5.0, 1)]
+        self.assertEqual(self.insert([], rows), [])
+        replaced = self.insert([], rows)
+        self.assertCountEqual(replaced, [("Dist-1", "95", 10.0, 2), ("Dist-1", "93", 5.0, 1)])
+        self.assertTrue(self.replica.wait_applied(2.0))
+        self.assertReports({"95": (10.0, 2), "93": (5.0, 1)}, {"Dist-1": (15.0, 3)})
+
+    def test_resumen_corregido_reemplaza_al_anterior(self):
+        self.insert([], [summary("S-1", "95", 10.0, 2)])
+        self.insert([(int(time.time() * 1000), "Dist-1", "S-2", "95", 1.0, 1)], [])
+        self.insert([], [summary("S-1", "95", 12.0, 3)]) # Mismo intervalo, con una venta más
+        self.insert([], [summary("S-1", "95", 4.0, 1, intervalo=INTERVALO + DURACION)])
+        self.assertTrue(self.replica.wait_applied(2.0))
+        self.assertReports({"95": (17.0, 5)}, {"Dist-1": (17.0, 5)})
+
+class SQLiteResumenVentasTest(ResumenVentasTest, unittest.TestCase):
+    def create_storage(self):
+        return SQLiteStorage(os.path.join(self.tmp.name, "matriz.sqlite"), log=self.messages.append)
+
+class LogResumenVentasTest(ResumenVentasTest, unittest.TestCase):
+    def create_storage(self):
+        return LogStorage(os.path.join(self.tmp.name, "log"), log=self.messages.append, segment_size=1024 * 1024)
+
+    def test_reproducir_el_log_no_duplica(self):
+        rows = [summary("S-1", "95", 10.0, 2)]
+        self.insert([], rows)
+        self.insert([], rows)
+        self.storage.close()
+        # Al reabrir se reproduce el log (desde el checkpoint que dejó close())
+        self.storage = self.create_storage()
+        self.storage.init()
+        self.storage.insert_rows([], rows)
+        report_comb, report_dist = self.storage.fetch_reports()
+        self.assertEqual(report_comb, [("95", 10.0, 2)])
+        self.assertEqual(report_dist, [("Dist-1", 10.0, 2)])
+
+if __name__ == "__main__":
+    unittest.main()